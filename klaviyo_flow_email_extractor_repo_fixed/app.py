@@ -12,11 +12,132 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
 
 # Import utility functions
-from klaviyo_api import (
-    klaviyo_api_request, get_flows, get_flow_actions, 
-    get_email_content, get_flow_metrics, get_message_metrics
+from klaviyo_api import get_client, get_email_content, get_flow_metrics
+from html_utils import (
+    DEFAULT_ANALYSIS_CACHE_PATH, analyze_template, configure_analysis_cache, get_analysis_cache,
+    extract_and_render_html
 )
-from html_utils import extract_and_render_html, analyze_html_structure, check_email_compatibility
+from api_cache import account_hash, get_default_cache
+from report_manifest import get_default_manifest
+from bulk import DEFAULT_WORKERS, DEFAULT_ANALYSIS_WORKERS
+from checkpoint import JOB_ID_PATTERN
+from archive import COMPRESSION_LEVELS, DEFAULT_COMPRESSION, safe_name
+from jobs import get_job_manager, submit_export, submit_report, submit_sync
+from instrumentation import get_instrumentation
+from profiling import ProfileSession
+from catalog import FlowCatalog
+from search_index import DEFAULT_LIMIT, SEARCH_FIELDS, get_default_search_index
+from report_table import COLUMNAR_FORMATS, columnar_available, columnar_bytes, flow_summary, issue_summary, issues_by_flow, report_csv, report_frame, report_totals
+
+# Persist template analyses across sessions, keyed by content hash
+if get_analysis_cache().path is None:
+    configure_analysis_cache(DEFAULT_ANALYSIS_CACHE_PATH)
+
+# st.download_button holds the whole file in server memory, and Streamlit
+# rejects messages above server.maxMessageSize (200 MB by default)
+MAX_DOWNLOAD_BYTES = 200 * 2**20
+
+def render_diagnostics(panel):
+    # Counters are process-wide (every session since the last reset) and are
+    # drawn at the end of the run so they include this page's own requests
+    import pandas as pd
+    instrumentation = get_instrumentation()
+    snapshot = instrumentation.snapshot()
+    totals = snapshot["totals"]
+    with panel.container():
+        with st.expander("Diagnostics"):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.metric("API calls", totals["calls"])
+                st.metric("429 responses", totals["throttled"])
+            with col2:
+                st.metric("Cache hit rate", f"{totals['cache_hits'] / totals['calls']:.0%}" if totals["calls"] else "-")
+                st.metric("Retries", totals["retries"])
+            st.caption(f"{totals['attempts']} HTTP requests, {totals['bytes'] / 2**20:.1f} MB received, {totals['errors']} failed calls")
+            
+            # Where the time went: on the wire, held back by rate limiting, or parsing locally
+            st.dataframe(pd.DataFrame([
+                {"Stage": "Network", "Seconds": round(totals["network_seconds"], 2)},
+                {"Stage": "Rate limit / backoff wait", "Seconds": round(totals["wait_seconds"], 2)},
+                *[
+                    {"Stage": stage.replace("_", " ").capitalize(), "Seconds": round(seconds, 2)}
+                    for stage, seconds in sorted(totals["stage_seconds"].items())
+                ]
+            ]), use_container_width=True, hide_index=True)
+            
+            if snapshot["endpoints"]:
+                st.dataframe(pd.DataFrame([
+                    {
+                        "Endpoint": label,
+                        "Calls": stats["calls"],
+                        "Cache hits": stats["cache_hits"],
+                        "429s": stats["throttled"],
+                        "p50 (ms)": stats["latency"]["p50"] * 1000,
+                        "p95 (ms)": stats["latency"]["p95"] * 1000,
+                        "KB": round(stats["bytes"] / 1024, 1)
+                    }
+                    for label, stats in snapshot["endpoints"].items()
+                ]), use_container_width=True, hide_index=True)
+                st.caption("Latency percentiles are histogram bucket upper bounds.")
+            
+            st.download_button(
+                label="Download JSON snapshot",
+                data=instrumentation.to_json(),
+                file_name="flow_extractor_metrics.json",
+                mime="application/json"
+            )
+            st.download_button(
+                label="Download Prometheus metrics",
+                data=instrumentation.to_prometheus(),
+                file_name="flow_extractor_metrics.prom",
+                mime="text/plain"
+            )
+            if st.button("Reset counters"):
+                instrumentation.reset()
+                st.rerun()
+
+def render_profile(session, title, key):
+    import pandas as pd
+    with st.expander(f"{title} ({session.elapsed():.2f}s)"):
+        if session.profiler_error:
+            st.info(f"No CPU profile, only spans: another profiler was active ({session.profiler_error}).")
+        else:
+            st.markdown("**Hot functions** (ranked by time spent in the function itself)")
+            st.dataframe(pd.DataFrame(session.hot_functions()), use_container_width=True, hide_index=True)
+        st.markdown("**Spans** (API calls, parsing and archive writing, including worker threads)")
+        st.dataframe(pd.DataFrame(session.span_table()), use_container_width=True, hide_index=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                label="Download profile (.prof)",
+                data=session.pstats_bytes(),
+                file_name=f"{key}.prof",
+                mime="application/octet-stream",
+                key=f"{key}_prof"
+            )
+        with col2:
+            st.download_button(
+                label="Download flame graph (.folded)",
+                data=session.folded_stacks(),
+                file_name=f"{key}.folded",
+                mime="text/plain",
+                key=f"{key}_folded"
+            )
+        st.caption("Open the .prof file with snakeviz or pstats, and the .folded span stacks with speedscope or flamegraph.pl.")
+
+def get_catalog():
+    # One flow catalog per session, rebuilt when the key changes or it goes stale
+    catalog = st.session_state.get("flow_catalog")
+    if catalog is None or catalog.api_key is not st.session_state.klaviyo_client or catalog.stale():
+        catalog = st.session_state.flow_catalog = FlowCatalog.fetch(st.session_state.klaviyo_client)
+    return catalog
+
+def finish_page(diagnostics_panel):
+    page_profile = st.session_state.get("page_profile")
+    if page_profile is not None:
+        page_profile.stop()
+        render_profile(page_profile, "Page profile", "page_profile")
+    render_diagnostics(diagnostics_panel)
 
 # Set page configuration
 st.set_page_config(
@@ -26,6 +147,12 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Profile this run when "Profile page runs" is on; a run cut short by a
+# rerun is stopped here before the next one starts
+if st.session_state.get("page_profile") is not None:
+    st.session_state.page_profile.stop()
+st.session_state.page_profile = ProfileSession("page").start() if st.session_state.get("profile_pages") else None
+
 # Main Header
 st.title("Klaviyo Flow Email HTML Extractor")
 st.markdown("""
@@ -53,11 +180,15 @@ with st.sidebar:
     if api_key != st.session_state.api_key:
         st.session_state.api_key = api_key
     
+    # Keep one pooled client per session, replacing it only when the key changes
+    client = st.session_state.get('klaviyo_client')
+    if client is None or client.api_key != api_key:
+        st.session_state.klaviyo_client = get_client(api_key, cache=get_default_cache()) if api_key else None
+    
     # Display connection status
     if api_key:
         try:
-            test_response = get_flows(api_key, {"page[size]": 1})
-            if test_response and "data" in test_response:
+            if st.session_state.klaviyo_client.verify():
                 st.success("✅ Connected to Klaviyo")
                 st.session_state.is_authenticated = True
             else:
@@ -70,6 +201,12 @@ with st.sidebar:
         st.warning("⚠️ Please enter your Klaviyo API key")
         st.session_state.is_authenticated = False
     
+    # Responses are cached on disk between reruns; allow forcing a refetch
+    if api_key and st.button("Clear cached Klaviyo data"):
+        get_default_cache().clear(api_key)
+        st.session_state.pop("flow_catalog", None)
+        st.rerun()
+    
     # Navigation
     st.sidebar.markdown("---")
     st.sidebar.header("Navigation")
@@ -82,11 +219,22 @@ with st.sidebar:
                 "Flow Browser",
                 "Email Extractor",
                 "Template Analysis",
-                "Bulk Operations"
+                "Bulk Operations",
+                "Search"
             ]
         )
     else:
         navigation = "Welcome"
+    
+    st.sidebar.markdown("---")
+    st.checkbox(
+        "Profile page runs",
+        key="profile_pages",
+        help="Profile every run of the page (from the sidebar connection check to the last chart) and show the hot functions below it."
+    )
+    
+    # Filled in once the page has run
+    diagnostics_panel = st.empty()
 
 # Main content based on navigation
 if navigation == "Welcome" or not st.session_state.get('is_authenticated', False):
@@ -101,6 +249,7 @@ if navigation == "Welcome" or not st.session_state.get('is_authenticated', False
     * **Email Extractor**: Extract HTML content from flow emails
     * **Template Analysis**: Analyze email templates for best practices
     * **Bulk Operations**: Perform operations on multiple emails or flows
+    * **Search**: Find the flow emails that contain a link, coupon code or phrase
     
     ### Getting your Klaviyo API Key
     
@@ -120,30 +269,11 @@ elif navigation == "Flow Browser":
     
     # Get all flows
     with st.spinner("Loading flows..."):
-        flows_data = get_flows(st.session_state.api_key)
+        catalog = get_catalog()
     
-    if flows_data and "data" in flows_data:
-        # Create a dataframe of flows
-        flow_list = []
-        
-        for flow in flows_data["data"]:
-            if flow.get("type") == "flow":
-                flow_id = flow.get("id")
-                attributes = flow.get("attributes", {})
-                
-                flow_info = {
-                    "ID": flow_id,
-                    "Name": attributes.get("name", "Unnamed Flow"),
-                    "Status": attributes.get("status", "Unknown"),
-                    "Created": attributes.get("created", "Unknown"),
-                    "Updated": attributes.get("updated", "Unknown"),
-                    "Trigger Type": attributes.get("trigger_type", "Unknown")
-                }
-                
-                flow_list.append(flow_info)
-        
+    if catalog:
         import pandas as pd
-        flows_df = pd.DataFrame(flow_list)
+        flows_df = pd.DataFrame(catalog.rows)
         
         # Display the flows
         st.dataframe(flows_df, use_container_width=True)
@@ -153,48 +283,28 @@ elif navigation == "Flow Browser":
         
         selected_flow_id = st.selectbox(
             "Select a flow to view details:",
-            options=flows_df["ID"].tolist(),
-            format_func=lambda x: flows_df[flows_df["ID"] == x]["Name"].iloc[0]
+            options=catalog.ids(),
+            format_func=catalog.label
         )
         
         if selected_flow_id:
             with st.spinner("Loading flow details..."):
                 # Get flow actions
-                flow_actions = get_flow_actions(selected_flow_id, st.session_state.api_key)
+                action_rows = catalog.action_rows(selected_flow_id)
                 
                 # Get flow metrics
                 try:
-                    flow_metrics = get_flow_metrics(selected_flow_id, st.session_state.api_key)
+                    flow_metrics = get_flow_metrics(selected_flow_id, st.session_state.klaviyo_client)
                 except Exception:
                     flow_metrics = None
                 
                 # Display flow details
-                flow_name = flows_df[flows_df["ID"] == selected_flow_id]["Name"].iloc[0]
-                st.subheader(f"Flow: {flow_name}")
+                st.subheader(f"Flow: {catalog.name(selected_flow_id)}")
                 
                 # Display flow actions in an expandable section
-                if flow_actions:
+                if action_rows:
                     with st.expander("Flow Actions", expanded=True):
-                        # Create DataFrame of actions
-                        action_list = []
-                        
-                        for action in flow_actions:
-                            action_id = action.get("id")
-                            attributes = action.get("attributes", {})
-                            
-                            action_info = {
-                                "ID": action_id,
-                                "Name": attributes.get("name", "Unnamed Action"),
-                                "Type": attributes.get("action_type", "Unknown"),
-                                "Status": attributes.get("status", "Unknown"),
-                                "Created": attributes.get("created", "Unknown"),
-                                "Updated": attributes.get("updated", "Unknown")
-                            }
-                            
-                            action_list.append(action_info)
-                        
-                        actions_df = pd.DataFrame(action_list)
-                        st.dataframe(actions_df, use_container_width=True)
+                        st.dataframe(pd.DataFrame(action_rows), use_container_width=True)
                 else:
                     st.info("No actions found for this flow.")
                 
@@ -210,117 +320,84 @@ elif navigation == "Email Extractor":
     
     # Get all flows for selection
     with st.spinner("Loading flows..."):
-        flows_data = get_flows(st.session_state.api_key)
+        catalog = get_catalog()
     
-    if flows_data and "data" in flows_data:
-        # Create flow options
-        flow_options = {}
-        for flow in flows_data["data"]:
-            if flow.get("type") == "flow":
-                flow_id = flow.get("id")
-                flow_name = flow.get("attributes", {}).get("name", "Unnamed Flow")
-                if flow_id and flow_name:
-                    flow_options[flow_id] = flow_name
+    if catalog:
+        # Get selected flow
+        selected_flow_id = st.selectbox(
+            "Select a Flow:",
+            options=catalog.ids(),
+            format_func=catalog.label
+        )
         
-        if flow_options:
-            # Get selected flow
-            selected_flow = st.selectbox(
-                "Select a Flow:",
-                options=list(flow_options.values())
-            )
-            
-            # Get flow ID from selected name
-            selected_flow_id = None
-            for flow_id, flow_name in flow_options.items():
-                if flow_name == selected_flow:
-                    selected_flow_id = flow_id
-                    break
+        if selected_flow_id:
+            # Get email actions in the selected flow
+            with st.spinner("Loading flow emails..."):
+                action_ids = catalog.action_ids(selected_flow_id)
             
-            if selected_flow_id:
-                # Get email actions in the selected flow
-                with st.spinner("Loading flow emails..."):
-                    flow_actions = get_flow_actions(selected_flow_id, st.session_state.api_key)
+            if action_ids:
+                # Get selected email
+                selected_action_id = st.selectbox(
+                    "Select an Email:",
+                    options=action_ids,
+                    format_func=lambda action_id: catalog.action_label(selected_flow_id, action_id)
+                )
                 
-                if flow_actions:
-                    # Create options for email actions
-                    email_options = {}
-                    for action in flow_actions:
-                        action_id = action.get("id")
-                        action_name = action.get("attributes", {}).get("name", "Unnamed Email")
-                        if action_id and action_name:
-                            email_options[action_id] = action_name
+                if selected_action_id:
+                    selected_email = catalog.action(selected_flow_id, selected_action_id)["name"]
                     
-                    if email_options:
-                        # Get selected email
-                        selected_email = st.selectbox(
-                            "Select an Email:",
-                            options=list(email_options.values())
-                        )
-                        
-                        # Get action ID from selected name
-                        selected_action_id = None
-                        for action_id, action_name in email_options.items():
-                            if action_name == selected_email:
-                                selected_action_id = action_id
-                                break
+                    # Get email content
+                    with st.spinner("Loading email content..."):
+                        email_message = get_email_content(selected_action_id, st.session_state.klaviyo_client)
+                    
+                    if email_message:
+                        # Extract HTML content
+                        html_content, formatted_html = extract_and_render_html(email_message)
                         
-                        if selected_action_id:
-                            # Get email content
-                            with st.spinner("Loading email content..."):
-                                email_message = get_email_content(selected_action_id, st.session_state.api_key)
+                        if html_content:
+                            st.success("Email HTML content loaded successfully!")
                             
-                            if email_message:
-                                # Extract HTML content
-                                html_content, formatted_html = extract_and_render_html(email_message)
+                            # Display HTML content
+                            col1, col2 = st.columns(2)
+                            
+                            with col1:
+                                st.subheader("HTML Preview")
+                                st.components.v1.html(html_content, height=600, scrolling=True)
+                            
+                            with col2:
+                                tabs = st.tabs(["HTML Source", "Template Info"])
                                 
-                                if html_content:
-                                    st.success("Email HTML content loaded successfully!")
-                                    
-                                    # Display HTML content
-                                    col1, col2 = st.columns(2)
-                                    
-                                    with col1:
-                                        st.subheader("HTML Preview")
-                                        st.components.v1.html(html_content, height=600, scrolling=True)
+                                with tabs[0]:
+                                    st.code(formatted_html, language="html")
+                                
+                                with tabs[1]:
+                                    # Display template information
+                                    template_info = email_message.get("attributes", {})
+                                    subject = template_info.get("subject", "No subject")
+                                    preview_text = template_info.get("preview_text", "No preview text")
                                     
-                                    with col2:
-                                        tabs = st.tabs(["HTML Source", "Template Info"])
-                                        
-                                        with tabs[0]:
-                                            st.code(formatted_html, language="html")
-                                        
-                                        with tabs[1]:
-                                            # Display template information
-                                            template_info = email_message.get("attributes", {})
-                                            subject = template_info.get("subject", "No subject")
-                                            preview_text = template_info.get("preview_text", "No preview text")
-                                            
-                                            st.markdown(f"**Subject:** {subject}")
-                                            st.markdown(f"**Preview Text:** {preview_text}")
-                                            
-                                            # Display other template attributes
-                                            st.markdown("**Other Template Attributes:**")
-                                            for key, value in template_info.items():
-                                                if key not in ["html", "subject", "preview_text"]:
-                                                    st.markdown(f"**{key}:** {value}")
+                                    st.markdown(f"**Subject:** {subject}")
+                                    st.markdown(f"**Preview Text:** {preview_text}")
                                     
-                                    # Download button for HTML content
-                                    st.download_button(
-                                        label="Download HTML",
-                                        data=html_content,
-                                        file_name=f"{selected_email.replace(' ', '_')}.html",
-                                        mime="text/html"
-                                    )
-                                else:
-                                    st.warning("No HTML content found for this email.")
-                            else:
-                                st.error("Failed to fetch email content.")
+                                    # Display other template attributes
+                                    st.markdown("**Other Template Attributes:**")
+                                    for key, value in template_info.items():
+                                        if key not in ["html", "subject", "preview_text"]:
+                                            st.markdown(f"**{key}:** {value}")
+                            
+                            # Download button for HTML content
+                            st.download_button(
+                                label="Download HTML",
+                                data=html_content,
+                                file_name=f"{selected_email.replace(' ', '_')}.html",
+                                mime="text/html"
+                            )
+                        else:
+                            st.warning("No HTML content found for this email.")
                     else:
-                        st.warning("No email actions found in this flow.")
-                else:
-                    st.warning("No actions found in this flow or there was an error fetching the flow actions.")
-        else:
-            st.warning("No flows found in your Klaviyo account.")
+                        st.error("Failed to fetch email content.")
+            else:
+                st.warning("No email actions found in this flow, or there was an error fetching the flow actions.")
     else:
         st.warning("No flows found in your Klaviyo account, or there was an error fetching the flows.")
 
@@ -338,74 +415,41 @@ elif navigation == "Template Analysis":
     if analysis_option == "Analyze Flow Email":
         # Similar flow and email selection as in Email Extractor
         with st.spinner("Loading flows..."):
-            flows_data = get_flows(st.session_state.api_key)
+            catalog = get_catalog()
         
-        if flows_data and "data" in flows_data:
-            flow_options = {}
-            for flow in flows_data["data"]:
-                if flow.get("type") == "flow":
-                    flow_id = flow.get("id")
-                    flow_name = flow.get("attributes", {}).get("name", "Unnamed Flow")
-                    if flow_id and flow_name:
-                        flow_options[flow_id] = flow_name
+        if catalog:
+            col1, col2 = st.columns(2)
             
-            if flow_options:
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    selected_flow = st.selectbox(
-                        "Select a Flow:",
-                        options=list(flow_options.values())
-                    )
-                    
-                    # Get flow ID from selected name
-                    selected_flow_id = None
-                    for flow_id, flow_name in flow_options.items():
-                        if flow_name == selected_flow:
-                            selected_flow_id = flow_id
-                            break
+            with col1:
+                selected_flow_id = st.selectbox(
+                    "Select a Flow:",
+                    options=catalog.ids(),
+                    format_func=catalog.label
+                )
+            
+            if selected_flow_id:
+                with st.spinner("Loading flow emails..."):
+                    action_ids = catalog.action_ids(selected_flow_id)
                 
-                if selected_flow_id:
-                    with st.spinner("Loading flow emails..."):
-                        flow_actions = get_flow_actions(selected_flow_id, st.session_state.api_key)
+                if action_ids:
+                    with col2:
+                        selected_action_id = st.selectbox(
+                            "Select an Email:",
+                            options=action_ids,
+                            format_func=lambda action_id: catalog.action_label(selected_flow_id, action_id)
+                        )
                     
-                    if flow_actions:
-                        email_options = {}
-                        for action in flow_actions:
-                            action_id = action.get("id")
-                            action_name = action.get("attributes", {}).get("name", "Unnamed Email")
-                            if action_id and action_name:
-                                email_options[action_id] = action_name
-                        
-                        if email_options:
-                            with col2:
-                                selected_email = st.selectbox(
-                                    "Select an Email:",
-                                    options=list(email_options.values())
-                                )
-                                
-                                # Get action ID from selected name
-                                selected_action_id = None
-                                for action_id, action_name in email_options.items():
-                                    if action_name == selected_email:
-                                        selected_action_id = action_id
-                                        break
+                    if selected_action_id and st.button("Analyze Template"):
+                        with st.spinner("Loading and analyzing email content..."):
+                            email_message = get_email_content(selected_action_id, st.session_state.klaviyo_client)
                             
-                            if selected_action_id and st.button("Analyze Template"):
-                                with st.spinner("Loading and analyzing email content..."):
-                                    email_message = get_email_content(selected_action_id, st.session_state.api_key)
-                                    
-                                    if email_message:
-                                        # Extract HTML content
-                                        html_content, _ = extract_and_render_html(email_message)
-                                    else:
-                                        st.error("Failed to fetch email content.")
-                        else:
-                            st.warning("No email actions found in this flow.")
-                    else:
-                        st.warning("No actions found in this flow.")
-            else:
-                st.warning("No flows found in your Klaviyo account.")
+                            if email_message:
+                                # Extract HTML content
+                                html_content, _ = extract_and_render_html(email_message)
+                            else:
+                                st.error("Failed to fetch email content.")
+                else:
+                    st.warning("No email actions found in this flow.")
         else:
             st.warning("No flows found in your Klaviyo account, or there was an error fetching the flows.")
     
@@ -420,11 +464,14 @@ elif navigation == "Template Analysis":
     if html_content:
         # Perform analysis
         with st.spinner("Analyzing template..."):
+            # Parse once (or reuse the cached analysis of identical HTML)
+            analysis = analyze_template(html_content)
+            
             # Get HTML structure analysis
-            structure_analysis = analyze_html_structure(html_content)
+            structure_analysis = analysis["structure"]
             
             # Get email compatibility check
-            compatibility = check_email_compatibility(html_content)
+            compatibility = analysis["compatibility"]
         
         # Display analysis results
         st.subheader("Analysis Results")
@@ -554,23 +601,7 @@ elif navigation == "Template Analysis":
             st.subheader("Template Recommendations")
             
             # Generate recommendations based on analysis
-            recommendations = []
-            
-            # Check for alt text
-            img_analysis = structure_analysis["images"]
-            if img_analysis["without_alt_text"] > 0:
-                recommendations.append(f"Add alt text to {img_analysis['without_alt_text']} images for accessibility and when images are blocked")
-            
-            # Check for responsiveness
-            resp_analysis = structure_analysis["responsiveness"]
-            if not resp_analysis["has_media_queries"]:
-                recommendations.append("Add media queries for better mobile responsiveness")
-            
-            # Check for potential compatibility issues
-            for issue, has_issue in compatibility["problematic_elements"].items():
-                if has_issue:
-                    issue_name = issue.replace("has_", "").replace("_", " ")
-                    recommendations.append(f"Remove {issue_name} as it may cause compatibility issues in some email clients")
+            recommendations = analysis["recommendations"]
             
             # Display recommendations
             if recommendations:
@@ -592,442 +623,419 @@ elif navigation == "Bulk Operations":
         ]
     )
     
+    # Set when a running report is shown, so its rows stream in at the end of the page
+    live_report = False
+    
+    # Number of concurrent fetches used by the bulk engine
+    bulk_workers = st.slider("Parallel workers:", min_value=1, max_value=32, value=DEFAULT_WORKERS)
+    
+    # Every job checkpoints its progress; reusing an ID resumes that job
+    job_id = st.text_input(
+        "Job ID (optional):",
+        help="Leave empty to start a new job. To resume an interrupted job, enter its ID from the Jobs list and run the same operation again."
+    ).strip()
+    if job_id and not JOB_ID_PATTERN.match(job_id):
+        st.error("Job IDs may only contain letters, digits, '.', '_' and '-'.")
+        job_id = ""
+    
+    profile_job = st.checkbox("Profile the job", help="Record a CPU profile and timing spans for the job; shown under Jobs once it finishes.")
+    
+    if operation_type != "Generate Template Report":
+        zip_compression = st.selectbox(
+            "ZIP compression:",
+            list(COMPRESSION_LEVELS),
+            index=list(COMPRESSION_LEVELS).index(DEFAULT_COMPRESSION)
+        )
+        zip_dedup = st.checkbox(
+            "Store identical templates once",
+            help="Each distinct HTML body is stored once under its content hash; manifest.json maps every flow/action to its file."
+        )
+    
     if operation_type == "Extract All HTML Templates from Flow":
         # Get all flows
         with st.spinner("Loading flows..."):
-            flows_data = get_flows(st.session_state.api_key)
+            catalog = get_catalog()
         
-        if flows_data and "data" in flows_data:
-            # Create flow options
-            flow_options = {}
-            for flow in flows_data["data"]:
-                if flow.get("type") == "flow":
-                    flow_id = flow.get("id")
-                    flow_name = flow.get("attributes", {}).get("name", "Unnamed Flow")
-                    if flow_id and flow_name:
-                        flow_options[flow_id] = flow_name
+        if catalog:
+            # Select flow
+            selected_flow_id = st.selectbox(
+                "Select a Flow:",
+                options=catalog.ids(),
+                format_func=catalog.label
+            )
             
-            if flow_options:
-                # Select flow
-                selected_flow = st.selectbox(
-                    "Select a Flow:",
-                    options=list(flow_options.values())
-                )
-                
-                # Get flow ID from selected name
-                selected_flow_id = None
-                for flow_id, flow_name in flow_options.items():
-                    if flow_name == selected_flow:
-                        selected_flow_id = flow_id
-                        break
-                
-                if selected_flow_id and st.button("Extract All Templates"):
-                    with st.spinner("Extracting templates..."):
-                        # Get flow actions
-                        flow_actions = get_flow_actions(selected_flow_id, st.session_state.api_key)
-                        
-                        if flow_actions:
-                            # Create a ZIP file with all HTML content
-                            import io
-                            import zipfile
-                            
-                            # Create in-memory ZIP file
-                            zip_buffer = io.BytesIO()
-                            with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                                # Add each email to the ZIP
-                                for action in flow_actions:
-                                    action_id = action.get("id")
-                                    action_name = action.get("attributes", {}).get("name", "Unnamed Email")
-                                    
-                                    if action_id:
-                                        # Get email content
-                                        email_message = get_email_content(action_id, st.session_state.api_key)
-                                        
-                                        if email_message:
-                                            # Extract HTML content
-                                            html_content, _ = extract_and_render_html(email_message)
-                                            
-                                            if html_content:
-                                                # Add to ZIP file
-                                                filename = f"{action_name.replace(' ', '_')}.html"
-                                                zip_file.writestr(filename, html_content)
-                            
-                            # Provide download button for ZIP file
-                            zip_buffer.seek(0)
-                            st.download_button(
-                                label="Download All Templates (ZIP)",
-                                data=zip_buffer,
-                                file_name=f"{selected_flow}_templates.zip",
-                                mime="application/zip"
-                            )
-                            
-                            st.success("Templates extracted successfully!")
-                        else:
-                            st.warning("No email actions found in this flow.")
-            else:
-                st.warning("No flows found in your Klaviyo account.")
+            if selected_flow_id and st.button("Extract All Templates"):
+                selected_flow = catalog.name(selected_flow_id)
+                # Runs in the background; progress and the download are under Jobs below
+                try:
+                    submit_export(
+                        st.session_state.klaviyo_client,
+                        catalog.pairs([selected_flow_id]),
+                        f"{safe_name(selected_flow)}_templates.zip",
+                        f"Templates: {selected_flow}",
+                        workers=bulk_workers,
+                        compression=zip_compression,
+                        include_flow_dir=False,
+                        dedup=zip_dedup,
+                        job_id=job_id or None,
+                        profile=profile_job
+                    )
+                    st.success("Export queued. Follow its progress under Jobs below.")
+                except ValueError as e:
+                    st.error(str(e))
         else:
             st.warning("No flows found in your Klaviyo account, or there was an error fetching the flows.")
     
     elif operation_type == "Extract All HTML Templates from All Flows":
         if st.button("Extract All Templates from All Flows"):
-            with st.spinner("Extracting templates from all flows..."):
-                # Get all flows
-                flows_data = get_flows(st.session_state.api_key)
-                
-                if flows_data and "data" in flows_data:
-                    # Create in-memory ZIP file
-                    import io
-                    import zipfile
-                    
-                    zip_buffer = io.BytesIO()
-                    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-                        # Process each flow
-                        for flow in flows_data["data"]:
-                            if flow.get("type") == "flow":
-                                flow_id = flow.get("id")
-                                flow_name = flow.get("attributes", {}).get("name", "Unnamed Flow")
-                                
-                                if flow_id and flow_name:
-                                    # Create directory for flow
-                                    flow_dir = flow_name.replace(' ', '_')
-                                    
-                                    # Get flow actions
-                                    flow_actions = get_flow_actions(flow_id, st.session_state.api_key)
-                                    
-                                    if flow_actions:
-                                        # Add each email to the ZIP
-                                        for action in flow_actions:
-                                            action_id = action.get("id")
-                                            action_name = action.get("attributes", {}).get("name", "Unnamed Email")
-                                            
-                                            if action_id:
-                                                # Get email content
-                                                email_message = get_email_content(action_id, st.session_state.api_key)
-                                                
-                                                if email_message:
-                                                    # Extract HTML content
-                                                    html_content, _ = extract_and_render_html(email_message)
-                                                    
-                                                    if html_content:
-                                                        # Add to ZIP file
-                                                        filename = f"{flow_dir}/{action_name.replace(' ', '_')}.html"
-                                                        zip_file.writestr(filename, html_content)
-                    
-                    # Provide download button for ZIP file
-                    zip_buffer.seek(0)
-                    st.download_button(
-                        label="Download All Templates (ZIP)",
-                        data=zip_buffer,
-                        file_name="all_flow_templates.zip",
-                        mime="application/zip"
-                    )
-                    
-                    st.success("All templates extracted successfully!")
-                else:
-                    st.warning("No flows found in your Klaviyo account, or there was an error fetching the flows.")
+            # Every flow's actions and renders are fetched concurrently inside the job
+            try:
+                submit_export(
+                    st.session_state.klaviyo_client,
+                    get_catalog().pairs(),
+                    "all_flow_templates.zip",
+                    "Templates: all flows",
+                    workers=bulk_workers,
+                    compression=zip_compression,
+                    dedup=zip_dedup,
+                    job_id=job_id or None,
+                    profile=profile_job
+                )
+                st.success("Export queued. Follow its progress under Jobs below.")
+            except ValueError as e:
+                st.error(str(e))
     
     elif operation_type == "Generate Template Report":
         # Get all flows
         with st.spinner("Loading flows..."):
-            flows_data = get_flows(st.session_state.api_key)
+            catalog = get_catalog()
         
-        if flows_data and "data" in flows_data:
-            # Create flow options
-            flow_options = {}
-            for flow in flows_data["data"]:
-                if flow.get("type") == "flow":
-                    flow_id = flow.get("id")
-                    flow_name = flow.get("attributes", {}).get("name", "Unnamed Flow")
-                    if flow_id and flow_name:
-                        flow_options[flow_id] = flow_name
+        if catalog:
+            # Multi-select for flows
+            selected_flow_ids = st.multiselect(
+                "Select Flows:",
+                options=catalog.ids(),
+                format_func=catalog.label
+            )
             
-            if flow_options:
-                # Multi-select for flows
-                selected_flows = st.multiselect(
-                    "Select Flows:",
-                    options=list(flow_options.values())
-                )
+            # Templates are analyzed in a pool of worker processes, one per CPU,
+            # shared with every other report that is running
+            analysis_workers = st.slider(
+                "Analysis processes:",
+                min_value=1,
+                max_value=max(DEFAULT_ANALYSIS_WORKERS, 2),
+                value=DEFAULT_ANALYSIS_WORKERS,
+                help="How many of the shared analysis processes this report may use at once."
+            )
+            
+            # Reuse stored rows for emails that have not changed since the last report
+            incremental = st.checkbox("Only re-process new or changed emails", value=True)
+            
+            if selected_flow_ids and st.button("Generate Report"):
+                # Fetch and analyze every template of the selected flows in a background job
+                try:
+                    report_job = submit_report(
+                        st.session_state.klaviyo_client,
+                        catalog.pairs(selected_flow_ids),
+                        f"Report: {', '.join(catalog.label(flow_id) for flow_id in selected_flow_ids)}",
+                        workers=bulk_workers,
+                        analysis_workers=analysis_workers,
+                        manifest=get_default_manifest() if incremental else None,
+                        job_id=job_id or None,
+                        profile=profile_job
+                    )
+                    st.session_state.report_job_id = report_job.id
+                except ValueError as e:
+                    st.error(str(e))
+            elif not selected_flow_ids:
+                st.info("Please select at least one flow and click 'Generate Report'")
+        else:
+            st.warning("No flows found in your Klaviyo account, or there was an error fetching the flows.")
+        
+        # Show the report of the job picked under Jobs (or the one just queued)
+        report_job = get_job_manager().get(st.session_state.get('report_job_id'), account_hash(st.session_state.klaviyo_client.api_key))
+        live_report = report_job is not None and report_job.active
+        if live_report:
+            # Rows stream in below while the job runs; see the end of this page
+            st.subheader(report_job.label)
+            live_metrics = st.empty()
+            live_table = st.empty()
+        elif report_job is not None and report_job.status == "succeeded":
+            result = report_job.result
+            report_data = result["rows"]
+            
+            st.info(f"{report_job.label}: reused {result['reused']} unchanged or already checkpointed rows; processed {result['succeeded']} emails.")
+            
+            if result["failed"]:
+                st.warning(f"{result['failed']} templates could not be fetched or analyzed.")
+            
+            # Typed report frame, built once per report and reused across reruns
+            if report_data:
+                report = st.session_state.get("report_table")
+                if report is None or report["job_id"] != report_job.id:
+                    report = st.session_state.report_table = {"job_id": report_job.id, "frame": report_frame(report_data), "exports": {}}
+                report_df = report["frame"]
                 
-                if selected_flows and st.button("Generate Report"):
-                    with st.spinner("Generating template report..."):
-                        # Create list to store report data
-                        report_data = []
-                        
-                        # Process each selected flow
-                        for flow_name in selected_flows:
-                            # Get flow ID
-                            flow_id = None
-                            for fid, fname in flow_options.items():
-                                if fname == flow_name:
-                                    flow_id = fid
-                                    break
-                            
-                            if flow_id:
-                                # Get flow actions
-                                flow_actions = get_flow_actions(flow_id, st.session_state.api_key)
-                                
-                                if flow_actions:
-                                    # Process each email action
-                                    for action in flow_actions:
-                                        action_id = action.get("id")
-                                        action_name = action.get("attributes", {}).get("name", "Unnamed Email")
-                                        
-                                        if action_id:
-                                            # Get email content
-                                            email_message = get_email_content(action_id, st.session_state.api_key)
-                                            
-                                            if email_message:
-                                                # Extract HTML content
-                                                html_content, _ = extract_and_render_html(email_message)
-                                                
-                                                if html_content:
-                                                    # Analyze template
-                                                    structure = analyze_html_structure(html_content)
-                                                    compatibility = check_email_compatibility(html_content)
-                                                    
-                                                    # Add to report data
-                                                    report_item = {
-                                                        "Flow": flow_name,
-                                                        "Email": action_name,
-                                                        "Elements": structure["total_elements"],
-                                                        "Images": structure["elements"]["images"],
-                                                        "Links": structure["elements"]["links"],
-                                                        "Tables": structure["elements"]["tables"],
-                                                        "Mobile Responsive": "Yes" if structure["responsiveness"]["has_media_queries"] else "No",
-                                                        "Issues": len([i for i, v in compatibility["problematic_elements"].items() if v]),
-                                                        "Recommendations": len(compatibility["recommendations"])
-                                                    }
-                                                    
-                                                    report_data.append(report_item)
-                        
-                        # Create DataFrame from report data
-                        if report_data:
-                            import pandas as pd
-                            report_df = pd.DataFrame(report_data)
-                            
-                            # Display report
-                            st.subheader("Template Analysis Report")
-                            st.dataframe(report_df, use_container_width=True)
-                            
-                            # Download report as CSV
-                            csv = report_df.to_csv(index=False)
+                # Display report
+                st.subheader("Template Analysis Report")
+                st.dataframe(report_df, use_container_width=True)
+                
+                # Download report as CSV, or as typed columnar files when pyarrow is installed
+                if "csv" not in report["exports"]:
+                    report["exports"]["csv"] = report_csv(report_df)
+                csv = report["exports"]["csv"]
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.download_button(
+                        label="Download Report (CSV)",
+                        data=csv,
+                        file_name="template_analysis_report.csv",
+                        mime="text/csv"
+                    )
+                if columnar_available():
+                    for column, (fmt, (file_name, mime)) in zip((col2, col3), COLUMNAR_FORMATS.items()):
+                        if fmt not in report["exports"]:
+                            report["exports"][fmt] = columnar_bytes(report_df, fmt)
+                        with column:
                             st.download_button(
-                                label="Download Report (CSV)",
-                                data=csv,
-                                file_name="template_analysis_report.csv",
-                                mime="text/csv"
+                                label=f"Download Report ({fmt.title()})",
+                                data=report["exports"][fmt],
+                                file_name=file_name,
+                                mime=mime
                             )
-                            
-                            # Display summary statistics
-                            with st.expander("Report Summary"):
-                                st.write("### Template Statistics")
-                                
-                                total_templates = len(report_data)
-                                responsive_templates = sum(1 for item in report_data if item["Mobile Responsive"] == "Yes")
-                                avg_elements = sum(item["Elements"] for item in report_data) / total_templates if total_templates > 0 else 0
-                                avg_images = sum(item["Images"] for item in report_data) / total_templates if total_templates > 0 else 0
-                                
-                                col1, col2, col3, col4 = st.columns(4)
-                                
-                                with col1:
-                                    st.metric("Total Templates", total_templates)
-                                with col2:
-                                    st.metric("Responsive Templates", responsive_templates)
-                                with col3:
-                                    st.metric("Avg. Elements", f"{avg_elements:.1f}")
-                                with col4:
-                                    st.metric("Avg. Images", f"{avg_images:.1f}")
-                                
-                                # Create a bar chart for issues
-                                st.write("### Issues by Template")
-                                issues_chart_data = pd.DataFrame({
-                                    'Template': [f"{item['Flow']}: {item['Email']}" for item in report_data],
-                                    'Issues': [item['Issues'] for item in report_data]
-                                })
-                                st.bar_chart(issues_chart_data.set_index('Template'))
-                        else:
-                            st.warning("No template data found for the selected flows.")
                 else:
-                    st.info("Please select at least one flow and click 'Generate Report'")
+                    st.caption("Install pyarrow to download the report as Parquet or Arrow.")
+                
+                # Display summary statistics
+                with st.expander("Report Summary"):
+                    st.write("### Template Statistics")
+                    
+                    totals = report_totals(report_df)
+                    
+                    col1, col2, col3, col4, col5 = st.columns(5)
+                    
+                    with col1:
+                        st.metric("Total Templates", totals["templates"])
+                    with col2:
+                        st.metric("Responsive Templates", totals["responsive"])
+                    with col3:
+                        st.metric("Templates with Issues", totals["with_issues"])
+                    with col4:
+                        st.metric("Avg. Elements", f"{totals['avg_elements']:.1f}")
+                    with col5:
+                        st.metric("Avg. Images", f"{totals['avg_images']:.1f}")
+                    
+                    st.write("### By Flow")
+                    st.dataframe(flow_summary(report_df), use_container_width=True)
+                    
+                    st.write("### By Issue Type")
+                    st.dataframe(issue_summary(report_df), use_container_width=True)
+                    
+                    # Templates with each issue type, stacked per flow
+                    st.write("### Issues by Flow")
+                    st.bar_chart(issues_by_flow(report_df))
             else:
-                st.warning("No flows found in your Klaviyo account.")
-        else:
-            st.warning("No flows found in your Klaviyo account, or there was an error fetching the flows.")
-
-# Add footer
-st.markdown("---")
-st.markdown(
-    """
-    <div style="text-align: center; opacity: 0.7; font-size: 0.9rem;">
-        Klaviyo Flow Email HTML Extractor | Made with Streamlit | Deploy with GitHub
-    </div>
-    """,
-    unsafe_allow_html=True
-)
-"""
-Klaviyo Flow Email HTML Extractor
-
-A Streamlit web application that helps you identify flow emails in Klaviyo 
-and extract/render their HTML creative content.
-"""
-import streamlit as st
-import os
-import sys
-
-# Add utils directory to path
-sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
-
-# Import utility functions
-from klaviyo_api import (
-    klaviyo_api_request, get_flows, get_flow_actions, 
-    get_email_content, get_flow_metrics, get_message_metrics
-)
-from html_utils import extract_and_render_html, analyze_html_structure, check_email_compatibility
-
-# Set page configuration
-st.set_page_config(
-    page_title="Klaviyo Flow Email HTML Extractor",
-    page_icon="✉️",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
-# Main Header
-st.title("Klaviyo Flow Email HTML Extractor")
-st.markdown("""
-This app helps you identify flow emails in Klaviyo and extract/render their HTML creative content.
-Use the sidebar to authenticate and navigate through the app's features.
-""")
-
-# Sidebar for authentication
-with st.sidebar:
-    st.header("Authentication")
+                st.warning("No template data found for the selected flows.")
     
-    # Check for stored API key in session state
-    if 'api_key' not in st.session_state:
-        st.session_state.api_key = ""
+    # Background jobs of this account; they keep running across reruns and sessions
+    st.subheader("Jobs")
+    job_manager = get_job_manager()
+    account_jobs = job_manager.list(account_hash(st.session_state.klaviyo_client.api_key))
     
-    # Get API key from user
-    api_key = st.text_input(
-        "Enter your Klaviyo Private API Key:",
-        value=st.session_state.api_key,
-        type="password",
-        key="api_key_input"
-    )
-    
-    # Save API key to session state when updated
-    if api_key != st.session_state.api_key:
-        st.session_state.api_key = api_key
-    
-    # Display connection status
-    if api_key:
-        try:
-            test_response = get_flows(api_key, {"page[size]": 1})
-            if test_response and "data" in test_response:
-                st.success("✅ Connected to Klaviyo")
-                st.session_state.is_authenticated = True
-            else:
-                st.error("❌ Failed to connect to Klaviyo")
-                st.session_state.is_authenticated = False
-        except Exception as e:
-            st.error(f"❌ Connection Error: {str(e)}")
-            st.session_state.is_authenticated = False
+    if account_jobs:
+        import pandas as pd
+        jobs_df = pd.DataFrame([
+            {
+                "Job": job.label,
+                "Status": job.status,
+                "Done": job.done,
+                "Total": job.total,
+                "Failed": job.failed,
+                "ETA (s)": round(job.eta()) if job.eta() is not None else None,
+                "ID": job.id
+            }
+            for job in account_jobs
+        ])
+        st.dataframe(jobs_df, use_container_width=True)
+        
+        jobs_by_id = {job.id: job for job in account_jobs}
+        selected_job = jobs_by_id[st.selectbox(
+            "Select a job:",
+            options=list(jobs_by_id),
+            format_func=lambda x: f"{jobs_by_id[x].label} ({x})"
+        )]
+        
+        st.progress(min(selected_job.done / selected_job.total, 1.0) if selected_job.total else 0.0)
+        st.write(f"{selected_job.done} / {selected_job.total} emails done, {selected_job.failed} failed, {selected_job.elapsed():.0f}s elapsed")
+        if selected_job.error:
+            st.error(selected_job.error)
+        
+        if selected_job.active:
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("Cancel Job"):
+                    job_manager.cancel(selected_job.id, selected_job.owner)
+                    st.rerun()
+            with col2:
+                st.button("Refresh Progress")
+        else:
+            artifact = selected_job.artifact if selected_job.status == "succeeded" and selected_job.artifact and os.path.exists(selected_job.artifact) else None
+            artifact_size = os.path.getsize(artifact) if artifact else 0
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                if artifact and artifact_size <= MAX_DOWNLOAD_BYTES:
+                    with open(artifact, "rb") as artifact_file:
+                        st.download_button(
+                            label="Download Result",
+                            data=artifact_file,
+                            file_name=os.path.basename(artifact),
+                            mime="application/zip" if selected_job.kind == "export" else "text/csv"
+                        )
+            with col2:
+                if selected_job.kind == "report" and selected_job.status == "succeeded" and st.button("Show Report"):
+                    st.session_state.report_job_id = selected_job.id
+                    st.rerun()
+            with col3:
+                if st.button("Remove Job"):
+                    job_manager.remove(selected_job.id, selected_job.owner)
+                    st.rerun()
+            if artifact and artifact_size > MAX_DOWNLOAD_BYTES:
+                st.warning(f"The result is too large to download through the browser ({artifact_size / 2**20:.0f} MB). It is saved on the app server at {artifact}; for exports this size, run cli.py, which writes straight to disk.")
+            if selected_job.profile is not None:
+                render_profile(selected_job.profile, "Job profile", f"job_{selected_job.id}")
     else:
-        st.warning("⚠️ Please enter your Klaviyo API key")
-        st.session_state.is_authenticated = False
+        st.info("No jobs yet. Bulk operations run in the background and show up here.")
     
-    # Navigation
-    st.sidebar.markdown("---")
-    st.sidebar.header("Navigation")
-    
-    # Only show navigation options if authenticated
-    if st.session_state.get('is_authenticated', False):
-        navigation = st.sidebar.radio(
-            "Select a feature:",
-            [
-                "Flow Browser",
-                "Email Extractor",
-                "Template Analysis",
-                "Bulk Operations"
-            ]
-        )
-    else:
-        navigation = "Welcome"
+    # Keep the running report's table and counters current until it finishes;
+    # any widget interaction reruns the page without stopping the job
+    if live_report:
+        import time
+        import pandas as pd
+        finish_page(diagnostics_panel)
+        while report_job.active:
+            with live_metrics.container():
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    st.metric("Done", f"{report_job.done} / {report_job.total}")
+                with col2:
+                    st.metric("Failed", report_job.failed)
+                with col3:
+                    st.metric("Rows", len(report_job.rows))
+                with col4:
+                    st.metric("Throughput", f"{report_job.throughput():.1f} emails/s")
+            if report_job.rows:
+                live_table.dataframe(pd.DataFrame(list(report_job.rows)), use_container_width=True)
+            time.sleep(1)
+        st.rerun()
 
-# Main content based on navigation
-if navigation == "Welcome" or not st.session_state.get('is_authenticated', False):
-    st.header("Welcome to Klaviyo Flow Email HTML Extractor")
+elif navigation == "Search":
+    import time
+    import pandas as pd
+    st.header("Search Flow Emails")
     
-    st.markdown("""
-    To get started, please enter your Klaviyo Private API Key in the sidebar.
-    
-    ### Features
-    
-    * **Flow Browser**: View all your Klaviyo flows and their details
-    * **Email Extractor**: Extract HTML content from flow emails
-    * **Template Analysis**: Analyze email templates for best practices
-    * **Bulk Operations**: Perform operations on multiple emails or flows
-    
-    ### Getting your Klaviyo API Key
-    
-    1. Log in to your Klaviyo account
-    2. Go to Account → Settings → API Keys
-    3. Create a Private API Key with appropriate permissions
-    4. Copy the key and paste it in the sidebar
+    # Queries only read the local mirror; Klaviyo is called when syncing
+    search_index = get_default_search_index()
+    index_stats = search_index.stats(api_key)
+    if index_stats["emails"]:
+        synced = time.strftime("%Y-%m-%d %H:%M", time.localtime(index_stats["synced"]))
+        st.caption(f"{index_stats['emails']} emails from {index_stats['flows']} flows, last synced {synced}")
+    else:
+        st.info("The search index is empty. Sync it to copy your flow emails into a local database.")
     
-    ### Security Note
+    # Syncs run as background jobs and only fetch new or changed emails
+    sync_job = next((job for job in get_job_manager().list(owner=account_hash(api_key)) if job.kind == "sync"), None)
+    if sync_job is not None and sync_job.active:
+        st.progress(min(sync_job.done / sync_job.total, 1.0) if sync_job.total else 0.0)
+        st.write(f"Syncing: {sync_job.done} / {sync_job.total} emails, {sync_job.failed} failed")
+        st.button("Refresh Progress")
+    else:
+        if sync_job is not None and sync_job.error:
+            st.error(f"Last sync failed: {sync_job.error}")
+        full_sync = st.checkbox("Full resync", help="Refetch every email from Klaviyo, skipping cached responses, instead of only new or changed ones.")
+        if st.button("Sync Now"):
+            try:
+                submit_sync(st.session_state.klaviyo_client, "Search index sync", full=full_sync)
+                st.rerun()
+            except ValueError as e:
+                st.error(str(e))
     
-    Your API key is stored only in your browser's session and is not saved on any server.
-    Always keep your API keys secure and don't share them with others.
-    """)
-
-elif navigation == "Flow Browser":
-    st.header("Flow Browser")
+    query = st.text_input(
+        "Search for a link, coupon code or phrase:",
+        help='Every word must appear; wrap a phrase in "quotes". Matching ignores case and also finds text inside words and URLs.'
+    )
     
-    # Get all flows
-    with st.spinner("Loading flows..."):
-        flows_data = get_flows(st.session_state.api_key)
+    col1, col2 = st.columns(2)
+    with col1:
+        search_fields = st.multiselect("Search in:", list(SEARCH_FIELDS), default=list(SEARCH_FIELDS))
+    with col2:
+        indexed_flows = dict(search_index.flows(api_key))
+        flow_filter = st.selectbox(
+            "Flow:",
+            options=[None] + list(indexed_flows),
+            format_func=lambda flow_id: "All flows" if flow_id is None else indexed_flows[flow_id]
+        )
     
-    if flows_data and "data" in flows_data:
-        # Create a dataframe of flows
-        flow_list = []
-        
-        for flow in flows_data["data"]:
-            if flow.get("type") == "flow":
-                flow_id = flow.get("id")
-                attributes = flow.get("attributes", {})
-                
-                flow_info = {
-                    "ID": flow_id,
-                    "Name": attributes.get("name", "Unnamed Flow"),
-                    "Status": attributes.get("status", "Unknown"),
-                    "Created": attributes.get("created", "Unknown"),
-                    "Updated": attributes.get("updated", "Unknown"),
-                    "Trigger Type": attributes.get("trigger_type", "Unknown")
-                }
-                
-                flow_list.append(flow_info)
-        
-        import pandas as pd
-        flows_df = pd.DataFrame(flow_list)
-        
-        # Display the flows
-        st.dataframe(flows_df, use_container_width=True)
-        
-        # Flow details section
-        st.subheader("Flow Details")
+    if query:
+        start = time.perf_counter()
+        try:
+            results = search_index.search(
+                api_key,
+                query,
+                fields=[SEARCH_FIELDS[field] for field in search_fields],
+                flow_id=flow_filter
+            )
+        except ValueError as e:
+            st.warning(str(e))
+            results = None
+        elapsed = time.perf_counter() - start
         
-        selected_flow_id = st.selectbox(
-            "Select a flow to view details:",
-            options=flows_df["ID"].tolist(),
-            format_func=lambda x: flows_df[flows_df["ID"] == x]["Name"].iloc[0]
-        )
+        if results is not None:
+            shown = f" (showing the best {DEFAULT_LIMIT})" if len(results) == DEFAULT_LIMIT else ""
+            st.caption(f"{len(results)} matching emails in {elapsed * 1000:.1f} ms{shown}")
         
-        if selected_flow_id:
-            with st.spinner("Loading flow details..."):
-                # Get flow actions
-                flow_actions = get_flow_actions(selected_flow_id, st.session_state.api_key)
-                
-                # Get flow metrics
-                flow_metrics = get_flow_metrics(selected_flow_id, st.session_state.api_key)
\ No newline at end of file
+        if results:
+            st.dataframe(pd.DataFrame([
+                {
+                    "Flow": result["flow_name"],
+                    "Email": result["action_name"],
+                    "Subject": result["subject"],
+                    "Match": result["snippet"]
+                }
+                for result in results
+            ]), use_container_width=True, hide_index=True)
+            
+            results_by_id = {result["action_id"]: result for result in results}
+            selected_action_id = st.selectbox(
+                "Preview an email:",
+                options=list(results_by_id),
+                format_func=lambda action_id: f"{results_by_id[action_id]['flow_name']} / {results_by_id[action_id]['action_name']}"
+            )
+            email = search_index.get_email(api_key, selected_action_id)
+            if email:
+                st.markdown(f"**Subject:** {email['subject'] or 'No subject'}")
+                st.markdown(f"**Preview Text:** {email['preview_text'] or 'No preview text'}")
+                if email["html"]:
+                    st.components.v1.html(email["html"], height=600, scrolling=True)
+                    st.download_button(
+                        label="Download HTML",
+                        data=email["html"],
+                        file_name=f"{safe_name(email['action_name'])}.html",
+                        mime="text/html"
+                    )
+                else:
+                    st.info("This email had no HTML content when it was synced.")
+        elif results is not None:
+            st.info("No emails match. Sync again if the emails changed recently.")
+
+finish_page(diagnostics_panel)
+
+# Add footer
+st.markdown("---")
+st.markdown(
+    """
+    <div style="text-align: center; opacity: 0.7; font-size: 0.9rem;">
+        Klaviyo Flow Email HTML Extractor | Made with Streamlit | Deploy with GitHub
+    </div>
+    """,
+    unsafe_allow_html=True
+)
@@ -0,0 +1,160 @@
+"""
+End-to-end throughput of the bulk paths against a local mock Klaviyo API.
+
+Runs the ZIP export and the template report over mock_klaviyo.py (served from
+a separate process) and records requests/sec, per-request p50/p99 latency
+(as seen by the client, including rate-limit waits and retries) and peak
+traced memory for each scenario. tracemalloc slows Python-heavy work, so
+compare runs with each other rather than with production timings. With
+--baseline the run fails when a scenario regresses beyond --tolerance.
+
+    python benchmarks/bench_bulk.py [--flows 40] [--json results.json] [--baseline old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from klaviyo_api import RATE_LIMIT_TIERS, KlaviyoClient, RateLimitScheduler
+from html_utils import configure_analysis_cache
+from archive import export_templates_zip
+from bulk import DEFAULT_ANALYSIS_WORKERS, build_report, reset_analysis_pool
+from mock_klaviyo import MockProcess
+
+# Client-side limits high enough that only the mock server throttles
+UNLIMITED_TIERS = {tier: (10_000, 600_000) for tier in RATE_LIMIT_TIERS}
+
+SCENARIOS = {
+    "export": {},
+    "export_dedup": {"dedup": True},
+    "report": {},
+    "export_errors": {"error_rate": 0.05},
+    "export_throttled": {"rate_limit": 200},
+}
+
+class TimedClient(KlaviyoClient):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self.latency_lock = threading.Lock()
+
+    def request(self, endpoint, params=None, timeout=None, use_cache=True):
+        start = time.perf_counter()
+        try:
+            return super().request(endpoint, params, timeout, use_cache)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.latency_lock:
+                self.latencies.append(elapsed)
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def run_scenario(name, options, args):
+    mock_options = {key: options[key] for key in ("error_rate", "rate_limit") if key in options}
+    with MockProcess(
+        flows=args.flows, actions_per_flow=args.actions_per_flow, template_bytes=args.template_bytes,
+        latency=args.latency, jitter=args.jitter, **mock_options,
+    ) as mock:
+        scheduler = RateLimitScheduler(max_concurrency=args.workers, tiers=UNLIMITED_TIERS)
+        client = TimedClient("bench-key", pool_size=args.workers, base_url=mock.base_url, scheduler=scheduler)
+        flows = [(flow_id, f"Flow {flow_id}") for flow_id in mock.flows]
+        # No cached analyses or warm worker processes carried over between scenarios
+        configure_analysis_cache(max_entries=0)
+        reset_analysis_pool()
+        tracemalloc.start()
+        start = time.perf_counter()
+        if name.startswith("export"):
+            with tempfile.TemporaryDirectory() as directory:
+                _, counts = export_templates_zip(client, flows, path=os.path.join(directory, "out.zip"), workers=args.workers, dedup=options.get("dedup", False))
+            succeeded, failed = counts["succeeded"], counts["failed"]
+        else:
+            result = build_report(client, flows, workers=args.workers, analysis_workers=args.analysis_workers)
+            succeeded, failed = result["succeeded"], result["failed"]
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        client.close()
+        server_stats = mock.stats
+        latencies = client.latencies
+        return {
+            "scenario": name,
+            "seconds": seconds,
+            "requests": len(latencies),
+            "requests_per_second": len(latencies) / seconds if seconds else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "peak_traced_bytes": peak,
+            "templates": succeeded,
+            "failed": failed,
+            "server": server_stats,
+        }
+
+def regressions(results, baseline, tolerance):
+    previous = {entry["scenario"]: entry for entry in baseline.get("scenarios", [])}
+    found = []
+    for entry in results:
+        old = previous.get(entry["scenario"])
+        if old is None:
+            continue
+        if entry["requests_per_second"] < old["requests_per_second"] * (1 - tolerance):
+            found.append(f"{entry['scenario']}: requests/sec {old['requests_per_second']:.1f} -> {entry['requests_per_second']:.1f}")
+        for key in ("p99_ms", "peak_traced_bytes"):
+            if old[key] and entry[key] > old[key] * (1 + tolerance):
+                found.append(f"{entry['scenario']}: {key} {old[key]:.1f} -> {entry[key]:.1f}")
+    return found
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--flows", type=int, default=40)
+    parser.add_argument("--actions-per-flow", type=int, default=8)
+    parser.add_argument("--template-bytes", type=int, default=50_000)
+    parser.add_argument("--latency", type=float, default=0.02, help="mock server latency per request, seconds")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--analysis-workers", type=int, default=DEFAULT_ANALYSIS_WORKERS)
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="run only these (repeatable)")
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--baseline", help="earlier --json output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    results = []
+    try:
+        for name in args.scenario or SCENARIOS:
+            results.append(run_scenario(name, SCENARIOS[name], args))
+    finally:
+        reset_analysis_pool()
+
+    print(f"{'scenario':<18}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}{'templates':>11}{'failed':>8}")
+    for entry in results:
+        print(
+            f"{entry['scenario']:<18}{entry['requests']:>10}{entry['requests_per_second']:>10.1f}{entry['p50_ms']:>10.1f}"
+            f"{entry['p99_ms']:>10.1f}{entry['peak_traced_bytes'] / 2**20:>10.1f}{entry['templates']:>11}{entry['failed']:>8}"
+        )
+
+    if args.json_path:
+        meta = {"python": platform.python_version(), "platform": platform.platform(), **{key: value for key, value in vars(args).items() if key not in ("json_path", "baseline")}}
+        with open(args.json_path, "w") as f:
+            json.dump({"meta": meta, "scenarios": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION: {line}")
+        return 1 if found else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
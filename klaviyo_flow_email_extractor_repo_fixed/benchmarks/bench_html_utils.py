@@ -0,0 +1,105 @@
+"""
+Scaling of the html_utils entry points with template size and nesting depth.
+
+Times extract_and_render_html (parse + prettify), analyze_html_structure and
+check_email_compatibility on generated templates from 10 KB to 2 MB, and
+measures each call's peak traced allocation in a separate, untimed run. The
+analysis cache is disabled so every call really parses. --compare prints the
+speedup against an earlier --json run.
+
+    python benchmarks/bench_html_utils.py [--backend stream] [--json results.json] [--compare old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from html_utils import (
+    analyze_html_structure, available_backends, check_email_compatibility, configure_analysis_cache,
+    extract_and_render_html, get_backend, set_backend,
+)
+from corpus import generate_template
+
+SIZES = (10_000, 50_000, 100_000, 500_000, 1_000_000, 2_000_000)
+DEPTHS = (3, 8, 16)
+
+FUNCTIONS = {
+    "extract_and_render_html": lambda html: extract_and_render_html({"data": {"attributes": {"html": html}}}),
+    "analyze_html_structure": analyze_html_structure,
+    "check_email_compatibility": check_email_compatibility,
+}
+
+def template(size, depth):
+    # Style blocks grow with the template, like long-lived Klaviyo templates
+    return generate_template(size, depth=depth, style_rules=max(50, size // 2_000))
+
+def time_call(fn, html, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(html)
+        timings.append(time.perf_counter() - start)
+    return min(timings), sum(timings) / len(timings)
+
+def peak_allocation(fn, html):
+    tracemalloc.start()
+    try:
+        fn(html)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def repeats_for(size, repeat):
+    # Fewer rounds on the multi-megabyte documents keep the run short
+    return max(1, repeat if size <= 100_000 else repeat // 3)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", choices=available_backends(), help="HTML parser backend (default: the app's choice)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), metavar="BYTES")
+    parser.add_argument("--depths", type=int, nargs="+", default=list(DEPTHS))
+    parser.add_argument("--function", action="append", choices=list(FUNCTIONS), help="run only these (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", dest="json_path")
+    parser.add_argument("--compare", help="earlier --json output to compare against")
+    args = parser.parse_args(argv)
+
+    if args.backend:
+        set_backend(args.backend)
+    configure_analysis_cache(max_entries=0)
+    functions = args.function or list(FUNCTIONS)
+
+    results = []
+    print(f"{'function':<28}{'size':>10}{'depth':>7}{'best ms':>11}{'mean ms':>11}{'peak MB':>10}")
+    for size in args.sizes:
+        for depth in args.depths:
+            html = template(size, depth)
+            for name in functions:
+                best, mean = time_call(FUNCTIONS[name], html, repeats_for(size, args.repeat))
+                peak = peak_allocation(FUNCTIONS[name], html)
+                results.append({"function": name, "size": size, "depth": depth, "bytes": len(html), "best_s": best, "mean_s": mean, "peak_bytes": peak})
+                print(f"{name:<28}{size:>10}{depth:>7}{best * 1000:>11.2f}{mean * 1000:>11.2f}{peak / 2**20:>10.2f}")
+
+    if args.json_path:
+        meta = {"python": platform.python_version(), "platform": platform.platform(), "backend": get_backend(), "repeat": args.repeat}
+        with open(args.json_path, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {(entry["function"], entry["size"], entry["depth"]): entry for entry in json.load(f)["results"]}
+        print(f"\n{'function':<28}{'size':>10}{'depth':>7}{'speedup':>10}{'memory':>10}")
+        for entry in results:
+            old = previous.get((entry["function"], entry["size"], entry["depth"]))
+            if old:
+                memory = old["peak_bytes"] / entry["peak_bytes"] if entry["peak_bytes"] else 0.0
+                print(f"{entry['function']:<28}{entry['size']:>10}{entry['depth']:>7}{old['best_s'] / entry['best_s']:>9.2f}x{memory:>9.2f}x")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""
+Compare the HTML parser backends in utils/html_utils.py.
+
+Every available backend is first checked against html.parser on the shared
+corpus (the run fails on any difference in the analysis dicts), then each
+backend is timed on structure + compatibility analysis of every template.
+On the misnested documents only "stream" must match; differences from the
+tree-repairing backends are listed as known divergences.
+
+    python benchmarks/bench_parsers.py [--repeat 5] [--json results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+from html_utils import REFERENCE_BACKENDS, ParsedTemplate, available_backends, stream_analyze
+from corpus import MISNESTED_CASES, corpus
+
+REFERENCE_BACKEND = "html.parser"
+CHUNK_SIZE = 1024
+
+def analyze(html, backend):
+    template = ParsedTemplate(html, backend)
+    return template.structure, template.compatibility
+
+def check_parity(documents, backends):
+    mismatches = []
+    divergences = []
+    for name, html in documents.items():
+        expected = analyze(html, REFERENCE_BACKEND)
+        for backend in backends:
+            if backend != REFERENCE_BACKEND and analyze(html, backend) != expected:
+                if name in MISNESTED_CASES and backend not in REFERENCE_BACKENDS:
+                    divergences.append((backend, name))
+                else:
+                    mismatches.append((backend, name))
+        summary = stream_analyze(html[i:i + CHUNK_SIZE] for i in range(0, len(html), CHUNK_SIZE))
+        if (summary.structure(), summary.compatibility()) != expected:
+            mismatches.append(("stream (chunked)", name))
+    return mismatches, divergences
+
+def time_backend(documents, backend, repeat):
+    timings = {}
+    for name, html in documents.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            analyze(html, backend)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    return timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", dest="json_path")
+    args = parser.parse_args(argv)
+
+    documents = corpus()
+    backends = available_backends()
+    mismatches, divergences = check_parity(documents, backends)
+    for backend, name in divergences:
+        print(f"known divergence: {backend} on {name}")
+    for backend, name in mismatches:
+        print(f"PARITY MISMATCH: {backend} on {name}")
+    print(f"parity: {len(documents)} documents, backends {', '.join(backends)}: {'FAIL' if mismatches else 'ok'}")
+
+    results = {backend: time_backend(documents, backend, args.repeat) for backend in backends}
+    print(f"\n{'document':<32}" + "".join(f"{backend:>14}" for backend in backends))
+    for name in documents:
+        print(f"{name:<32}" + "".join(f"{results[backend][name] * 1000:>12.2f}ms" for backend in backends))
+    totals = {backend: sum(results[backend].values()) for backend in backends}
+    print(f"{'TOTAL':<32}" + "".join(f"{totals[backend] * 1000:>12.2f}ms" for backend in backends))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"parity_mismatches": mismatches, "known_divergences": divergences, "seconds": results, "totals": totals}, f, indent=2)
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
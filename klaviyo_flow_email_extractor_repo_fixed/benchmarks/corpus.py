@@ -0,0 +1,111 @@
+"""
+Deterministic email-template corpus shared by the benchmark scripts.
+
+EDGE_CASES covers markup the parser backends are known to treat
+differently (fragments, implied wrappers, Outlook conditionals, namespaced
+tags, stray end tags); every backend must agree on them. MISNESTED_CASES is
+markup that selectolax and lxml repair the way browsers do, where only the
+reference backends ("stream", "html.parser") must agree. generate_template()
+builds large Klaviyo-style templates of a given size and table nesting depth.
+"""
+import random
+
+EDGE_CASES = {
+    "empty": "",
+    "text_only": "Hello there, no markup at all",
+    "fragment": "<p>hello <b>x</b></p><img src='a.png'>",
+    "leading_text": "text before <table><tr><td>cell</td></tr></table></p>",
+    "stray_end_tags": "<div></p></span><p>one<p>two</div></br>",
+    "uppercase": "<!DOCTYPE HTML><HTML><BODY><TABLE><TR><TD><IMG SRC=x ALT=y WIDTH=1 HEIGHT=1></TD></TR></TABLE></BODY></HTML>",
+    "valueless_attributes": "<img alt src=x><img alt='' width height=2><input disabled>",
+    "implied_tbody": "<html><body><table><tr><td><table><tr><td>x</td></tr></table></td></tr></table></body></html>",
+    "explicit_tbody": "<table><tbody><tr><td>x</td></tr></tbody></table>",
+    "outlook_conditionals": (
+        "<!DOCTYPE html><html xmlns:o='urn:schemas-microsoft-com:office:office'><head>"
+        "<!--[if mso]><xml><o:OfficeDocumentSettings><o:PixelsPerInch>96</o:PixelsPerInch>"
+        "</o:OfficeDocumentSettings></xml><![endif]-->"
+        "<meta name='viewport' content='width=device-width'></head>"
+        "<body><o:p>&nbsp;</o:p><table role='presentation'><tr><td>x</td></tr></table></body></html>"
+    ),
+    "problematic": (
+        "<html><body><header>h</header><section><form action='/x'><input></form></section>"
+        "<video src='v.mp4'></video><script>var a = '<p>';</script>"
+        "<div style='background-image: url(x.png)'>bg</div><footer>f</footer></body></html>"
+    ),
+    "style_block": (
+        "<!doctype html><html><head><style>@media only screen and (max-width: 600px) { .a { width: 100% } }"
+        "@media (prefers-color-scheme: dark) { body { background: #000 } }</style></head>"
+        "<body><div style='background:#fff'>x</div></body></html>"
+    ),
+    "comment_with_tags": "<div><!-- <p>not a tag</p> <table> --><p>real</p></div>",
+}
+
+MISNESTED_CASES = {
+    "link_around_block": "<a href=x><div>foo</a>bar</div>",
+    "misnested_inline": "<b><p>x</b>y</p>",
+    "nested_form": "<form action=a><form action=b><input></form></form>",
+    "tags_in_title_textarea": "<html><head><title><b>x</b></title></head><body><textarea><img src=x></textarea></body></html>",
+    "duplicate_body": "<html><body><p>a</p><body class=x><p>b</p></body></html>",
+}
+
+_WORDS = "shop sale new arrivals limited offer free shipping members only thank you order update".split()
+
+def _style_block(rng, rules):
+    lines = ["<style type='text/css'>"]
+    for i in range(rules):
+        lines.append(f".c{i} {{ color: #{rng.randrange(0x1000000):06x}; padding: {rng.randrange(24)}px; }}")
+        if i % 25 == 0:
+            lines.append(f"@media only screen and (max-width: {rng.choice((480, 600, 640))}px) {{ .c{i} {{ width: 100% !important; }} }}")
+    lines.append("</style>")
+    return "\n".join(lines)
+
+def _block(rng, depth):
+    if depth == 0:
+        pieces = []
+        for _ in range(rng.randrange(1, 4)):
+            kind = rng.randrange(4)
+            if kind == 0:
+                alt = f" alt='{rng.choice(_WORDS)}'" if rng.random() < 0.7 else ""
+                size = " width='600' height='300'" if rng.random() < 0.6 else ""
+                pieces.append(f"<img src='https://cdn.example.com/{rng.randrange(10**6)}.png'{alt}{size} style='display:block'>")
+            elif kind == 1:
+                pieces.append(f"<a href='https://example.com/{rng.choice(_WORDS)}?utm={rng.randrange(999)}' style='color:#333'>{rng.choice(_WORDS)}</a>")
+            elif kind == 2:
+                pieces.append(f"<p class='c{rng.randrange(100)}' style='margin:0'>{' '.join(rng.choice(_WORDS) for _ in range(12))}</p>")
+            else:
+                pieces.append(f"<td style='background-color:#{rng.randrange(0x1000000):06x}'>{rng.choice(_WORDS)}</td>")
+        return "".join(pieces)
+    return (
+        "<table role='presentation' width='100%' cellpadding='0' cellspacing='0' border='0'><tr><td>"
+        + _block(rng, depth - 1)
+        + "</td></tr></table>"
+    )
+
+def generate_template(target_bytes, depth=6, seed=0, style_rules=200):
+    # Same (target_bytes, depth, seed, style_rules) always yields the same
+    # document, so results are comparable between runs and machines.
+    rng = random.Random(f"{target_bytes}:{depth}:{seed}:{style_rules}")
+    head = (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>"
+        "<meta name='viewport' content='width=device-width, initial-scale=1'>"
+        + _style_block(rng, style_rules)
+        + "</head><body><center><table width='100%' style='max-width:600px'><tr><td>"
+    )
+    tail = "</td></tr></table></center></body></html>"
+    body = []
+    size = len(head) + len(tail)
+    while size < target_bytes:
+        chunk = _block(rng, rng.randrange(1, depth + 1))
+        body.append(chunk)
+        size += len(chunk)
+    return head + "".join(body) + tail
+
+def synthetic_corpus(sizes=(10_000, 100_000, 500_000), depths=(3, 8)):
+    return {
+        f"synthetic_{size // 1000}kb_depth{depth}": generate_template(size, depth)
+        for size in sizes
+        for depth in depths
+    }
+
+def corpus():
+    return {**EDGE_CASES, **MISNESTED_CASES, **synthetic_corpus()}
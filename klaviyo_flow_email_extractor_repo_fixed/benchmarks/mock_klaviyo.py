@@ -0,0 +1,262 @@
+"""
+Local stand-in for the parts of the Klaviyo API the extractor uses.
+
+Serves synthetic flows, paginated flow actions and template renders (built
+with corpus.generate_template) with configurable latency, a global rate
+limit that answers 429 + Retry-After, and random 503 injection. Used by
+bench_bulk.py and the tests; it can also be run on its own and pointed at by
+hand:
+
+    python benchmarks/mock_klaviyo.py --port 8765 --flows 50 --latency 0.05
+"""
+import argparse
+import json
+import multiprocessing
+import queue
+import random
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from corpus import generate_template
+
+DEFAULT_PAGE_SIZE = 50
+# Returned by route() for a render listed in MockKlaviyo.failing, and for
+# one whose connection is to be dropped without a response
+FAILED = object()
+DROPPED = object()
+
+class MockKlaviyo:
+    def __init__(self, flows=20, actions_per_flow=8, template_bytes=50_000, distinct_templates=16,
+                 latency=0.02, jitter=0.0, rate_limit=None, error_rate=0.0, seed=0, host="127.0.0.1", port=0, action_names=None):
+        self.flows = [f"FLOW{i:04d}" for i in range(flows)]
+        self.actions_per_flow = actions_per_flow
+        # Names by action index (repeat a name to get colliding filenames)
+        self.action_names = action_names
+        # Flow names by flow ID, for duplicate or null names
+        self.flow_names = {}
+        # Per-action overrides a test can change between runs: renders that
+        # fail with a 500 or take extra seconds, replacement HTML and
+        # `updated` timestamps; `dropped` maps an action to how many more of
+        # its renders close the connection without answering
+        self.failing = set()
+        self.dropped = {}
+        # API keys answered with 401, as if revoked
+        self.revoked = set()
+        self.delays = {}
+        self.html = {}
+        self.updated_at = {}
+        # Action IDs of every render requested, in arrival order
+        self.rendered = []
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        # Flows share a pool of creatives, like real accounts reusing templates
+        self.templates = [generate_template(template_bytes, seed=i) for i in range(distinct_templates)]
+        self.tokens = float(rate_limit or 0)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "injected_errors": 0}
+        self.server = ThreadingHTTPServer((host, port), _handler(self))
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = dict.fromkeys(self.stats, 0)
+
+    def admit(self):
+        # Returns the status to answer with before doing any work: 429 when
+        # the global rate limit is exhausted, 503 for an injected failure.
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.rate_limit:
+                now = time.monotonic()
+                self.tokens = min(self.rate_limit, self.tokens + (now - self.updated) * self.rate_limit)
+                self.updated = now
+                if self.tokens < 1:
+                    self.stats["throttled"] += 1
+                    return 429
+                self.tokens -= 1
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.stats["injected_errors"] += 1
+                return 503
+            delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+        return 200
+
+    def page(self, path, records, query):
+        size = int(query.get("page[size]", [DEFAULT_PAGE_SIZE])[0])
+        start = int(query.get("page[cursor]", [0])[0])
+        end = start + size
+        next_url = f"{self.base_url}/{path}?{urlencode({'page[size]': size, 'page[cursor]': end})}" if end < len(records) else None
+        return {"data": records[start:end], "links": {"next": next_url}}
+
+    def route(self, path, query):
+        parts = path.split("/")
+        if parts == ["v1", "flows"]:
+            flows = [{"type": "flow", "id": flow_id, "attributes": {"name": self.flow_names.get(flow_id, f"Flow {flow_id}"), "status": "live"}} for flow_id in self.flows]
+            return self.page(path, flows, query)
+        if len(parts) == 4 and parts[:2] == ["v1", "flows"] and parts[2] in self.flows:
+            if parts[3] == "actions":
+                actions = [self.action(parts[2], i) for i in range(self.actions_per_flow)]
+                return self.page(path, actions, query)
+            if parts[3] == "metrics":
+                return {"data": {"attributes": {"opens": 0, "clicks": 0}}}
+        if len(parts) == 4 and parts[:2] == ["v1", "content_actions"] and parts[3] == "render":
+            with self.lock:
+                self.rendered.append(parts[2])
+                if self.dropped.get(parts[2]):
+                    self.dropped[parts[2]] -= 1
+                    return DROPPED
+            if parts[2] in self.failing:
+                return FAILED
+            if parts[2] in self.delays:
+                time.sleep(self.delays[parts[2]])
+            attributes = {"html": self.template(parts[2]), "subject": f"Subject of {parts[2]}", "preview_text": f"Preview of {parts[2]}"}
+            return {"data": {"type": "render", "id": parts[2], "attributes": attributes}}
+        return None
+
+    def action(self, flow_id, index):
+        action_id = f"{flow_id}-A{index:03d}"
+        name = self.action_names[index % len(self.action_names)] if self.action_names else f"Email {index + 1}"
+        return {"type": "flow-action", "id": action_id, "attributes": {"name": name, "updated": self.updated_at.get(action_id, "2024-01-01T00:00:00+00:00")}}
+
+    def template(self, action_id):
+        return self.html.get(action_id) or self.templates[sum(map(ord, action_id)) % len(self.templates)]
+
+def _handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without this, Nagle plus
+        # delayed ACKs add ~40 ms to every keep-alive response
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if self.path == "/__stats":
+                with mock.lock:
+                    return self.reply(200, dict(mock.stats))
+            authorization = self.headers.get("Authorization") or ""
+            if not authorization.startswith("Bearer "):
+                return self.reply(401, {"errors": [{"detail": "Missing API key"}]})
+            if authorization[len("Bearer "):] in mock.revoked:
+                return self.reply(401, {"errors": [{"detail": "Invalid API key"}]})
+            status = mock.admit()
+            if status == 429:
+                return self.reply(429, {"errors": [{"detail": "Throttled"}]}, {"Retry-After": "1"})
+            if status != 200:
+                return self.reply(status, {"errors": [{"detail": "Injected failure"}]})
+            url = urlsplit(self.path)
+            path = url.path[len("/api/"):] if url.path.startswith("/api/") else url.path.lstrip("/")
+            body = mock.route(path.rstrip("/"), parse_qs(url.query))
+            if body is None:
+                return self.reply(404, {"errors": [{"detail": "Not found"}]})
+            if body is FAILED:
+                return self.reply(500, {"errors": [{"detail": "Injected failure"}]})
+            if body is DROPPED:
+                self.close_connection = True
+                return
+            self.reply(200, body)
+
+        def reply(self, status, body, headers=None):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def _serve(options, ready):
+    mock = MockKlaviyo(**options)
+    ready.put(mock.server.server_address[1])
+    mock.server.serve_forever()
+
+class MockProcess:
+    # Runs the mock in its own process so serving responses does not compete
+    # with the client under test for the GIL.
+    def __init__(self, **options):
+        self.options = options
+        self.flows = [f"FLOW{i:04d}" for i in range(options.get("flows", 20))]
+        context = multiprocessing.get_context("spawn")
+        self.ready = context.Queue()
+        self.process = context.Process(target=_serve, args=(options, self.ready), daemon=True)
+        self.base_url = None
+
+    def __enter__(self):
+        self.process.start()
+        while True:
+            try:
+                port = self.ready.get(timeout=0.5)
+                break
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise RuntimeError(f"Mock Klaviyo server exited with code {self.process.exitcode}")
+        self.base_url = f"http://{self.options.get('host', '127.0.0.1')}:{port}/api"
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+    @property
+    def stats(self):
+        with urllib.request.urlopen(self.base_url[:-len("/api")] + "/__stats") as response:
+            return json.loads(response.read())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--flows", type=int, default=20)
+    parser.add_argument("--actions-per-flow", type=int, default=8)
+    parser.add_argument("--template-bytes", type=int, default=50_000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, help="requests per second before answering 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args(argv)
+    mock = MockKlaviyo(
+        flows=args.flows, actions_per_flow=args.actions_per_flow, template_bytes=args.template_bytes,
+        latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit, error_rate=args.error_rate, port=args.port,
+    )
+    print(f"Mock Klaviyo API at {mock.base_url} (Ctrl+C to stop)")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Klaviyo Flow Email HTML Extractor - command line
+
+Runs the bulk operations without Streamlit, for cron and batch jobs. Prints
+a JSON summary on stdout and exits non-zero if any template failed.
+
+    python cli.py export --output templates.zip [--dedup] [--flow FLOW_ID ...]
+    python cli.py export --output templates/
+    python cli.py report --output report.csv [--incremental]
+    python cli.py report --output report.parquet                   # or .arrow; needs pyarrow
+    python cli.py --job-id nightly export --output templates.zip   # rerun to resume
+    python cli.py --metrics metrics.prom report --output report.csv
+    python cli.py --profile export.prof export --output templates.zip
+    python cli.py sync [--full]                                    # mirror emails for the app's Search page
+
+The API key is read from --api-key or the KLAVIYO_API_KEY environment variable.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# Add utils directory to path
+sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
+
+from klaviyo_api import get_client, iter_flows
+from html_utils import DEFAULT_ANALYSIS_CACHE_PATH, configure_analysis_cache
+from api_cache import account_hash, get_default_cache
+from report_manifest import get_default_manifest
+from bulk import DEFAULT_WORKERS, DEFAULT_ANALYSIS_WORKERS, build_report, reset_analysis_pool, write_report
+from checkpoint import get_jobs_dir, open_journal
+from archive import COMPRESSION_LEVELS, DEFAULT_COMPRESSION, export_templates_dir, export_templates_zip
+from instrumentation import get_instrumentation
+from profiling import ProfileSession
+from search_index import get_default_search_index, sync_search_index
+
+COMPRESSION_CHOICES = {name.split()[0].lower(): name for name in COMPRESSION_LEVELS}
+
+def select_flows(client, flow_ids=None):
+    wanted = set(flow_ids or ())
+    for flow in iter_flows(client):
+        if flow.get("type") == "flow" and flow.get("id") and (not wanted or flow["id"] in wanted):
+            yield flow["id"], (flow.get("attributes") or {}).get("name") or "Unnamed Flow"
+
+def output_format(path, requested, default):
+    if requested:
+        return requested
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    return extension if extension else default
+
+def run_export(client, args, journal=None):
+    flows = select_flows(client, args.flow)
+    if output_format(args.output, args.format, "dir") == "zip":
+        _, counts = export_templates_zip(
+            client, flows, path=args.output, workers=args.workers,
+            compression=COMPRESSION_CHOICES[args.compression], include_flow_dir=not args.flat, dedup=args.dedup, journal=journal,
+        )
+    else:
+        counts = export_templates_dir(client, flows, args.output, workers=args.workers, include_flow_dir=not args.flat, journal=journal)
+    return counts
+
+def run_report(client, args, journal=None):
+    fmt = output_format(args.output, args.format, "csv")
+    if fmt in ("parquet", "arrow"):
+        # Imported here so the CLI starts without pandas
+        from report_table import columnar_available
+        if not columnar_available():
+            raise ValueError(f"{fmt} reports need pyarrow (pip install pyarrow)")
+    try:
+        result = build_report(
+            client, select_flows(client, args.flow), workers=args.workers,
+            analysis_workers=args.analysis_workers, manifest=get_default_manifest() if args.incremental else None, journal=journal,
+        )
+    finally:
+        reset_analysis_pool()
+    write_report(args.output, result["rows"], fmt)
+    counts = {key: result[key] for key in ("succeeded", "failed", "skipped", "reused")}
+    counts["rows"] = len(result["rows"])
+    counts["errors"] = [
+        {"flow_id": item["flow_id"], "action_id": item["action_id"], "error": item["error"]}
+        for item in result["items"] if item["status"] == "failed"
+    ]
+    return counts
+
+def run_sync(client, args, journal=None):
+    # The index is its own checkpoint, so reruns skip mirrored emails anyway
+    flow_ids = set(args.flow) if args.flow else None
+    return sync_search_index(client, get_default_search_index(), flow_ids=flow_ids, workers=args.workers, full=args.full)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Export Klaviyo flow email templates and template reports.")
+    parser.add_argument("--api-key", default=os.environ.get("KLAVIYO_API_KEY"), help="Klaviyo private API key (default: $KLAVIYO_API_KEY)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent API requests")
+    parser.add_argument("--flow", action="append", metavar="FLOW_ID", help="limit to this flow (repeatable)")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the local API response cache")
+    parser.add_argument("--job-id", help="checkpoint progress under this ID; rerunning with the same ID and output resumes the job")
+    parser.add_argument("--metrics", metavar="PATH", help="write API and parsing metrics here (Prometheus text for .prom, otherwise JSON)")
+    parser.add_argument("--profile", metavar="PATH", help="write a cProfile dump here and its span stacks next to it as .folded")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="export flow email HTML to a directory or ZIP archive")
+    export.add_argument("--output", required=True, help="target directory, or a .zip path")
+    export.add_argument("--format", choices=("dir", "zip"), help="default: zip for .zip paths, otherwise dir")
+    export.add_argument("--compression", choices=list(COMPRESSION_CHOICES), default=DEFAULT_COMPRESSION.split()[0].lower())
+    export.add_argument("--dedup", action="store_true", help="store identical templates once (zip only)")
+    export.add_argument("--flat", action="store_true", help="do not group templates into per-flow folders")
+    export.set_defaults(run=run_export)
+
+    report = commands.add_parser("report", help="write the template analysis report")
+    report.add_argument("--output", required=True, help="target .csv, .json, .parquet or .arrow path")
+    report.add_argument("--format", choices=("csv", "json", "parquet", "arrow"), help="default: from the output extension, else csv")
+    report.add_argument("--analysis-workers", type=int, default=DEFAULT_ANALYSIS_WORKERS, help="analysis processes this report may use at once, from a shared pool of one per usable CPU")
+    report.add_argument("--incremental", action="store_true", help="reuse rows for actions unchanged since the last report")
+    report.set_defaults(run=run_report)
+
+    sync = commands.add_parser("sync", help="mirror flows, emails and their HTML into the local search index")
+    sync.add_argument("--full", action="store_true", help="refetch every email from the API, skipping cached responses, not only new or changed ones")
+    sync.set_defaults(run=run_sync, output=None)
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.api_key:
+        parser.error("an API key is required (--api-key or KLAVIYO_API_KEY)")
+    configure_analysis_cache(DEFAULT_ANALYSIS_CACHE_PATH)
+    client = get_client(args.api_key, cache=None if args.no_cache else get_default_cache())
+    profile = ProfileSession(args.command).start() if args.profile else None
+    start = time.perf_counter()
+    try:
+        with open_journal(args.job_id, args.command, get_jobs_dir(account_hash(client.api_key))) as journal:
+            counts = args.run(client, args, journal)
+        summary = {"command": args.command, "output": args.output, "ok": not counts["failed"], **counts}
+    except Exception as e:
+        summary = {"command": args.command, "output": args.output, "ok": False, "error": str(e)}
+    if profile is not None:
+        profile.stop()
+        profile.stats().dump_stats(args.profile)
+        with open(os.path.splitext(args.profile)[0] + ".folded", "w") as f:
+            f.write(profile.folded_stacks())
+    if args.job_id:
+        summary["job_id"] = args.job_id
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    if args.metrics:
+        instrumentation = get_instrumentation()
+        with open(args.metrics, "w") as f:
+            f.write(instrumentation.to_prometheus() if args.metrics.endswith(".prom") else instrumentation.to_json())
+    print(json.dumps(summary))
+    return 0 if summary["ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'utils'))
+sys.path.append(os.path.join(ROOT, 'benchmarks'))
+
+from klaviyo_api import RATE_LIMIT_TIERS, KlaviyoClient, RateLimitScheduler
+from html_utils import configure_analysis_cache
+from mock_klaviyo import MockKlaviyo
+
+# Client-side limits high enough that only the mock server throttles
+UNLIMITED_TIERS = {tier: (10_000, 600_000) for tier in RATE_LIMIT_TIERS}
+
+def make_client(mock, **options):
+    options.setdefault("scheduler", RateLimitScheduler(tiers=UNLIMITED_TIERS))
+    return KlaviyoClient("test-key", base_url=mock.base_url, **options)
+
+def flow_pairs(mock):
+    return [(flow_id, f"Flow {flow_id}") for flow_id in mock.flows]
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    # Journals and analyses never leak between tests or into ~/.cache
+    monkeypatch.setenv("FLOW_EXTRACTOR_JOBS", str(tmp_path / "jobs"))
+    configure_analysis_cache()
+
+@pytest.fixture
+def make_mock():
+    mocks = []
+
+    def make(**options):
+        options = {"flows": 3, "actions_per_flow": 4, "template_bytes": 4000, "distinct_templates": 4, "latency": 0, **options}
+        mock = MockKlaviyo(**options).start()
+        mocks.append(mock)
+        return mock
+    yield make
+    for mock in mocks:
+        mock.stop()
+
+@pytest.fixture
+def mock(make_mock):
+    return make_mock()
+
+@pytest.fixture
+def client(mock):
+    client = make_client(mock)
+    yield client
+    client.close()
@@ -0,0 +1,91 @@
+import random
+import string
+
+import api_cache
+from api_cache import ResponseCache
+
+KEY = "test-key"
+
+def flows_page(*flows):
+    return {"data": [{"type": "flow", "id": flow_id, "attributes": {"updated": updated}} for flow_id, updated in flows]}
+
+def stored_size(cache):
+    return cache.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+def test_each_endpoint_has_its_own_ttl(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.ttl_for("v1/content_actions/A1/render") == 24 * 3600
+    assert cache.ttl_for("v1/flows/F1/actions?page[size]=50") == 15 * 60
+    assert cache.ttl_for("https://a.klaviyo.com/api/v1/flows?page[cursor]=2") == 5 * 60
+    assert cache.ttl_for("v1/unknown") == 0
+
+    now = 1_000_000.0
+    monkeypatch.setattr(api_cache.time, "time", lambda: now)
+    cache.set(KEY, "v1/flows", None, {"data": []})
+    cache.set(KEY, "v1/content_actions/A1/render", None, {"html": "x"})
+    cache.set(KEY, "v1/unknown", None, {"data": []})
+    assert cache.get(KEY, "v1/unknown") is None
+    now += 10 * 60
+    assert cache.get(KEY, "v1/flows") is None
+    assert cache.get(KEY, "v1/content_actions/A1/render") == {"html": "x"}
+    assert cache.get("other-key", "v1/content_actions/A1/render") is None
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(api_cache.time, "time", lambda: now)
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=10_000)
+    # Random text barely compresses, so each entry takes ~2 KB
+    bodies = {f"A{i}": {"html": "".join(random.Random(i).choices(string.ascii_letters, k=3000))} for i in range(8)}
+    for action_id, body in bodies.items():
+        now += 1
+        cache.set(KEY, f"v1/content_actions/{action_id}/render", None, body)
+        # A0 is read after every write, so it stays the most recently used
+        now += 1
+        assert cache.get(KEY, "v1/content_actions/A0/render") == bodies["A0"]
+    assert cache.total == stored_size(cache) <= cache.max_bytes
+    kept = [action_id for action_id in bodies if cache.get(KEY, f"v1/content_actions/{action_id}/render")]
+    assert "A0" in kept and "A7" in kept and "A1" not in kept
+
+def test_total_size_follows_writes_and_deletes(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(path)
+    cache.set(KEY, "v1/flows/F1/actions", None, {"data": [{"id": "A1"}]})
+    cache.set(KEY, "v1/flows/F1/actions", None, {"data": [{"id": "A1"}, {"id": "A2"}]})
+    cache.set(KEY, "v1/content_actions/A1/render", None, {"html": "x"})
+    cache.set("other-key", "v1/flows", None, {"data": []})
+    assert cache.total == stored_size(cache)
+    cache.invalidate_flow(KEY, "F1")
+    assert cache.total == stored_size(cache) > 0
+    assert ResponseCache(path).total == cache.total
+    cache.clear()
+    assert cache.total == stored_size(cache) == 0
+
+def test_flow_update_drops_its_actions_and_renders(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    cache.set(KEY, "v1/flows", None, flows_page(("F1", "2024-01-01"), ("F2", "2024-01-01")))
+    for flow_id, action_id in (("F1", "A1"), ("F2", "A2")):
+        cache.set(KEY, f"v1/flows/{flow_id}/actions", None, {"data": [{"id": action_id}]})
+        cache.set(KEY, f"v1/content_actions/{action_id}/render", None, {"html": action_id})
+
+    # Same timestamps: nothing is dropped
+    cache.set(KEY, "v1/flows", {"page[size]": 50}, flows_page(("F1", "2024-01-01"), ("F2", "2024-01-01")))
+    assert cache.get(KEY, "v1/content_actions/A1/render") == {"html": "A1"}
+
+    cache.set(KEY, "v1/flows", {"page[size]": 50}, flows_page(("F1", "2024-02-01"), ("F2", "2024-01-01")))
+    assert cache.get(KEY, "v1/flows/F1/actions") is None
+    assert cache.get(KEY, "v1/content_actions/A1/render") is None
+    assert cache.get(KEY, "v1/flows/F2/actions") == {"data": [{"id": "A2"}]}
+    assert cache.get(KEY, "v1/content_actions/A2/render") == {"html": "A2"}
+
+def test_hits_do_not_write_until_a_batch_is_full(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    endpoints = [f"v1/content_actions/A{i}/render" for i in range(api_cache.TOUCH_BATCH)]
+    for endpoint in endpoints:
+        cache.set(KEY, endpoint, None, {"html": endpoint})
+    before = cache.conn.total_changes
+    for endpoint in endpoints[:-1]:
+        assert cache.get(KEY, endpoint) == {"html": endpoint}
+        assert cache.get(KEY, endpoint) == {"html": endpoint}
+    assert cache.conn.total_changes == before
+    cache.get(KEY, endpoints[-1])
+    assert cache.conn.total_changes == before + api_cache.TOUCH_BATCH
@@ -0,0 +1,72 @@
+import json
+import zipfile
+
+from archive import BLOBS_DIR, MANIFEST_NAME, export_templates_zip
+from checkpoint import open_journal
+from conftest import flow_pairs, make_client
+
+def test_resume_keeps_journaled_template_with_colliding_name(make_mock, tmp_path):
+    # Both actions are named "Welcome". The first run stages only B (as
+    # Welcome.html); on resume A must not take B's staged path.
+    mock = make_mock(flows=1, actions_per_flow=2, action_names=["Welcome"])
+    client = make_client(mock)
+    first, second = (f"{mock.flows[0]}-A{i:03d}" for i in range(2))
+    assert mock.template(first) != mock.template(second)
+    path = tmp_path / "templates.zip"
+
+    mock.failing.add(first)
+    with open_journal("resume", "export") as journal:
+        _, counts = export_templates_zip(client, flow_pairs(mock), path=str(path), journal=journal)
+    assert (counts["succeeded"], counts["failed"]) == (1, 1)
+
+    mock.failing.clear()
+    with open_journal("resume", "export") as journal:
+        _, counts = export_templates_zip(client, flow_pairs(mock), path=str(path), journal=journal)
+    assert (counts["succeeded"], counts["resumed"]) == (2, 1)
+
+    with zipfile.ZipFile(path) as archive:
+        assert archive.read(f"Flow_{mock.flows[0]}/Welcome.html").decode() == mock.template(first)
+        assert archive.read(f"Flow_{mock.flows[0]}/Welcome_{second}.html").decode() == mock.template(second)
+    client.close()
+
+def test_resume_fetches_only_unfinished_actions(mock, client, tmp_path):
+    path = tmp_path / "templates.zip"
+    broken = {f"{mock.flows[1]}-A002", f"{mock.flows[2]}-A000"}
+    mock.failing.update(broken)
+    with open_journal("partial", "export") as journal:
+        _, counts = export_templates_zip(client, flow_pairs(mock), path=str(path), journal=journal)
+    assert (counts["succeeded"], counts["failed"]) == (10, 2)
+
+    mock.failing.clear()
+    mock.rendered.clear()
+    with open_journal("partial", "export") as journal:
+        _, counts = export_templates_zip(client, flow_pairs(mock), path=str(path), journal=journal)
+    assert sorted(mock.rendered) == sorted(broken)
+    assert (counts["succeeded"], counts["failed"], counts["resumed"]) == (12, 0, 10)
+    with zipfile.ZipFile(path) as archive:
+        assert len(archive.namelist()) == 12
+
+def test_dedup_archive_stores_each_body_once(mock, client, tmp_path):
+    path = tmp_path / "templates.zip"
+    _, counts = export_templates_zip(client, flow_pairs(mock), path=str(path), dedup=True)
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read(MANIFEST_NAME))
+        blobs = [name for name in archive.namelist() if name.startswith(f"{BLOBS_DIR}/")]
+        assert len(manifest["templates"]) == counts["succeeded"] == 12
+        assert len(blobs) == counts["unique"] == len({entry["hash"] for entry in manifest["templates"]}) <= 4
+        for entry in manifest["templates"]:
+            body = archive.read(f"{BLOBS_DIR}/{entry['hash']}.html").decode()
+            assert body == mock.template(entry["action_id"])
+    assert [entry["path"] for entry in manifest["templates"]] == [
+        f"Flow_{flow_id}/Email_{index + 1}.html" for flow_id in mock.flows for index in range(4)
+    ]
+
+def test_actions_without_a_name_are_exported(make_mock, tmp_path):
+    mock = make_mock(flows=1, actions_per_flow=2, action_names=[None])
+    client = make_client(mock)
+    path = tmp_path / "templates.zip"
+    _, counts = export_templates_zip(client, flow_pairs(mock), path=str(path))
+    assert counts["succeeded"] == 2
+    with zipfile.ZipFile(path) as archive:
+        assert archive.namelist() == [f"Flow_{mock.flows[0]}/Unnamed_Email.html", f"Flow_{mock.flows[0]}/Unnamed_Email_{mock.flows[0]}-A001.html"]
+    client.close()
@@ -0,0 +1,73 @@
+import os
+import threading
+
+from bulk import RENDER_WINDOW_PER_WORKER, available_cpus, build_report, iter_templates, reset_analysis_pool
+from conftest import flow_pairs, make_client
+from html_utils import configure_analysis_cache
+
+def test_slow_render_bounds_renders_held_for_ordering(make_mock):
+    mock = make_mock(flows=1, actions_per_flow=200)
+    client = make_client(mock)
+    mock.delays[f"{mock.flows[0]}-A000"] = 0.5
+    items = iter_templates(client, flow_pairs(mock), workers=4, ordered=True)
+    first = next(items)
+    # Four pages of actions, then at most a window of renders
+    assert mock.stats["requests"] <= 4 + 4 * RENDER_WINDOW_PER_WORKER
+    rest = list(items)
+    assert [item["order"] for item in [first] + rest] == [(0, index) for index in range(200)]
+    assert all(item["status"] == "succeeded" for item in [first] + rest)
+    client.close()
+
+def test_concurrent_reports_share_the_analysis_pool(make_mock):
+    # Different analysis_workers used to rebuild the pool and cancel the
+    # other report's queued analyses
+    configure_analysis_cache(max_entries=0)
+    mock = make_mock(flows=4, actions_per_flow=6, distinct_templates=24, template_bytes=20_000)
+    results = {}
+
+    def run(analysis_workers):
+        client = make_client(mock)
+        results[analysis_workers] = build_report(client, flow_pairs(mock), workers=4, analysis_workers=analysis_workers)
+        client.close()
+    try:
+        threads = [threading.Thread(target=run, args=(count,)) for count in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        reset_analysis_pool()
+    assert sorted(results) == [1, 2]
+    for result in results.values():
+        assert (result["succeeded"], result["failed"]) == (24, 0)
+        assert len(result["rows"]) == 24
+
+def test_ordered_items_follow_flow_and_action_order(make_mock):
+    # Renders finish out of order; ordered=True still yields flow by flow
+    mock = make_mock(flows=3, actions_per_flow=5)
+    for flow_id in mock.flows:
+        mock.delays[f"{flow_id}-A001"] = 0.1
+    mock.delays[f"{mock.flows[0]}-A000"] = 0.2
+    client = make_client(mock)
+    items = list(iter_templates(client, flow_pairs(mock), workers=4, ordered=True))
+    assert [item["action_id"] for item in items] == [f"{flow_id}-A{index:03d}" for flow_id in mock.flows for index in range(5)]
+    assert all(item["html"] == mock.template(item["action_id"]) for item in items)
+    unordered = list(iter_templates(client, flow_pairs(mock), workers=4))
+    assert sorted(item["action_id"] for item in unordered) == sorted(item["action_id"] for item in items)
+    client.close()
+
+def test_report_items_do_not_keep_template_bodies(mock, client):
+    result = build_report(client, flow_pairs(mock), workers=4, analysis_workers=1)
+    assert result["succeeded"] == 12 and len(result["rows"]) == 12
+    assert all("html" not in item and item["content_hash"] for item in result["items"])
+
+def test_available_cpus_respects_affinity_and_quota(monkeypatch, tmp_path):
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(6)), raising=False)
+    cpu_max = tmp_path / "cpu.max"
+    assert available_cpus(str(cpu_max)) == 6
+    cpu_max.write_text("max 100000\n")
+    assert available_cpus(str(cpu_max)) == 6
+    cpu_max.write_text("150000 100000\n")
+    assert available_cpus(str(cpu_max)) == 2
+    cpu_max.write_text("20000 100000\n")
+    assert available_cpus(str(cpu_max)) == 1
@@ -0,0 +1,69 @@
+import catalog
+from catalog import FlowCatalog, _flow_record
+from conftest import make_client
+
+def test_duplicate_flow_names_are_labelled_with_their_ids(mock, client):
+    first, second, third = mock.flows
+    mock.flow_names.update({first: "Welcome", second: "Welcome"})
+    flows = FlowCatalog.fetch(client)
+    assert flows.ids() == mock.flows
+    assert flows.label(first) == f"Welcome ({first})"
+    assert flows.label(second) == f"Welcome ({second})"
+    assert flows.label(third) == f"Flow {third}"
+    assert flows.ids_for("Welcome") == [first, second]
+    assert flows.pairs([second]) == [(second, "Welcome")]
+
+def test_duplicate_action_names_are_labelled_with_their_ids(make_mock):
+    mock = make_mock(flows=1, actions_per_flow=3, action_names=["Reminder", "Reminder", "Thanks"])
+    client = make_client(mock)
+    flows = FlowCatalog.fetch(client)
+    flow_id = mock.flows[0]
+    first, second, third = flows.action_ids(flow_id)
+    assert flows.action_label(flow_id, first) == f"Reminder ({first})"
+    assert flows.action_label(flow_id, second) == f"Reminder ({second})"
+    assert flows.action_label(flow_id, third) == "Thanks"
+    client.close()
+
+def test_flows_and_actions_are_read_across_pages(make_mock):
+    # The API pages 50 records at a time
+    mock = make_mock(flows=120, actions_per_flow=55)
+    client = make_client(mock)
+    flows = FlowCatalog.fetch(client)
+    assert len(flows) == 120 and flows.ids() == mock.flows
+    assert len(flows.action_rows(mock.flows[-1])) == 55
+    client.close()
+
+def test_actions_are_fetched_once_until_invalidated(mock, client):
+    flows = FlowCatalog.fetch(client)
+    flow_id = mock.flows[0]
+    flows.action_ids(flow_id)
+    requests = mock.stats["requests"]
+    flows.action_ids(flow_id)
+    assert mock.stats["requests"] == requests
+
+    mock.actions_per_flow = 6
+    flows.invalidate(flow_id)
+    assert len(flows.action_ids(flow_id)) == 6
+    assert mock.stats["requests"] == requests + 1
+
+def test_a_stale_catalog_is_rebuilt_with_new_flows(mock, client, monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(catalog.time, "monotonic", lambda: now)
+    flows = FlowCatalog.fetch(client)
+    assert not flows.stale()
+    now += catalog.CATALOG_MAX_AGE + 1
+    assert flows.stale()
+
+    # A new flow that reuses an existing name relabels both
+    first = mock.flows[0]
+    mock.flows.append("NEW")
+    mock.flow_names["NEW"] = f"Flow {first}"
+    refreshed = FlowCatalog.fetch(client)
+    assert "NEW" in refreshed and "NEW" not in flows
+    assert flows.label(first) == f"Flow {first}"
+    assert refreshed.label(first) == f"Flow {first} ({first})"
+    assert refreshed.label("NEW") == f"Flow {first} (NEW)"
+
+def test_flows_with_null_attributes_get_defaults():
+    record = _flow_record({"type": "flow", "id": "F1", "attributes": None})
+    assert record["name"] == "Unnamed Flow" and record["status"] == "Unknown"
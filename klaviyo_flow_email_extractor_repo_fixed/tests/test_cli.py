@@ -0,0 +1,13 @@
+from archive import export_templates_dir
+from cli import select_flows
+
+def test_flows_without_a_name_get_a_folder(mock, client, tmp_path):
+    mock.flow_names[mock.flows[0]] = None
+    flows = list(select_flows(client))
+    assert flows[0] == (mock.flows[0], "Unnamed Flow")
+    counts = export_templates_dir(client, flows, str(tmp_path))
+    assert counts["succeeded"] == 12
+    assert (tmp_path / "Unnamed_Flow" / "Email_1.html").read_text() == mock.template(f"{mock.flows[0]}-A000")
+
+def test_select_flows_keeps_only_requested_ids(mock, client):
+    assert [flow_id for flow_id, _ in select_flows(client, [mock.flows[2]])] == [mock.flows[2]]
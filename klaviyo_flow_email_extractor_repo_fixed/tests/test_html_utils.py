@@ -0,0 +1,47 @@
+import pytest
+
+from html_utils import AnalysisCache, ParsedTemplate, analyze_template, available_backends, get_backend, set_backend, stream_analyze
+from corpus import EDGE_CASES, MISNESTED_CASES
+
+def analysis(html, backend):
+    template = ParsedTemplate(html, backend)
+    return template.structure, template.compatibility
+
+@pytest.fixture
+def default_backend(monkeypatch):
+    monkeypatch.delenv("FLOW_EXTRACTOR_HTML_PARSER", raising=False)
+    set_backend(None)
+    yield
+    set_backend(None)
+
+def test_default_backend_is_stream(default_backend):
+    assert get_backend() == "stream"
+
+@pytest.mark.parametrize("name", list(EDGE_CASES) + list(MISNESTED_CASES))
+def test_reference_backends_agree(name):
+    html = {**EDGE_CASES, **MISNESTED_CASES}[name]
+    expected = analysis(html, "html.parser")
+    assert analysis(html, "stream") == expected
+    summary = stream_analyze(html[i:i + 7] for i in range(0, len(html), 7))
+    assert (summary.structure(), summary.compatibility()) == expected
+
+def test_tree_backend_analyses_are_cached_apart(default_backend):
+    if "selectolax" not in available_backends():
+        pytest.skip("selectolax is not installed")
+    html = MISNESTED_CASES["link_around_block"]
+    assert analyze_template(html)["structure"]["elements"]["links"] == 1
+    assert analyze_template(html, "selectolax")["structure"]["elements"]["links"] == 2
+    assert analyze_template(html)["structure"]["elements"]["links"] == 1
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_prettify_does_not_wrap_fragments(backend):
+    assert ParsedTemplate("<p>hi</p>", backend).prettify() == "<p>\n hi\n</p>\n"
+
+def test_analysis_cache_drops_entries_from_another_version(tmp_path):
+    path = str(tmp_path / "analyses.sqlite3")
+    analysis = {"structure": {"total_elements": 1}}
+    AnalysisCache(path=path, version=1).set("digest", analysis)
+    assert AnalysisCache(path=path, version=1).get("digest") == analysis
+    assert AnalysisCache(path=path, version=2).get("digest") is None
+    # Opening with the new version purged the old row for good
+    assert AnalysisCache(path=path, version=1).get("digest") is None
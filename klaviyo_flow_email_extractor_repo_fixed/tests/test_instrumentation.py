@@ -0,0 +1,75 @@
+import re
+
+import pytest
+import requests
+
+from api_cache import ResponseCache
+from conftest import make_client
+from instrumentation import Histogram, Instrumentation
+from klaviyo_api import get_email_content
+
+RENDER = "v1/content_actions/{id}/render"
+
+def samples(text):
+    # {(name, labels): value} for every sample line of the exposition text
+    parsed = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        match = re.match(r"^(\w+)\{(.*)\} (\S+)$", line)
+        assert match, line
+        parsed[(match.group(1), match.group(2))] = float(match.group(3))
+    return parsed
+
+def test_histogram_buckets_are_upper_bounds():
+    histogram = Histogram(bounds=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert list(histogram.cumulative()) == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(1.0) == float("inf")
+    assert Histogram().quantile(0.5) == 0.0
+
+def test_counters_and_prometheus_text_follow_real_calls(make_mock, tmp_path):
+    # Two requests a second: the third render in a row is answered 429 and retried
+    mock = make_mock(flows=1, actions_per_flow=4, rate_limit=2)
+    instrumentation = Instrumentation()
+    client = make_client(mock, instrumentation=instrumentation, cache=ResponseCache(str(tmp_path / "cache.sqlite3")))
+    for index in range(3):
+        get_email_content(f"{mock.flows[0]}-A{index:03d}", client)
+    get_email_content(f"{mock.flows[0]}-A000", client)
+    mock.failing.add(f"{mock.flows[0]}-A003")
+    with pytest.raises(requests.HTTPError):
+        get_email_content(f"{mock.flows[0]}-A003", client)
+    client.close()
+
+    stats = instrumentation.snapshot()["endpoints"][RENDER]
+    assert {key: stats[key] for key in ("calls", "cache_hits", "errors", "attempts", "throttled", "retries")} == {
+        "calls": 5, "cache_hits": 1, "errors": 1, "attempts": 5, "throttled": 1, "retries": 1,
+    }
+    assert stats["statuses"] == {"200": 3, "429": 1, "500": 1}
+    assert stats["latency"]["count"] == 5
+    assert stats["wait_seconds"] >= 1
+    assert stats["bytes"] > 0
+    assert instrumentation.totals()["stage_seconds"]["json_decode"] > 0
+
+    text = instrumentation.to_prometheus()
+    assert "# TYPE flow_extractor_api_calls_total counter" in text
+    assert "# TYPE flow_extractor_api_latency_seconds histogram" in text
+    parsed = samples(text)
+    endpoint = f'endpoint="{RENDER}"'
+    assert parsed[("flow_extractor_api_calls_total", endpoint)] == 5
+    assert parsed[("flow_extractor_api_cache_hits_total", endpoint)] == 1
+    assert parsed[("flow_extractor_api_throttled_total", endpoint)] == 1
+    assert parsed[("flow_extractor_api_retries_total", endpoint)] == 1
+    assert parsed[("flow_extractor_api_responses_total", f'{endpoint},status="429"')] == 1
+    assert parsed[("flow_extractor_api_latency_seconds_count", endpoint)] == 5
+    assert parsed[("flow_extractor_api_latency_seconds_bucket", f'{endpoint},le="+Inf"')] == 5
+    buckets = [value for (name, labels), value in parsed.items() if name == "flow_extractor_api_latency_seconds_bucket" and labels.startswith(endpoint)]
+    assert buckets == sorted(buckets)
+
+def test_label_values_are_escaped():
+    instrumentation = Instrumentation()
+    instrumentation.record_call('odd "label"\\path')
+    assert 'endpoint="odd \\"label\\"\\\\path"} 1' in instrumentation.to_prometheus()
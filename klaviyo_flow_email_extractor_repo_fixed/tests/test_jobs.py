@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+import zipfile
+
+import jobs
+from archive import STAGING_DIR, export_templates_zip
+from conftest import flow_pairs
+from jobs import Job, JobManager
+
+def wait_for(job, timeout=10):
+    deadline = time.monotonic() + timeout
+    while job.active and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+def until_cancelled(job, journal):
+    # Gives up after a while so a failing test cannot hang the run
+    job.add_total(1)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        job.check()
+        time.sleep(0.01)
+
+def test_eta_extrapolates_from_progress(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(jobs.time, "time", lambda: now)
+    job = Job("job", "export", "label", None, "unused")
+    job.status, job.started = "running", now
+    job.add_total(10)
+    assert job.eta() is None
+    now += 4
+    for _ in range(4):
+        job.advance()
+    assert job.eta() == 6.0
+    assert job.throughput() == 1.0
+    job.status = "succeeded"
+    assert job.eta() is None
+
+def test_running_and_queued_jobs_can_be_cancelled(tmp_path):
+    manager = JobManager(max_workers=1, jobs_dir=str(tmp_path))
+    running = manager.submit("export", "running", until_cancelled, owner="acct")
+    queued = manager.submit("export", "queued", lambda job, journal: {}, owner="acct")
+    while running.status != "running":
+        time.sleep(0.01)
+    assert manager.remove(running.id, "acct") is False
+    manager.cancel(queued.id, "acct")
+    manager.cancel(running.id, "acct")
+    assert wait_for(running).status == "cancelled"
+    assert wait_for(queued).status == "cancelled"
+    assert queued.started is None
+
+def test_remove_deletes_the_job_directory(tmp_path):
+    manager = JobManager(jobs_dir=str(tmp_path))
+    job = wait_for(manager.submit("report", "done", lambda job, journal: {"ok": True}, owner="acct"))
+    assert job.status == "succeeded" and os.path.isdir(job.directory)
+    assert manager.remove(job.id, "acct")
+    assert not os.path.exists(job.directory)
+    assert manager.get(job.id, "acct") is None and manager.list("acct") == []
+
+def test_accounts_do_not_share_job_ids(tmp_path):
+    manager = JobManager(jobs_dir=str(tmp_path))
+    release = threading.Event()
+
+    def run(job, journal):
+        release.wait(10)
+        return {"owner": job.owner}
+    first = manager.submit("export", "first", run, owner="acct-a", job_id="nightly")
+    # The same ID from another account is a different job, even while the first runs
+    second = manager.submit("export", "second", run, owner="acct-b", job_id="nightly")
+    release.set()
+    wait_for(first), wait_for(second)
+    assert first.directory != second.directory
+    assert os.path.exists(os.path.join(first.directory, "journal.jsonl"))
+    assert os.path.exists(os.path.join(second.directory, "journal.jsonl"))
+    assert manager.get("nightly", "acct-a").result == {"owner": "acct-a"}
+    assert [job.label for job in manager.list("acct-b")] == ["second"]
+
+def test_export_job_deletes_its_staging_once_packed(mock, client, tmp_path):
+    manager = JobManager(jobs_dir=str(tmp_path))
+
+    def run(job, journal):
+        path = os.path.join(job.directory, "templates.zip")
+        _, counts = export_templates_zip(client, flow_pairs(mock), path=path, journal=journal, progress=job)
+        job.artifact = path
+        return counts
+    job = wait_for(manager.submit("export", "export", run, owner="acct", job_id="export-1"))
+    assert job.result["succeeded"] == 12
+    assert not os.path.exists(os.path.join(job.directory, STAGING_DIR))
+
+    # Rerunning the finished job rebuilds a complete archive
+    mock.rendered.clear()
+    again = wait_for(manager.submit("export", "again", run, owner="acct", job_id="export-1"))
+    assert again.result["succeeded"] == 12 and len(mock.rendered) == 12
+    with zipfile.ZipFile(again.artifact) as archive:
+        assert len(archive.namelist()) == 12
@@ -0,0 +1,106 @@
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+import klaviyo_api
+from api_cache import ResponseCache
+from conftest import make_client
+from klaviyo_api import BACKOFF_BASE, BACKOFF_CAP, AdaptiveConcurrency, RateLimitScheduler, backoff_delay, get_email_content
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(klaviyo_api, "backoff_delay", lambda attempt, headers=None: 0)
+
+def test_backoff_honours_retry_after():
+    assert 3 <= backoff_delay(0, {"Retry-After": "3"}) <= 3 + BACKOFF_BASE
+    in_two_seconds = formatdate(time.time() + 2, usegmt=True)
+    assert 0.5 <= backoff_delay(0, {"Retry-After": in_two_seconds}) <= 2 + BACKOFF_BASE
+
+def test_backoff_grows_exponentially_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(klaviyo_api.random, "uniform", lambda low, high: high)
+    assert [backoff_delay(attempt) for attempt in range(4)] == [BACKOFF_BASE * 2 ** attempt for attempt in range(4)]
+    assert backoff_delay(20) == BACKOFF_CAP
+
+def test_concurrency_halves_on_throttle_and_recovers():
+    gate = AdaptiveConcurrency(8)
+    gate.on_throttle()
+    gate.on_throttle()
+    assert gate.limit == 2
+    for _ in range(5):
+        gate.on_throttle()
+    assert gate.limit == gate.minimum == 1
+    for _ in range(100):
+        gate.on_success()
+    assert gate.limit == 8
+
+def test_throttle_pauses_the_tier_for_retry_after():
+    scheduler = RateLimitScheduler(tiers={"S": (100, 6000)})
+    limit = scheduler.gate("S").limit
+    scheduler.observe("S", 429, {"Retry-After": "2"})
+    assert scheduler.gate("S").limit == limit / 2
+    assert 1.5 < scheduler.delay("S") <= 2
+
+def test_throttled_requests_are_retried(make_mock):
+    # The mock allows 4 requests a second and answers the rest 429 + Retry-After: 1
+    mock = make_mock(flows=1, actions_per_flow=8, rate_limit=4)
+    client = make_client(mock)
+    for index in range(8):
+        assert get_email_content(f"{mock.flows[0]}-A{index:03d}", client)["data"]["attributes"]["html"]
+    assert mock.stats["throttled"] > 0
+    assert client.scheduler.gate("S").limit < client.scheduler.gate("S").maximum
+    client.close()
+
+def test_retries_stop_at_max_retries(mock, no_backoff):
+    client = make_client(mock, max_retries=2)
+    mock.error_rate = 1.0
+    with pytest.raises(requests.HTTPError) as error:
+        get_email_content(f"{mock.flows[0]}-A000", client)
+    assert error.value.response.status_code == 503
+    assert mock.stats["requests"] == 3
+    client.close()
+
+def test_dropped_connections_are_retried(mock, no_backoff):
+    client = make_client(mock, max_retries=2)
+    action_id = f"{mock.flows[0]}-A000"
+    mock.dropped[action_id] = 2
+    assert get_email_content(action_id, client)["data"]["attributes"]["html"] == mock.template(action_id)
+    assert mock.rendered == [action_id] * 3
+    mock.dropped[action_id] = 3
+    with pytest.raises(requests.ConnectionError):
+        get_email_content(action_id, client, use_cache=False)
+    client.close()
+
+def test_verify_is_memoized_until_a_request_is_refused(mock, tmp_path):
+    client = make_client(mock, cache=ResponseCache(str(tmp_path / "cache.sqlite3")))
+    assert client.verify() and client.verify()
+    assert mock.stats["requests"] == 1
+    # The key check is never cached
+    assert client.cache.get(client.api_key, "v1/flows", {"page[size]": 1}) is None
+
+    mock.revoked.add(client.api_key)
+    with pytest.raises(requests.HTTPError):
+        get_email_content(f"{mock.flows[0]}-A000", client)
+    assert client.auth_verified_at is None
+    with pytest.raises(requests.HTTPError):
+        client.verify()
+    mock.revoked.clear()
+    assert client.verify()
+    # The mock counts only requests it lets through: two key checks
+    assert mock.stats["requests"] == 2
+    client.close()
+
+def test_verify_goes_back_to_the_network_after_the_ttl(mock, client):
+    assert client.verify()
+    assert client.verify(ttl=0)
+    assert mock.stats["requests"] == 2
+
+def test_uncached_requests_do_not_fill_the_cache(mock, tmp_path):
+    client = make_client(mock, cache=ResponseCache(str(tmp_path / "cache.sqlite3")))
+    endpoint = f"v1/content_actions/{mock.flows[0]}-A000/render"
+    client.request(endpoint, use_cache=False)
+    assert client.cache.get(client.api_key, endpoint) is None
+    client.request(endpoint)
+    assert client.cache.get(client.api_key, endpoint) is not None
+    client.close()
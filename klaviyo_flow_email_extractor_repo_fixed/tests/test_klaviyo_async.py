@@ -0,0 +1,70 @@
+import asyncio
+
+import klaviyo_async
+from api_cache import ResponseCache
+from klaviyo_async import AsyncKlaviyoClient, close_clients, get_client, get_email_content, get_email_contents, get_flows
+
+def test_string_keys_share_one_client_per_loop(monkeypatch):
+    used = []
+    async def request(self, endpoint, params=None):
+        used.append(self)
+        return {"data": []}
+    monkeypatch.setattr(klaviyo_async.AsyncKlaviyoClient, "request", request)
+
+    async def run():
+        await get_flows("key-a")
+        await get_email_contents(["A1", "A2", "A3"], "key-a")
+        other = get_client("key-b")
+        await close_clients()
+        return other
+
+    other = asyncio.run(run())
+    assert len(used) == 4 and all(client is used[0] for client in used)
+    assert other is not used[0] and other.scheduler is not used[0].scheduler
+    assert used[0].session.closed
+
+def test_clients_on_other_loops_share_the_scheduler():
+    async def client():
+        client = get_client("key-c")
+        await close_clients()
+        return client
+    first, second = asyncio.run(client()), asyncio.run(client())
+    assert first is not second
+    assert first.scheduler is second.scheduler
+
+def test_clients_of_closed_loops_are_released(monkeypatch):
+    monkeypatch.setattr(klaviyo_async, "_clients", {})
+    loops = []
+    async def client():
+        loops.append(asyncio.get_running_loop())
+        return get_client("key-d")
+    # Neither run calls close_clients()
+    asyncio.run(client())
+    asyncio.run(client())
+    assert list(klaviyo_async._clients) == [id(loops[1])]
+
+def test_async_client_uses_the_response_cache(mock, tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+
+    async def run():
+        async with AsyncKlaviyoClient("test-key", base_url=mock.base_url, cache=cache) as client:
+            first = await get_email_content(f"{mock.flows[0]}-A000", client)
+            second = await get_email_content(f"{mock.flows[0]}-A000", client)
+            fresh = await client.request(f"v1/content_actions/{mock.flows[0]}-A000/render", use_cache=False)
+        return first, second, fresh
+
+    first, second, fresh = asyncio.run(run())
+    assert first == second == fresh
+    assert mock.rendered == [f"{mock.flows[0]}-A000"] * 2
+
+def test_async_client_retries_dropped_connections(mock, monkeypatch):
+    monkeypatch.setattr(klaviyo_async, "backoff_delay", lambda attempt, headers=None: 0)
+    action_id = f"{mock.flows[0]}-A000"
+    mock.dropped[action_id] = 2
+
+    async def run():
+        async with AsyncKlaviyoClient("test-key", base_url=mock.base_url) as client:
+            return await get_email_content(action_id, client)
+
+    assert asyncio.run(run())["data"]["attributes"]["html"] == mock.template(action_id)
+    assert mock.rendered == [action_id] * 3
@@ -0,0 +1,37 @@
+import time
+
+import profiling
+from jobs import JobManager
+from profiling import ProfileSession, span
+
+class BusyProfile:
+    # Stands in for cProfile.Profile on Python 3.12+ while another profiler is active
+    def enable(self):
+        raise ValueError("Another profiling tool is already active")
+
+def wait_for(job, timeout=10):
+    deadline = time.monotonic() + timeout
+    while job.active and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+def test_session_falls_back_to_spans_when_profiler_is_busy(monkeypatch):
+    monkeypatch.setattr(profiling.cProfile, "Profile", BusyProfile)
+    with ProfileSession("page") as session:
+        with span("work"):
+            time.sleep(0.01)
+    assert session.profiler_error
+    assert session.hot_functions() == []
+    assert [row["Span"] for row in session.span_table()] == ["page", "work"]
+
+def test_job_fails_cleanly_when_profile_cannot_start(monkeypatch, tmp_path):
+    def broken_start(self):
+        raise RuntimeError("profiler exploded")
+    monkeypatch.setattr(ProfileSession, "start", broken_start)
+    manager = JobManager(jobs_dir=str(tmp_path))
+    job = wait_for(manager.submit("export", "profiled", lambda job, journal: {}, profile=True))
+    assert (job.status, job.error) == ("failed", "profiler exploded")
+    # Not stuck as running: it can be removed and its ID reused
+    manager.remove(job.id)
+    again = wait_for(manager.submit("export", "again", lambda job, journal: {"ok": True}, job_id=job.id))
+    assert again.status == "succeeded"
@@ -0,0 +1,37 @@
+from bulk import build_report
+from conftest import flow_pairs
+from report_manifest import ReportManifest
+
+def test_unchanged_actions_reuse_their_stored_rows(mock, client, tmp_path):
+    manifest = ReportManifest(str(tmp_path / "manifest.sqlite3"))
+    first = build_report(client, flow_pairs(mock), workers=4, analysis_workers=1, manifest=manifest)
+    assert (first["succeeded"], len(mock.rendered)) == (12, 12)
+
+    mock.rendered.clear()
+    second = build_report(client, flow_pairs(mock), workers=4, analysis_workers=1, manifest=manifest)
+    assert mock.rendered == []
+    assert second["reused"] == 12
+    assert second["rows"] == first["rows"]
+
+def test_updated_action_is_fetched_again(mock, client, tmp_path):
+    manifest = ReportManifest(str(tmp_path / "manifest.sqlite3"))
+    build_report(client, flow_pairs(mock), workers=4, analysis_workers=1, manifest=manifest)
+    changed = f"{mock.flows[1]}-A003"
+    mock.updated_at[changed] = "2024-06-01T00:00:00+00:00"
+    mock.html[changed] = "<html><body><form></form></body></html>"
+    mock.rendered.clear()
+    result = build_report(client, flow_pairs(mock), workers=4, analysis_workers=1, manifest=manifest)
+    assert mock.rendered == [changed]
+    assert (result["succeeded"], result["reused"]) == (1, 11)
+    row = next(row for row in result["rows"] if row["Flow ID"] == mock.flows[1] and row["Email"] == "Email 4")
+    assert row["Forms"] is True
+
+def test_deleted_actions_are_pruned(mock, client, tmp_path):
+    manifest = ReportManifest(str(tmp_path / "manifest.sqlite3"))
+    build_report(client, flow_pairs(mock), workers=4, analysis_workers=1, manifest=manifest)
+    updated = "2024-01-01T00:00:00+00:00"
+    assert manifest.lookup(client.api_key, mock.flows[0], f"{mock.flows[0]}-A003", updated) is not None
+    mock.actions_per_flow = 3
+    result = build_report(client, flow_pairs(mock), workers=4, analysis_workers=1, manifest=manifest)
+    assert len(result["rows"]) == 9
+    assert manifest.lookup(client.api_key, mock.flows[0], f"{mock.flows[0]}-A003", updated) is None
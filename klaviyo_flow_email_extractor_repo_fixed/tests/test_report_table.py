@@ -0,0 +1,73 @@
+import csv
+import io
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from bulk import ISSUE_COLUMNS, REPORT_COLUMNS, build_report_row, write_report
+from report_table import columnar_available, flow_summary, issue_summary, issues_by_flow, report_csv, report_frame, report_totals
+
+def row(flow_id, flow_name, email, responsive=True, forms=False, images=2):
+    structure = {
+        "total_elements": 10,
+        "elements": {"images": images, "links": 1, "tables": 1},
+        "images": {"without_alt_text": 1, "with_width_height": 0},
+        "responsiveness": {"has_media_queries": responsive, "media_query_count": int(responsive), "has_viewport_meta": True, "has_max_width": False},
+    }
+    compatibility = {
+        "general": {"has_doctype": True, "uses_html5_elements": False},
+        "layout": {"uses_tables_for_layout": True},
+        "problematic_elements": {"forms": forms, "video": False, "javascript": False, "background_images": False},
+        "recommendations": ["x"] if forms else [],
+    }
+    return build_report_row({"flow_id": flow_id, "flow_name": flow_name, "action_name": email}, structure, compatibility)
+
+ROWS = [
+    row("F1", "Welcome", "One", forms=True),
+    row("F1", "Welcome", "Two", responsive=False),
+    row("F2", "Welcome", "One", forms=True, images=4),
+    row("F3", "Winback", "One"),
+]
+
+def test_rows_have_every_column_in_order():
+    assert tuple(ROWS[0]) == REPORT_COLUMNS
+
+def test_flows_sharing_a_name_are_summarized_apart():
+    frame = report_frame(ROWS)
+    summary = flow_summary(frame)
+    assert sorted(summary["Flow"]) == ["Welcome (F1)", "Welcome (F2)", "Winback"]
+    assert summary.loc["F1", "Templates"] == 2
+    assert summary.loc["F2", "Avg. Images"] == 4
+    issues = issues_by_flow(frame)
+    assert issues.loc["Welcome (F1)", "Forms"] == 1
+    assert issues.loc["Winback", "Forms"] == 0
+
+def test_totals_and_issue_types():
+    frame = report_frame(ROWS)
+    assert report_totals(frame) == {"templates": 4, "responsive": 3, "avg_elements": 10.0, "avg_images": 2.5, "with_issues": 2}
+    issues = issue_summary(frame)
+    assert set(issues.index) == set(ISSUE_COLUMNS.values())
+    assert issues.loc["Forms", "Templates"] == 2
+    assert issues.loc["Forms", "Share (%)"] == 50.0
+
+def test_app_csv_matches_job_csv(tmp_path):
+    path = tmp_path / "report.csv"
+    write_report(str(path), ROWS)
+    with open(path, newline="") as f:
+        written = list(csv.reader(f))
+    assert list(csv.reader(io.StringIO(report_csv(report_frame(ROWS))))) == written
+    assert {line[REPORT_COLUMNS.index("Mobile Responsive")] for line in written[1:]} == {"Yes", "No"}
+
+def test_rows_without_flow_id_fall_back_to_the_name():
+    old = {key: value for key, value in ROWS[3].items() if key != "Flow ID"}
+    assert list(flow_summary(report_frame([old]))["Flow"]) == ["Winback"]
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_columnar_round_trip_keeps_types(tmp_path, fmt):
+    if not columnar_available():
+        pytest.skip("pyarrow is not installed")
+    path = tmp_path / f"report.{fmt}"
+    write_report(str(path), ROWS, fmt)
+    frame = pd.read_parquet(path) if fmt == "parquet" else pd.read_feather(path)
+    pd.testing.assert_frame_equal(frame, report_frame(ROWS))
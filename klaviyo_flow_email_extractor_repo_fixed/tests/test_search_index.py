@@ -0,0 +1,58 @@
+from api_cache import ResponseCache
+from conftest import make_client
+from search_index import SearchIndex, sync_search_index
+
+def ids(results):
+    return sorted(result["action_id"] for result in results)
+
+def test_sync_indexes_every_email(mock, client, tmp_path):
+    index = SearchIndex(str(tmp_path / "search.sqlite3"))
+    counts = sync_search_index(client, index, workers=4)
+    assert (counts["flows"], counts["succeeded"]) == (3, 12)
+    action_id = f"{mock.flows[2]}-A001"
+    assert ids(index.search(client.api_key, f'"Subject of {action_id}"')) == [action_id]
+    assert index.get_email(client.api_key, action_id)["html"] == mock.template(action_id)
+
+def test_resync_fetches_only_updated_emails(mock, client, tmp_path):
+    index = SearchIndex(str(tmp_path / "search.sqlite3"))
+    sync_search_index(client, index, workers=4)
+    changed = f"{mock.flows[0]}-A002"
+    mock.html[changed] = "<html><body><p>Winter clearance starts today</p></body></html>"
+    mock.updated_at[changed] = "2024-06-01T00:00:00+00:00"
+    mock.rendered.clear()
+    counts = sync_search_index(client, index, workers=4)
+    assert mock.rendered == [changed]
+    assert (counts["succeeded"], counts["reused"]) == (1, 11)
+    assert ids(index.search(client.api_key, "clearance")) == [changed]
+
+def test_resync_drops_deleted_emails_and_flows(mock, client, tmp_path):
+    index = SearchIndex(str(tmp_path / "search.sqlite3"))
+    sync_search_index(client, index, workers=4)
+    removed_flow = mock.flows.pop()
+    mock.actions_per_flow = 3
+    sync_search_index(client, index, workers=4)
+    assert [flow_id for flow_id, _ in index.flows(client.api_key)] == mock.flows
+    assert index.stats(client.api_key)["emails"] == 6
+    assert index.get_email(client.api_key, f"{mock.flows[0]}-A003") is None
+    assert index.search(client.api_key, removed_flow) == []
+
+def test_accounts_are_kept_apart(mock, client, tmp_path):
+    index = SearchIndex(str(tmp_path / "search.sqlite3"))
+    sync_search_index(client, index, workers=4)
+    assert index.stats("other-key")["emails"] == 0
+    assert index.search("other-key", "Subject") == []
+
+def test_full_sync_bypasses_the_response_cache(mock, tmp_path):
+    client = make_client(mock, cache=ResponseCache(str(tmp_path / "cache.sqlite3")))
+    index = SearchIndex(str(tmp_path / "search.sqlite3"))
+    sync_search_index(client, index, workers=4)
+    # Edited without a new `updated` timestamp: only a full sync notices
+    changed = f"{mock.flows[1]}-A000"
+    mock.html[changed] = "<html><body><p>Spring lookbook</p></body></html>"
+    sync_search_index(client, index, workers=4)
+    assert index.search(client.api_key, "lookbook") == []
+    mock.rendered.clear()
+    counts = sync_search_index(client, index, workers=4, full=True)
+    assert counts["succeeded"] == 12 and len(mock.rendered) == 12
+    assert ids(index.search(client.api_key, "lookbook")) == [changed]
+    client.close()
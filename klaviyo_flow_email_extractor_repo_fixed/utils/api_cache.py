@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "flow-extractor", "api_cache.sqlite3")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Cache hits record their access time in memory and write it back in
+# batches of this many, so reads do not take SQLite's write lock each time
+TOUCH_BATCH = 64
+
+# Seconds each endpoint stays fresh; the first matching pattern wins.
+DEFAULT_TTLS = [
+    (re.compile(r"^v1/content_actions/[^/]+/render"), 24 * 3600),
+    (re.compile(r"^v1/flows/[^/]+/actions"), 15 * 60),
+    (re.compile(r"^v1/flows/[^/]+/metrics"), 10 * 60),
+    (re.compile(r"^v1/metrics"), 10 * 60),
+    (re.compile(r"^v1/flows"), 5 * 60),
+]
+
+FLOW_PATH = re.compile(r"^v1/flows/([^/?]+)")
+RENDER_PATH = re.compile(r"^v1/content_actions/([^/?]+)/render")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    account TEXT NOT NULL,
+    flow_id TEXT,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_flow ON entries (account, flow_id);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS flow_versions (
+    account TEXT NOT NULL,
+    flow_id TEXT NOT NULL,
+    updated TEXT,
+    PRIMARY KEY (account, flow_id)
+);
+CREATE TABLE IF NOT EXISTS action_flows (
+    account TEXT NOT NULL,
+    action_id TEXT NOT NULL,
+    flow_id TEXT NOT NULL,
+    PRIMARY KEY (account, action_id)
+);
+"""
+
+def account_hash(api_key):
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+class ResponseCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, ttls=DEFAULT_TTLS):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        # Running total of entry sizes, kept up to date on every write and
+        # delete; recounted before evicting in case another process wrote too
+        self.total = self._count()
+        self.touched = {}
+
+    def _count(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _delete(self, where, params):
+        self.total -= self.conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM entries WHERE {where}", params).fetchone()[0]
+        self.conn.execute(f"DELETE FROM entries WHERE {where}", params)
+
+    def _flush_touched(self):
+        if self.touched:
+            self.conn.executemany("UPDATE entries SET accessed = ? WHERE key = ?", [(accessed, key) for key, accessed in self.touched.items()])
+            self.touched = {}
+
+    def _path(self, endpoint):
+        path = endpoint.split("?", 1)[0]
+        if "://" in path:
+            path = path.split("/api/", 1)[-1]
+        return path.lstrip("/")
+
+    def ttl_for(self, endpoint):
+        path = self._path(endpoint)
+        for pattern, ttl in self.ttls:
+            if pattern.match(path):
+                return ttl
+        return 0
+
+    def _key(self, account, endpoint, params):
+        return f"{account}:{endpoint}:{json.dumps(params or {}, sort_keys=True)}"
+
+    def get(self, api_key, endpoint, params=None):
+        account = account_hash(api_key)
+        key = self._key(account, endpoint, params)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT body, expires FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self.touched.pop(key, None)
+                self._delete("key = ?", (key,))
+                return None
+            self.touched[key] = now
+            if len(self.touched) >= TOUCH_BATCH:
+                self._flush_touched()
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, api_key, endpoint, params, value):
+        ttl = self.ttl_for(endpoint)
+        if ttl <= 0:
+            return
+        account = account_hash(api_key)
+        path = self._path(endpoint)
+        body = zlib.compress(json.dumps(value).encode("utf-8"))
+        now = time.time()
+        with self.lock:
+            if path == "v1/flows":
+                self._check_flow_versions(account, value.get("data") or [])
+            flow_id = self._flow_for(account, path)
+            if re.match(r"^v1/flows/[^/]+/actions", path):
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO action_flows (account, action_id, flow_id) VALUES (?, ?, ?)",
+                    [(account, action.get("id"), flow_id) for action in value.get("data") or [] if action.get("id")],
+                )
+            key = self._key(account, endpoint, params)
+            self._delete("key = ?", (key,))
+            self.conn.execute(
+                "INSERT INTO entries (key, account, flow_id, body, size, expires, accessed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, account, flow_id, body, len(body), now + ttl, now),
+            )
+            self.total += len(body)
+            self.touched.pop(key, None)
+            if self.total > self.max_bytes:
+                self._evict()
+
+    def _flow_for(self, account, path):
+        match = FLOW_PATH.match(path)
+        if match:
+            return match.group(1)
+        match = RENDER_PATH.match(path)
+        if match:
+            row = self.conn.execute(
+                "SELECT flow_id FROM action_flows WHERE account = ? AND action_id = ?", (account, match.group(1))
+            ).fetchone()
+            return row[0] if row else None
+        return None
+
+    def _check_flow_versions(self, account, flows):
+        # A flow whose `updated` timestamp moved drops every cached response
+        # tagged with it: its actions, metrics and the renders of its actions.
+        for flow in flows:
+            flow_id = flow.get("id")
+            updated = (flow.get("attributes") or {}).get("updated")
+            if not flow_id:
+                continue
+            row = self.conn.execute(
+                "SELECT updated FROM flow_versions WHERE account = ? AND flow_id = ?", (account, flow_id)
+            ).fetchone()
+            if row is not None and row[0] != updated:
+                self._delete("account = ? AND flow_id = ?", (account, flow_id))
+            if row is None or row[0] != updated:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO flow_versions (account, flow_id, updated) VALUES (?, ?, ?)",
+                    (account, flow_id, updated),
+                )
+
+    def _evict(self):
+        # Least recently used first; pending access times are written first
+        # so recent hits are not evicted
+        self._flush_touched()
+        self.total = self._count()
+        for key, size in self.conn.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            if self.total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.total -= size
+
+    def invalidate_flow(self, api_key, flow_id):
+        with self.lock:
+            self._delete("account = ? AND flow_id = ?", (account_hash(api_key), flow_id))
+
+    def clear(self, api_key=None):
+        with self.lock:
+            if api_key is None:
+                self._delete("1", ())
+            else:
+                self._delete("account = ?", (account_hash(api_key),))
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+def get_default_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(os.environ.get("FLOW_EXTRACTOR_CACHE", DEFAULT_CACHE_PATH))
+        return _default_cache
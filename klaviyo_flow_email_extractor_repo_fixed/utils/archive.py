@@ -0,0 +1,161 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+
+from bulk import DEFAULT_WORKERS, iter_templates
+from html_utils import content_hash
+from profiling import span
+
+COMPRESSION_LEVELS = {
+    "Stored (no compression)": (zipfile.ZIP_STORED, None),
+    "Fast": (zipfile.ZIP_DEFLATED, 1),
+    "Balanced": (zipfile.ZIP_DEFLATED, 6),
+    "Smallest": (zipfile.ZIP_DEFLATED, 9),
+}
+DEFAULT_COMPRESSION = "Balanced"
+
+# Dedup archives keep each distinct body once under BLOBS_DIR and describe
+# where every action's template lives in MANIFEST_NAME.
+BLOBS_DIR = "templates"
+MANIFEST_NAME = "manifest.json"
+# Resumable ZIP exports stage templates here, inside the job's directory,
+# and pack the archive once every action is in the journal. The staged
+# files are deleted once an archive with no failures has been written.
+STAGING_DIR = "files"
+
+UNSAFE_NAME_CHARS = re.compile(r"[\s/\\:*?\"<>|]+")
+
+def safe_name(name):
+    return UNSAFE_NAME_CHARS.sub("_", name).strip("._") or "unnamed"
+
+def template_path(item, include_flow_dir=True):
+    filename = f"{safe_name(item['action_name'])}.html"
+    return f"{safe_name(item['flow_name'])}/{filename}" if include_flow_dir else filename
+
+def unique_path(path, used, action_id):
+    # Actions whose names collapse to the same filename get their action ID
+    # appended instead of overwriting each other.
+    if path in used:
+        stem, ext = os.path.splitext(path)
+        path = f"{stem}_{safe_name(action_id)}{ext}"
+        counter = 2
+        while path in used:
+            path = f"{stem}_{safe_name(action_id)}_{counter}{ext}"
+            counter += 1
+    used.add(path)
+    return path
+
+def tally(counts, item):
+    counts[item["status"]] = counts.get(item["status"], 0) + 1
+    if item["status"] == "failed":
+        counts["errors"].append({"flow_id": item["flow_id"], "action_id": item["action_id"], "error": item["error"]})
+    if item.get("resumed"):
+        counts["resumed"] = counts.get("resumed", 0) + 1
+
+def write_templates_zip(zip_file, items, include_flow_dir=True, dedup=False):
+    # Consumes items one at a time and drops each body once it is written,
+    # so memory is bounded by a single template rather than the archive.
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0, "resumed": 0, "unique": 0, "errors": []}
+    used = set()
+    blobs = set()
+    manifest = []
+    for item in items:
+        tally(counts, item)
+        if item["status"] != "succeeded":
+            continue
+        path = unique_path(template_path(item, include_flow_dir), used, item["action_id"])
+        with span("archive write"):
+            if dedup:
+                digest = content_hash(item["html"])
+                if digest not in blobs:
+                    blobs.add(digest)
+                    zip_file.writestr(f"{BLOBS_DIR}/{digest}.html", item["html"])
+                manifest.append({
+                    "path": path,
+                    "hash": digest,
+                    "flow_id": item["flow_id"],
+                    "flow_name": item["flow_name"],
+                    "action_id": item["action_id"],
+                    "action_name": item["action_name"],
+                })
+            else:
+                zip_file.writestr(path, item["html"])
+        item["html"] = ""
+    counts["unique"] = len(blobs) if dedup else counts["succeeded"]
+    if dedup:
+        zip_file.writestr(MANIFEST_NAME, json.dumps({"blobs_dir": BLOBS_DIR, "templates": manifest}, indent=2))
+    return counts
+
+def stage_templates(api_key, flows, directory, workers=DEFAULT_WORKERS, include_flow_dir=True, journal=None, load=False, progress=None):
+    # Writes each template under `directory` as it arrives and yields items in
+    # flow/action order. With a journal, actions finished by an earlier run of
+    # the job are not fetched again; with load=True their body is read back
+    # from the staged file so the item looks freshly fetched.
+    # Every staged path in the journal is reserved up front: a fresh action
+    # that arrives before a journaled one must not take (and overwrite) its file.
+    # A journaled action whose file is gone (the staging of a finished
+    # archive is deleted) is fetched again.
+    def staged(record):
+        return record is not None and (not record.get("path") or os.path.exists(os.path.join(directory, record["path"])))
+
+    used = set()
+    reuse = None
+    if journal is not None:
+        used = {record["path"] for record in journal.records.values() if record.get("path") and staged(record)}
+
+        def reuse(item):
+            record = journal.lookup(item)
+            return record if staged(record) else None
+    for item in iter_templates(api_key, flows, workers, reuse=reuse, ordered=True, progress=progress):
+        if item["status"] == "reused":
+            record = item["result"]
+            item.update(status=record["status"], resumed=True)
+            if record.get("path"):
+                if load:
+                    with open(os.path.join(directory, record["path"]), encoding="utf-8") as f:
+                        item["html"] = f.read()
+        elif item["status"] == "succeeded":
+            path = unique_path(template_path(item, include_flow_dir), used, item["action_id"])
+            target = os.path.join(directory, path)
+            with span("archive stage"):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, "w", encoding="utf-8") as f:
+                    f.write(item["html"])
+            if journal is not None:
+                journal.record(item, path=path)
+            if not load:
+                item["html"] = ""
+        elif item["status"] == "skipped" and journal is not None:
+            journal.record(item, path=None)
+        yield item
+
+def export_templates_zip(api_key, flows, path=None, workers=DEFAULT_WORKERS, compression=DEFAULT_COMPRESSION, include_flow_dir=True, dedup=False, journal=None, progress=None):
+    # Streams templates, in deterministic order, straight into a ZIP on disk
+    # and returns its path with the per-status counts. A journaled export
+    # stages templates first so an interrupted job can resume.
+    method, level = COMPRESSION_LEVELS[compression]
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix="flow-templates-", suffix=".zip")
+        os.close(fd)
+    if journal is None:
+        items = iter_templates(api_key, flows, workers, ordered=True, progress=progress)
+    else:
+        staging = os.path.join(journal.directory, STAGING_DIR)
+        items = stage_templates(api_key, flows, staging, workers, include_flow_dir, journal, True, progress)
+    with zipfile.ZipFile(path, "w", method, compresslevel=level) as zip_file:
+        counts = write_templates_zip(zip_file, items, include_flow_dir, dedup)
+    # Keep the staging while there is something left to resume
+    if journal is not None and not counts["failed"]:
+        shutil.rmtree(staging, ignore_errors=True)
+    return path, counts
+
+def export_templates_dir(api_key, flows, directory, workers=DEFAULT_WORKERS, include_flow_dir=True, journal=None, progress=None):
+    # Same layout as the non-dedup archive, written as plain files.
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0, "resumed": 0, "errors": []}
+    for item in stage_templates(api_key, flows, directory, workers, include_flow_dir, journal, progress=progress):
+        tally(counts, item)
+    counts["unique"] = counts["succeeded"]
+    return counts
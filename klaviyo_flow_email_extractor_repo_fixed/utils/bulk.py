@@ -0,0 +1,380 @@
+import csv
+import heapq
+import json
+import math
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from klaviyo_api import get_client, get_email_content, iter_flow_actions
+from html_utils import analysis_key, analyze_template, content_hash, extract_html, get_analysis_cache, get_backend, message_attributes
+from profiling import bind, span
+
+DEFAULT_WORKERS = 8
+# Each analysis process re-imports the parsers, so more than this rarely pays
+MAX_ANALYSIS_WORKERS = 8
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+
+def available_cpus(cgroup_cpu_max=CGROUP_CPU_MAX):
+    # CPUs this process may actually use. os.cpu_count() reports the host's,
+    # which in a container (or on Streamlit Cloud) can be far more than its
+    # affinity mask or cgroup CPU quota allows.
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    try:
+        with open(cgroup_cpu_max) as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            count = min(count, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, count)
+
+DEFAULT_ANALYSIS_WORKERS = min(available_cpus(), MAX_ANALYSIS_WORKERS)
+# Renders in flight or held for ordering, per worker; bounds how many
+# template bodies a run holds while an earlier render is slow or throttled
+RENDER_WINDOW_PER_WORKER = 4
+
+def _fetch_template(client, action_id, process, attributes=(), use_cache=True):
+    message = get_email_content(action_id, client, use_cache)
+    html = extract_html(message)
+    extra = {name: message_attributes(message).get(name) for name in attributes}
+    return html, process(html) if html and process else None, extra
+
+class _Reorder:
+    # Releases items in (flow_index, action_index) order while only holding
+    # the ones that completed ahead of an earlier, still pending item.
+    def __init__(self):
+        self.expected = {}
+        self.buffer = {}
+        self.flow = 0
+
+    def expect(self, flow_index, keys):
+        self.expected[flow_index] = deque(keys)
+        return self.drain()
+
+    def push(self, item):
+        self.buffer[item["order"]] = item
+        return self.drain()
+
+    def drain(self):
+        released = []
+        while self.flow in self.expected:
+            keys = self.expected[self.flow]
+            while keys and keys[0] in self.buffer:
+                released.append(self.buffer.pop(keys.popleft()))
+            if keys:
+                break
+            del self.expected[self.flow]
+            self.flow += 1
+        return released
+
+class _Unordered:
+    def expect(self, flow_index, keys):
+        return []
+
+    def push(self, item):
+        return [item]
+
+def iter_templates(api_key, flows, workers=DEFAULT_WORKERS, process=None, reuse=None, ordered=False, progress=None, attributes=(), use_cache=True):
+    # flows is any iterable of (flow_id, flow_name); action lists for every
+    # flow and the renders for every action share one worker pool. Items are
+    # tagged with a (flow_index, action_index) order and yielded as they
+    # complete, or in that order when ordered=True.
+    # When reuse(item) returns a stored result the render is not fetched.
+    # Message attributes named in `attributes` (e.g. "subject") are copied
+    # onto each fetched item. use_cache=False fetches every render from the
+    # API even when the client's response cache holds a copy.
+    # progress, if given, is told about every expected and finished item and
+    # its check() may raise to stop the run.
+    # Renders are submitted lowest order first, and only while fewer than
+    # RENDER_WINDOW_PER_WORKER * workers are in flight or waiting to be
+    # released, so one slow render cannot make the run buffer the rest.
+    for item in _iter_templates(api_key, flows, workers, process, reuse, ordered, progress, attributes, use_cache):
+        if progress is not None:
+            progress.advance(item["status"] == "failed")
+        yield item
+
+def _iter_templates(api_key, flows, workers, process, reuse, ordered, progress, attributes, use_cache):
+    client = get_client(api_key)
+    output = _Reorder() if ordered else _Unordered()
+    fetch_actions = bind(lambda flow_id: list(iter_flow_actions(flow_id, client)))
+    fetch_template = bind(_fetch_template)
+    window = max(1, workers) * RENDER_WINDOW_PER_WORKER
+    waiting = []
+    outstanding = set()
+
+    def submit_renders():
+        # The lowest waiting render may always go when it is ahead of every
+        # outstanding one: the items held for ordering are waiting on it.
+        while waiting and (len(outstanding) < window or waiting[0][0] < min(outstanding)):
+            order, child = heapq.heappop(waiting)
+            outstanding.add(order)
+            pending[pool.submit(fetch_template, client, child["action_id"], process, attributes, use_cache)] = ("template", child)
+
+    def release(items):
+        for released in items:
+            outstanding.discard(released["order"])
+            yield released
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        for flow_index, (flow_id, flow_name) in enumerate(flows):
+            future = pool.submit(fetch_actions, flow_id)
+            pending[future] = ("actions", {"order": (flow_index, -1), "flow_id": flow_id, "flow_name": flow_name})
+        try:
+            while pending or waiting:
+                submit_renders()
+                if progress is not None:
+                    progress.check()
+                # With progress, wake up regularly so a cancel is noticed
+                done, _ = wait(pending, timeout=1 if progress is not None else None, return_when=FIRST_COMPLETED)
+                for future in done:
+                    kind, item = pending.pop(future)
+                    try:
+                        value = future.result()
+                    except Exception as e:
+                        if kind == "actions":
+                            item = dict(item, action_id=None, action_name=None)
+                            if progress is not None:
+                                progress.add_total(1)
+                            yield from release(output.expect(item["order"][0], [item["order"]]))
+                        yield from release(output.push(dict(item, html="", result=None, status="failed", error=str(e))))
+                        continue
+                    if kind == "actions":
+                        children = []
+                        for action_index, action in enumerate(value):
+                            action_id = action.get("id")
+                            if not action_id:
+                                continue
+                            fields = action.get("attributes") or {}
+                            children.append(dict(
+                                item,
+                                order=(item["order"][0], action_index),
+                                action_id=action_id,
+                                action_name=fields.get("name") or "Unnamed Email",
+                                updated=fields.get("updated"),
+                            ))
+                        if progress is not None:
+                            progress.add_total(len(children))
+                        yield from release(output.expect(item["order"][0], [child["order"] for child in children]))
+                        for child in children:
+                            stored = reuse(child) if reuse else None
+                            if stored is not None:
+                                yield from release(output.push(dict(child, html="", result=stored, status="reused", error=None)))
+                                continue
+                            heapq.heappush(waiting, (child["order"], child))
+                    else:
+                        html, result, extra = value
+                        yield from release(output.push(dict(item, html=html, result=result, status="succeeded" if html else "skipped", error=None, **extra)))
+        finally:
+            # Stopped early (cancelled or abandoned): don't wait for queued fetches
+            for future in pending:
+                future.cancel()
+
+def summarize(items):
+    items = sorted(items, key=lambda item: item["order"])
+    return {
+        "items": items,
+        "succeeded": sum(1 for item in items if item["status"] == "succeeded"),
+        "failed": sum(1 for item in items if item["status"] == "failed"),
+        "skipped": sum(1 for item in items if item["status"] == "skipped"),
+        "reused": sum(1 for item in items if item["status"] == "reused"),
+    }
+
+def fetch_templates(api_key, flows, workers=DEFAULT_WORKERS, process=None):
+    return summarize(iter_templates(api_key, flows, workers, process))
+
+# One boolean report column per problematic element type
+ISSUE_COLUMNS = {
+    "background_images": "Background Images",
+    "forms": "Forms",
+    "video": "Video",
+    "javascript": "JavaScript",
+}
+
+def build_report_row(item, structure, compatibility):
+    images = structure["images"]
+    responsiveness = structure["responsiveness"]
+    problems = compatibility["problematic_elements"]
+    row = {
+        "Flow ID": item["flow_id"],
+        "Flow": item["flow_name"],
+        "Email": item["action_name"],
+        "Elements": structure["total_elements"],
+        "Images": structure["elements"]["images"],
+        "Links": structure["elements"]["links"],
+        "Tables": structure["elements"]["tables"],
+        "Mobile Responsive": "Yes" if responsiveness["has_media_queries"] else "No",
+        "Issues": len([i for i, v in problems.items() if v]),
+        "Recommendations": len(compatibility["recommendations"]),
+        "Images Without Alt": images["without_alt_text"],
+        "Images With Size": images["with_width_height"],
+        "Media Queries": responsiveness["media_query_count"],
+        "Viewport Meta": responsiveness["has_viewport_meta"],
+        "Max Width": responsiveness["has_max_width"],
+        "Doctype": compatibility["general"]["has_doctype"],
+        "HTML5 Elements": compatibility["general"]["uses_html5_elements"],
+        "Table Layout": compatibility["layout"]["uses_tables_for_layout"],
+    }
+    for key, column in ISSUE_COLUMNS.items():
+        row[column] = bool(problems.get(key))
+    return row
+
+# Column order of a report row; flow names are not unique, so rows carry the ID
+IDENTITY_COLUMNS = ("Flow ID", "Flow", "Email")
+REPORT_COLUMNS = IDENTITY_COLUMNS + (
+    "Elements", "Images", "Links", "Tables", "Mobile Responsive", "Issues", "Recommendations",
+    "Images Without Alt", "Images With Size", "Media Queries", "Viewport Meta", "Max Width", "Doctype",
+    "HTML5 Elements", "Table Layout",
+) + tuple(ISSUE_COLUMNS.values())
+
+def current_row(row):
+    # Stored rows from before a metric column was added are rebuilt rather
+    # than reused; an empty row (no HTML) is always current. Identity columns
+    # are filled in from the action on reuse.
+    return row if not row or all(column in row for column in REPORT_COLUMNS if column not in IDENTITY_COLUMNS) else None
+
+_analysis_pool = None
+_analysis_pool_lock = threading.Lock()
+
+def get_analysis_pool():
+    # Parsing is CPU-bound and holds the GIL, so analysis runs in worker
+    # processes, one per usable CPU; "spawn" avoids forking a threaded server. The
+    # pool is shared by every report in the process (concurrent jobs and
+    # sessions) and never resized, so one report cannot cancel another's
+    # queued analyses; each report limits its own share instead.
+    global _analysis_pool
+    with _analysis_pool_lock:
+        if _analysis_pool is None:
+            _analysis_pool = ProcessPoolExecutor(max_workers=DEFAULT_ANALYSIS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _analysis_pool
+
+def reset_analysis_pool(pool=None):
+    # Shuts the shared pool down; with `pool`, only if it is still the shared
+    # one (a report that saw it break must not drop a replacement).
+    global _analysis_pool
+    with _analysis_pool_lock:
+        if _analysis_pool is not None and (pool is None or pool is _analysis_pool):
+            _analysis_pool.shutdown(wait=False, cancel_futures=True)
+            _analysis_pool = None
+
+def _record_flow_ids(flows, flow_ids):
+    for flow_id, flow_name in flows:
+        flow_ids.append(flow_id)
+        yield flow_id, flow_name
+
+def build_report(api_key, flows, workers=DEFAULT_WORKERS, analysis_workers=DEFAULT_ANALYSIS_WORKERS, manifest=None, journal=None, progress=None, on_row=None):
+    # Templates already analyzed (by content hash) never reach the pool. With
+    # a manifest, actions whose `updated` timestamp is unchanged since the
+    # last run reuse their stored row and are not fetched at all. With a
+    # checkpoint journal, each row is logged as soon as it is ready and a
+    # rerun of the same job reuses every logged row. on_row(row) is called as
+    # each row becomes ready, in completion order. At most analysis_workers
+    # of this report's analyses are queued in the shared pool at a time.
+    client = get_client(api_key)
+    cache = get_analysis_cache()
+    flow_ids = []
+    reuse = None
+    if manifest is not None or journal is not None:
+        def reuse(item):
+            record = journal.lookup(item) if journal is not None else None
+            if record is not None and current_row(record["row"]) is not None:
+                return record["row"]
+            if manifest is not None:
+                return current_row(manifest.lookup(client.api_key, item["flow_id"], item["action_id"], item["updated"]))
+            return None
+
+    def finish(item):
+        if item["status"] == "succeeded":
+            item["row"] = build_report_row(item, item["result"]["structure"], item["result"]["compatibility"])
+        elif item["status"] == "reused":
+            # An empty stored row marks an action that had no HTML last time
+            item["row"] = {"Flow ID": item["flow_id"], **item["result"], "Flow": item["flow_name"], "Email": item["action_name"]} if item["result"] else None
+        elif item["status"] == "skipped":
+            item["row"] = {}
+        if journal is not None and item["status"] in ("succeeded", "skipped"):
+            journal.record(item, row=item["row"])
+        if on_row is not None and item.get("row"):
+            on_row(item["row"])
+
+    def collect(item, future, pool):
+        try:
+            with span("analysis wait"):
+                item["result"] = future.result()
+            cache.set(analysis_key(item["content_hash"], backend), item["result"])
+        except BrokenProcessPool as e:
+            reset_analysis_pool(pool)
+            item.update(status="failed", result=None, error=str(e))
+        except Exception as e:
+            item.update(status="failed", result=None, error=str(e))
+        finish(item)
+
+    # Worker processes pick their own default backend, so pass this one on
+    backend = get_backend()
+    items = []
+    analyses = []
+    in_flight = {}
+    running = set()
+    for item in iter_templates(client, _record_flow_ids(flows, flow_ids), workers, reuse=reuse, progress=progress):
+        items.append(item)
+        if item["status"] == "succeeded":
+            digest = item["content_hash"] = content_hash(item["html"])
+            item["result"] = cache.get(analysis_key(digest, backend))
+            if item["result"] is None:
+                if digest not in in_flight:
+                    if len(running) >= analysis_workers:
+                        with span("analysis wait"):
+                            wait(running, return_when=FIRST_COMPLETED)
+                        running = {future for future in running if not future.done()}
+                    pool = get_analysis_pool()
+                    try:
+                        future = pool.submit(analyze_template, item["html"], backend)
+                    except BrokenProcessPool:
+                        reset_analysis_pool(pool)
+                        pool = get_analysis_pool()
+                        future = pool.submit(analyze_template, item["html"], backend)
+                    in_flight[digest] = (future, pool)
+                    running.add(future)
+                analyses.append((item, *in_flight[digest]))
+            else:
+                finish(item)
+        else:
+            finish(item)
+        # The body is in the pool (or already analyzed); keep only metadata,
+        # the hash and the row so a large account is never held in memory
+        item.pop("html", None)
+        # Hand out finished analyses while fetching continues
+        for entry in [entry for entry in analyses if entry[1].done()]:
+            collect(*entry)
+            analyses.remove(entry)
+    for entry in analyses:
+        collect(*entry)
+    if manifest is not None:
+        manifest.store(client.api_key, [item for item in items if item["status"] in ("succeeded", "skipped")])
+        failed_flows = {item["flow_id"] for item in items if item["action_id"] is None}
+        for flow_id in flow_ids:
+            if flow_id not in failed_flows:
+                manifest.prune(client.api_key, flow_id, {item["action_id"] for item in items if item["flow_id"] == flow_id})
+    result = summarize(items)
+    result["rows"] = [item["row"] for item in result["items"] if item["status"] in ("succeeded", "reused") and item["row"]]
+    return result
+
+def write_report(path, rows, fmt="csv"):
+    if fmt in ("parquet", "arrow"):
+        from report_table import report_frame, write_columnar
+        write_columnar(report_frame(rows), path, fmt)
+        return
+    if fmt == "json":
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        return
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else list(REPORT_COLUMNS))
+        writer.writeheader()
+        writer.writerows(rows)
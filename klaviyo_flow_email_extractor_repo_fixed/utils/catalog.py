@@ -0,0 +1,139 @@
+import threading
+import time
+
+from klaviyo_api import iter_flow_actions, iter_flows
+
+# Matches the response cache's freshness for the flow list
+CATALOG_MAX_AGE = 5 * 60
+
+def _flow_record(flow):
+    attributes = flow.get("attributes") or {}
+    return {
+        "id": flow["id"],
+        "name": attributes.get("name") or "Unnamed Flow",
+        "status": attributes.get("status", "Unknown"),
+        "created": attributes.get("created", "Unknown"),
+        "updated": attributes.get("updated", "Unknown"),
+        "trigger_type": attributes.get("trigger_type", "Unknown"),
+    }
+
+def _action_record(action):
+    attributes = action.get("attributes") or {}
+    return {
+        "id": action["id"],
+        "name": attributes.get("name") or "Unnamed Email",
+        "type": attributes.get("action_type", "Unknown"),
+        "status": attributes.get("status", "Unknown"),
+        "created": attributes.get("created", "Unknown"),
+        "updated": attributes.get("updated", "Unknown"),
+    }
+
+class _Index:
+    # Records by id plus ids by name; names are not unique, so labels of
+    # duplicated names carry the id.
+    def __init__(self, records):
+        self.by_id = {record["id"]: record for record in records}
+        self.ids_by_name = {}
+        for record in self.by_id.values():
+            self.ids_by_name.setdefault(record["name"], []).append(record["id"])
+        self.labels = {
+            record_id: record["name"] if len(self.ids_by_name[record["name"]]) == 1 else f"{record['name']} ({record_id})"
+            for record_id, record in self.by_id.items()
+        }
+
+class FlowCatalog:
+    # Built once per fetch of the flow list and shared by every page: O(1)
+    # lookups by flow ID and by name, selectbox labels, and each flow's email
+    # actions, fetched the first time they are needed.
+    def __init__(self, flows, api_key=None):
+        self.api_key = api_key
+        self.fetched_at = time.monotonic()
+        self.index = _Index([_flow_record(flow) for flow in flows if flow.get("type") == "flow" and flow.get("id")])
+        self.rows = [
+            {
+                "ID": record["id"],
+                "Name": record["name"],
+                "Status": record["status"],
+                "Created": record["created"],
+                "Updated": record["updated"],
+                "Trigger Type": record["trigger_type"],
+            }
+            for record in self.index.by_id.values()
+        ]
+        self.actions = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def fetch(cls, api_key):
+        return cls(iter_flows(api_key), api_key)
+
+    def stale(self, max_age=CATALOG_MAX_AGE):
+        return time.monotonic() - self.fetched_at > max_age
+
+    def __len__(self):
+        return len(self.index.by_id)
+
+    def __iter__(self):
+        return iter(self.index.by_id)
+
+    def __contains__(self, flow_id):
+        return flow_id in self.index.by_id
+
+    def ids(self):
+        return list(self.index.by_id)
+
+    def get(self, flow_id):
+        return self.index.by_id.get(flow_id)
+
+    def name(self, flow_id):
+        return self.index.by_id[flow_id]["name"]
+
+    def label(self, flow_id):
+        return self.index.labels[flow_id]
+
+    def ids_for(self, name):
+        return list(self.index.ids_by_name.get(name, ()))
+
+    def pairs(self, flow_ids=None):
+        # (flow_id, flow_name) in catalog order, as the bulk engine takes them
+        return [(flow_id, self.name(flow_id)) for flow_id in (self.index.by_id if flow_ids is None else flow_ids)]
+
+    def action_index(self, flow_id):
+        with self.lock:
+            index = self.actions.get(flow_id)
+        if index is None:
+            actions = [_action_record(action) for action in iter_flow_actions(flow_id, self.api_key) if action.get("id")]
+            index = _Index(actions)
+            with self.lock:
+                index = self.actions.setdefault(flow_id, index)
+        return index
+
+    def action_ids(self, flow_id):
+        return list(self.action_index(flow_id).by_id)
+
+    def action(self, flow_id, action_id):
+        return self.action_index(flow_id).by_id.get(action_id)
+
+    def action_label(self, flow_id, action_id):
+        return self.action_index(flow_id).labels[action_id]
+
+    def action_rows(self, flow_id):
+        return [
+            {
+                "ID": action["id"],
+                "Name": action["name"],
+                "Type": action["type"],
+                "Status": action["status"],
+                "Created": action["created"],
+                "Updated": action["updated"],
+            }
+            for action in self.action_index(flow_id).by_id.values()
+        ]
+
+    def invalidate(self, flow_id=None):
+        # Drops loaded action lists, for one flow or all of them
+        with self.lock:
+            if flow_id is None:
+                self.actions.clear()
+            else:
+                self.actions.pop(flow_id, None)
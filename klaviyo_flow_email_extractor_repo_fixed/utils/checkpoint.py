@@ -0,0 +1,101 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_JOBS_DIR = os.path.join(os.path.expanduser("~"), ".cache", "flow-extractor", "jobs")
+
+JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,127}$")
+
+def get_jobs_dir(account=None):
+    # With an account (see api_cache.account_hash), that account's own
+    # directory: job IDs are only unique within one account.
+    jobs_dir = os.environ.get("FLOW_EXTRACTOR_JOBS", DEFAULT_JOBS_DIR)
+    return os.path.join(jobs_dir, account) if account else jobs_dir
+
+def new_job_id(kind):
+    return f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}-{os.urandom(3).hex()}"
+
+class CheckpointJournal:
+    # Append-only JSON-lines log of finished actions for one job. Each line
+    # is flushed as it is written, so after a crash or restart a rerun with
+    # the same job ID only redoes actions that never made it into the log.
+    # A torn last line from an interrupted write is ignored on load.
+    def __init__(self, job_id, kind, jobs_dir=None):
+        if not JOB_ID_PATTERN.match(job_id):
+            raise ValueError(f"Invalid job ID {job_id!r}: use letters, digits, '.', '_' or '-'")
+        self.job_id = job_id
+        self.kind = kind
+        self.directory = os.path.join(jobs_dir or get_jobs_dir(), job_id)
+        self.path = os.path.join(self.directory, "journal.jsonl")
+        self.lock = threading.Lock()
+        self.records = {}
+        os.makedirs(self.directory, exist_ok=True)
+        header = self._load()
+        if header is not None and header.get("kind") != kind:
+            raise ValueError(f"Job {job_id!r} is a {header.get('kind')} job, not {kind}")
+        self.file = open(self.path, "a", encoding="utf-8")
+        if self.file.tell() and not self._ends_with_newline():
+            self.file.write("\n")
+        if header is None:
+            self._append({"job_id": job_id, "kind": kind, "created": time.time()})
+
+    def _load(self):
+        header = None
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if "kind" in record:
+                    header = record
+                elif "action_id" in record:
+                    self.records[(record["flow_id"], record["action_id"])] = record
+        return header
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _append(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def lookup(self, item):
+        return self.records.get((item["flow_id"], item["action_id"]))
+
+    def record(self, item, **fields):
+        record = dict(fields, flow_id=item["flow_id"], action_id=item["action_id"], status=item["status"])
+        with self.lock:
+            self.records[(record["flow_id"], record["action_id"])] = record
+            self._append(record)
+        return record
+
+    def __len__(self):
+        return len(self.records)
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+    def discard(self):
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+@contextmanager
+def open_journal(job_id, kind, jobs_dir=None):
+    # Yields None when no job ID is given, so callers can pass it through.
+    journal = CheckpointJournal(job_id, kind, jobs_dir) if job_id else None
+    try:
+        yield journal
+    finally:
+        if journal is not None:
+            journal.close()
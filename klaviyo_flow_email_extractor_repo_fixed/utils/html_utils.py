@@ -1,47 +1,332 @@
+import copy
+import hashlib
+import importlib.util
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from functools import cached_property
+from html.parser import HTMLParser
+
 from bs4 import BeautifulSoup
 import re
 
+from instrumentation import get_instrumentation
+
+BACKGROUND_STYLE = re.compile(r"background(-image)?:")
+HTML5_ELEMENTS = ("section", "article", "header", "footer", "nav")
+
+# Bump whenever a change to the analysis rules alters results, so cached
+# analyses from older rules are ignored.
+ANALYSIS_VERSION = 2
+DEFAULT_ANALYSIS_CACHE_ENTRIES = 1024
+DEFAULT_ANALYSIS_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "flow-extractor", "analysis_cache.sqlite3")
+
+# Parser backends in order of preference. "lxml" and "html.parser" are
+# BeautifulSoup tree builders; "selectolax" walks a lexbor tree directly and
+# "stream" only listens to html.parser tokenizer events.
+# "stream" and "html.parser" give identical results and are the reference.
+# selectolax and lxml repair misnested markup the way browsers do (a link
+# wrapped around a block, <b><p>x</b>, nested forms, tags inside <title> or
+# <textarea>, a second <body>), so on such templates their counts can
+# differ; they are only used when asked for.
+HTML_BACKENDS = ("stream", "html.parser", "selectolax", "lxml")
+REFERENCE_BACKENDS = ("stream", "html.parser")
+BACKEND_MODULES = {"selectolax": "selectolax.lexbor", "stream": None, "lxml": "lxml", "html.parser": None}
+
+# Elements the HTML5 and libxml2 parsers synthesize when the source omits
+# them (or from stray </p> and </br> end tags); counts are capped at the
+# source's own start tags so every backend reports what html.parser reports.
+IMPLIED_TAGS = ("html", "head", "body", "tbody", "p", "br")
+IMPLIED_TAG_PATTERN = re.compile(r"<(html|head|body|tbody|p|br)(?=[\s/>])", re.IGNORECASE)
+
+_backend = None
+
+def _module_available(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ImportError:
+        return False
+
+def available_backends():
+    return [name for name in HTML_BACKENDS if BACKEND_MODULES[name] is None or _module_available(BACKEND_MODULES[name])]
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        requested = os.environ.get("FLOW_EXTRACTOR_HTML_PARSER")
+        available = available_backends()
+        _backend = requested if requested in available else available[0]
+    return _backend
+
+def set_backend(name):
+    global _backend
+    if name is not None and name not in available_backends():
+        raise ValueError(f"HTML parser backend {name!r} is not available; choose from {available_backends()}")
+    _backend = name
+
+def _bs4_builder(backend):
+    return "lxml" if backend == "lxml" else "html.parser"
+
+def analysis_key(digest, backend=None):
+    # Cached analyses are shared by the reference backends only
+    backend = backend or get_backend()
+    return digest if backend in REFERENCE_BACKENDS else f"{backend}:{digest}"
+
+def _iter_elements(html_content, backend, soup=None):
+    if backend == "selectolax":
+        from selectolax.lexbor import LexborHTMLParser
+        for node in LexborHTMLParser(html_content).root.traverse(include_text=False):
+            if node.tag[:1].isalpha():
+                yield node.tag, node.attributes
+    else:
+        for element in soup.find_all(True):
+            yield element.name, element.attrs
+
+def message_attributes(email_message):
+    if not isinstance(email_message, dict):
+        return {}
+    data = email_message.get("data", {})
+    return data.get("attributes", {}) or email_message.get("attributes", {}) or {}
+
+def extract_html(email_message):
+    return message_attributes(email_message).get("html", "")
+
+class TemplateSummary:
+    # Running counters every analysis is derived from; holds no per-element
+    # state, so it can be filled from a tree walk or from tokenizer events.
+    def __init__(self):
+        self.tag_counts = {}
+        self.img_with_alt = 0
+        self.img_with_dim = 0
+        self.background_images = False
+        self.has_viewport_meta = False
+        self.media_query_count = 0
+        self.has_max_width = False
+        self.has_doctype = False
+
+    def add_element(self, name, attrs):
+        self.tag_counts[name] = self.tag_counts.get(name, 0) + 1
+        if name == "img":
+            if attrs.get("alt"):
+                self.img_with_alt += 1
+            if attrs.get("width") and attrs.get("height"):
+                self.img_with_dim += 1
+        elif name == "meta" and attrs.get("name") == "viewport":
+            self.has_viewport_meta = True
+        if not self.background_images:
+            style = attrs.get("style")
+            if style and BACKGROUND_STYLE.search(style):
+                self.background_images = True
+
+    def add_source(self, html_content):
+        self.media_query_count = html_content.count("@media")
+        self.has_max_width = "max-width" in html_content
+        self.has_doctype = html_content.strip().lower().startswith("<!doctype")
+
+    def count(self, name):
+        return self.tag_counts.get(name, 0)
+
+    def structure(self):
+        images = self.count("img")
+        return {
+            "total_elements": sum(self.tag_counts.values()),
+            "elements": {"images": images, "links": self.count("a"), "tables": self.count("table")},
+            "images": {"count": images, "with_alt_text": self.img_with_alt, "without_alt_text": images - self.img_with_alt, "with_width_height": self.img_with_dim},
+            "responsiveness": {"has_media_queries": self.media_query_count > 0, "media_query_count": self.media_query_count, "has_viewport_meta": self.has_viewport_meta, "has_max_width": self.has_max_width}
+        }
+
+    def compatibility(self):
+        problematic = {"background_images": self.background_images, "forms": bool(self.count("form")), "video": bool(self.count("video")), "javascript": bool(self.count("script"))}
+        general = {"has_doctype": self.has_doctype, "uses_html5_elements": any(self.count(name) for name in HTML5_ELEMENTS)}
+        layout = {"uses_tables_for_layout": bool(self.count("table"))}
+        recommendations = []
+        if not general["has_doctype"]:
+            recommendations.append("Add a DOCTYPE declaration at the top of your HTML")
+        if problematic["forms"]:
+            recommendations.append("Remove <form> elements since many email clients don't support forms")
+        if problematic["video"]:
+            recommendations.append("Avoid <video> tags; convert videos to a GIF or static image")
+        if problematic["javascript"]:
+            recommendations.append("Remove JavaScript; it's not supported in most email clients")
+        return {"general": general, "layout": layout, "problematic_elements": problematic, "recommendations": recommendations}
+
+class StreamingAnalyzer(HTMLParser):
+    # Single pass over tokenizer events, never building a DOM. Input can be
+    # fed in chunks; the raw-text checks carry a short tail across chunk
+    # boundaries so a split "@media" or "max-width" is still seen.
+    MEDIA = "@media"
+    MAX_WIDTH = "max-width"
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.summary = TemplateSummary()
+        self._tail = ""
+        self._prefix = ""
+
+    def feed(self, data):
+        if len(self._prefix) < 9:
+            self._prefix += data.lstrip() if not self._prefix else data
+            self._prefix = self._prefix[:9]
+        window = self._tail + data
+        self.summary.media_query_count += window[len(self._tail) - min(len(self._tail), len(self.MEDIA) - 1):].count(self.MEDIA)
+        self.summary.has_max_width = self.summary.has_max_width or self.MAX_WIDTH in window
+        self._tail = window[-(len(self.MAX_WIDTH) - 1):]
+        super().feed(data)
+
+    def handle_starttag(self, tag, attrs):
+        self.summary.add_element(tag, dict(attrs))
+
+    def close(self):
+        super().close()
+        self.summary.has_doctype = self._prefix.lower().startswith("<!doctype")
+        return self.summary
+
+def stream_analyze(chunks):
+    if isinstance(chunks, str):
+        chunks = (chunks,)
+    analyzer = StreamingAnalyzer()
+    for chunk in chunks:
+        analyzer.feed(chunk)
+    return analyzer.close()
+
+class ParsedTemplate:
+    # Parses the HTML once; every analysis below is derived from the same tree
+    # and a single walk over its elements. The "stream" backend skips the tree
+    # and fills the summary from tokenizer events instead.
+    def __init__(self, html_content, backend=None):
+        self.html = html_content
+        self.backend = backend or get_backend()
+
+    @cached_property
+    def soup(self):
+        return BeautifulSoup(self.html, _bs4_builder(self.backend))
+
+    @cached_property
+    def summary(self):
+        if self.backend == "stream":
+            return stream_analyze(self.html)
+        summary = TemplateSummary()
+        soup = None if self.backend == "selectolax" else self.soup
+        for name, attrs in _iter_elements(self.html, self.backend, soup):
+            summary.add_element(name, attrs)
+        summary.add_source(self.html)
+        if self.backend != "html.parser":
+            explicit = {}
+            for match in IMPLIED_TAG_PATTERN.finditer(self.html):
+                name = match.group(1).lower()
+                explicit[name] = explicit.get(name, 0) + 1
+            for name in IMPLIED_TAGS:
+                if name in summary.tag_counts:
+                    summary.tag_counts[name] = min(summary.tag_counts[name], explicit.get(name, 0))
+        return summary
+
+    def prettify(self):
+        # Always html.parser: lxml would wrap fragments in <html><body>
+        if not self.html:
+            return ""
+        soup = self.soup if self.backend == "html.parser" else BeautifulSoup(self.html, "html.parser")
+        return soup.prettify()
+
+    @cached_property
+    def structure(self):
+        return self.summary.structure()
+
+    @cached_property
+    def compatibility(self):
+        return self.summary.compatibility()
+
+    @cached_property
+    def recommendations(self):
+        recommendations = []
+        img_analysis = self.structure["images"]
+        if img_analysis["without_alt_text"] > 0:
+            recommendations.append(f"Add alt text to {img_analysis['without_alt_text']} images for accessibility and when images are blocked")
+        if not self.structure["responsiveness"]["has_media_queries"]:
+            recommendations.append("Add media queries for better mobile responsiveness")
+        for issue, has_issue in self.compatibility["problematic_elements"].items():
+            if has_issue:
+                issue_name = issue.replace("has_", "").replace("_", " ")
+                recommendations.append(f"Remove {issue_name} as it may cause compatibility issues in some email clients")
+        return recommendations
+
 def extract_and_render_html(email_message):
-    html = ""
-    if isinstance(email_message, dict):
-        data = email_message.get("data", {})
-        attrs = data.get("attributes", {}) or email_message.get("attributes", {})
-        html = attrs.get("html", "")
-    formatted = BeautifulSoup(html, "html.parser").prettify() if html else ""
+    html = extract_html(email_message)
+    with get_instrumentation().timer("html_render"):
+        formatted = ParsedTemplate(html).prettify() if html else ""
     return html, formatted
 
+def content_hash(html_content):
+    return hashlib.sha256(html_content.encode("utf-8")).hexdigest()
+
+class AnalysisCache:
+    # In-memory LRU of analysis results keyed by content hash, optionally
+    # backed by SQLite. Entries from another ANALYSIS_VERSION never match.
+    def __init__(self, max_entries=DEFAULT_ANALYSIS_CACHE_ENTRIES, path=None, version=ANALYSIS_VERSION):
+        self.max_entries = max_entries
+        self.version = version
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.conn = None
+        if path:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS analyses (digest TEXT NOT NULL, version INTEGER NOT NULL, analysis TEXT NOT NULL, PRIMARY KEY (digest, version))")
+            self.conn.execute("DELETE FROM analyses WHERE version != ?", (version,))
+
+    def get(self, digest):
+        with self.lock:
+            analysis = self.entries.get(digest)
+            if analysis is not None:
+                self.entries.move_to_end(digest)
+                return analysis
+            if self.conn is None:
+                return None
+            row = self.conn.execute("SELECT analysis FROM analyses WHERE digest = ? AND version = ?", (digest, self.version)).fetchone()
+        if row is None:
+            return None
+        analysis = json.loads(row[0])
+        self._remember(digest, analysis)
+        return analysis
+
+    def set(self, digest, analysis):
+        self._remember(digest, analysis)
+        if self.conn is not None:
+            with self.lock:
+                self.conn.execute("INSERT OR REPLACE INTO analyses (digest, version, analysis) VALUES (?, ?, ?)", (digest, self.version, json.dumps(analysis)))
+
+    def _remember(self, digest, analysis):
+        with self.lock:
+            self.entries[digest] = analysis
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+_analysis_cache = AnalysisCache()
+
+def configure_analysis_cache(path=None, max_entries=DEFAULT_ANALYSIS_CACHE_ENTRIES):
+    global _analysis_cache
+    _analysis_cache = AnalysisCache(max_entries=max_entries, path=path)
+    return _analysis_cache
+
+def get_analysis_cache():
+    return _analysis_cache
+
+def analyze_template(html_content, backend=None):
+    digest = analysis_key(content_hash(html_content), backend)
+    analysis = _analysis_cache.get(digest)
+    if analysis is None:
+        with get_instrumentation().timer("html_analysis"):
+            template = ParsedTemplate(html_content, backend)
+            analysis = {"structure": template.structure, "compatibility": template.compatibility, "recommendations": template.recommendations}
+        _analysis_cache.set(digest, analysis)
+    return copy.deepcopy(analysis)
+
 def analyze_html_structure(html_content):
-    soup = BeautifulSoup(html_content, "html.parser")
-    elements = soup.find_all(True)
-    images = soup.find_all("img")
-    links = soup.find_all("a")
-    tables = soup.find_all("table")
-    img_with_alt = [img for img in images if img.get("alt")]
-    img_without_alt = [img for img in images if not img.get("alt")]
-    img_with_dim = [img for img in images if img.get("width") and img.get("height")]
-    has_media_queries = bool(re.search(r"@media", html_content))
-    media_query_count = len(re.findall(r"@media", html_content))
-    has_viewport_meta = bool(soup.find("meta", attrs={"name": "viewport"}))
-    has_max_width = bool(re.search(r"max-width", html_content))
-    return {
-        "total_elements": len(elements),
-        "elements": {"images": len(images), "links": len(links), "tables": len(tables)},
-        "images": {"count": len(images), "with_alt_text": len(img_with_alt), "without_alt_text": len(img_without_alt), "with_width_height": len(img_with_dim)},
-        "responsiveness": {"has_media_queries": has_media_queries, "media_query_count": media_query_count, "has_viewport_meta": has_viewport_meta, "has_max_width": has_max_width}
-    }
+    return analyze_template(html_content)["structure"]
 
 def check_email_compatibility(html_content):
-    soup = BeautifulSoup(html_content, "html.parser")
-    problematic = {"background_images": bool(soup.find_all(style=re.compile(r"background(-image)?:"))), "forms": bool(soup.find_all("form")), "video": bool(soup.find_all("video")), "javascript": bool(soup.find_all("script"))}
-    general = {"has_doctype": html_content.strip().lower().startswith("<!doctype"), "uses_html5_elements": bool(soup.find_all(["section", "article", "header", "footer", "nav"]))}
-    layout = {"uses_tables_for_layout": bool(soup.find_all("table"))}
-    recommendations = []
-    if not general["has_doctype"]:
-        recommendations.append("Add a DOCTYPE declaration at the top of your HTML")
-    if problematic["forms"]:
-        recommendations.append("Remove <form> elements since many email clients don't support forms")
-    if problematic["video"]:
-        recommendations.append("Avoid <video> tags; convert videos to a GIF or static image")
-    if problematic["javascript"]:
-        recommendations.append("Remove JavaScript; it's not supported in most email clients")
-    return {"general": general, "layout": layout, "problematic_elements": problematic, "recommendations": recommendations}
+    return analyze_template(html_content)["compatibility"]
@@ -0,0 +1,232 @@
+import bisect
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from profiling import span
+
+# Upper bounds in seconds; anything slower lands in the +Inf bucket
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PREFIX = "flow_extractor"
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, fraction):
+        # Upper bound of the bucket holding the requested rank
+        if not self.count:
+            return 0.0
+        seen = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            seen += count
+            if seen >= fraction * self.count:
+                return bound
+        return float("inf")
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": {_bound(bound): total for bound, total in self.cumulative()},
+        }
+
+class EndpointStats:
+    def __init__(self):
+        self.calls = 0
+        self.cache_hits = 0
+        self.errors = 0
+        self.attempts = 0
+        self.throttled = 0
+        self.retries = 0
+        self.bytes = 0
+        self.wait_seconds = 0.0
+        self.statuses = Counter()
+        self.latency = Histogram()
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "errors": self.errors,
+            "attempts": self.attempts,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "wait_seconds": self.wait_seconds,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "latency": self.latency.to_dict(),
+        }
+
+class Instrumentation:
+    # Process-wide counters fed by the API clients and the HTML parser. Keyed
+    # by endpoint pattern (ids replaced by {id}) so the label set stays small.
+    # `latency` is time on the wire per attempt; `wait_seconds` is time spent
+    # held back by the rate limiter and retry backoff.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.endpoints = {}
+            self.stages = {}
+
+    def _endpoint(self, label):
+        stats = self.endpoints.get(label)
+        if stats is None:
+            stats = self.endpoints[label] = EndpointStats()
+        return stats
+
+    def record_cache_hit(self, label):
+        with self.lock:
+            stats = self._endpoint(label)
+            stats.calls += 1
+            stats.cache_hits += 1
+
+    def record_call(self, label, failed=False):
+        with self.lock:
+            stats = self._endpoint(label)
+            stats.calls += 1
+            if failed:
+                stats.errors += 1
+
+    def record_response(self, label, status, seconds, size):
+        with self.lock:
+            stats = self._endpoint(label)
+            stats.attempts += 1
+            stats.statuses[status] += 1
+            stats.bytes += size
+            stats.latency.observe(seconds)
+            if status == 429:
+                stats.throttled += 1
+
+    def record_wait(self, label, seconds, retry=False):
+        with self.lock:
+            stats = self._endpoint(label)
+            stats.wait_seconds += seconds
+            if retry:
+                stats.retries += 1
+
+    def record_stage(self, stage, seconds):
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        # Stages double as profiling spans
+        start = time.perf_counter()
+        try:
+            with span(stage):
+                yield
+        finally:
+            self.record_stage(stage, time.perf_counter() - start)
+
+    def totals(self):
+        with self.lock:
+            endpoints = list(self.endpoints.values())
+            stages = {stage: histogram.sum for stage, histogram in self.stages.items()}
+        return {
+            "calls": sum(stats.calls for stats in endpoints),
+            "cache_hits": sum(stats.cache_hits for stats in endpoints),
+            "errors": sum(stats.errors for stats in endpoints),
+            "attempts": sum(stats.attempts for stats in endpoints),
+            "throttled": sum(stats.throttled for stats in endpoints),
+            "retries": sum(stats.retries for stats in endpoints),
+            "bytes": sum(stats.bytes for stats in endpoints),
+            "network_seconds": sum(stats.latency.sum for stats in endpoints),
+            "wait_seconds": sum(stats.wait_seconds for stats in endpoints),
+            "stage_seconds": stages,
+        }
+
+    def snapshot(self):
+        totals = self.totals()
+        with self.lock:
+            return {
+                "started": self.started,
+                "uptime_seconds": time.time() - self.started,
+                "totals": totals,
+                "endpoints": {label: stats.to_dict() for label, stats in sorted(self.endpoints.items())},
+                "stages": {stage: histogram.to_dict() for stage, histogram in sorted(self.stages.items())},
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for suffix, labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+                lines.append(f"{PREFIX}_{name}{suffix}{{{label_text}}} {_number(value)}")
+
+        def histogram(name, help_text, label_name, histograms):
+            samples = []
+            for label, hist in histograms:
+                for bound, total in hist.cumulative():
+                    samples.append(("_bucket", {label_name: label, "le": _bound(bound)}, total))
+                samples.append(("_sum", {label_name: label}, hist.sum))
+                samples.append(("_count", {label_name: label}, hist.count))
+            metric(name, "histogram", help_text, samples)
+
+        with self.lock:
+            endpoints = sorted(self.endpoints.items())
+            counters = [
+                ("api_calls_total", "API calls, including cache hits", "calls"),
+                ("api_cache_hits_total", "API calls answered from the response cache", "cache_hits"),
+                ("api_errors_total", "API calls that ended in an error", "errors"),
+                ("api_attempts_total", "HTTP requests sent, including retries", "attempts"),
+                ("api_throttled_total", "Responses with status 429", "throttled"),
+                ("api_retries_total", "Requests retried after a retryable status", "retries"),
+                ("api_response_bytes_total", "Response body bytes received", "bytes"),
+                ("api_wait_seconds_total", "Time held back by rate limiting and retry backoff", "wait_seconds"),
+            ]
+            for name, help_text, field in counters:
+                metric(name, "counter", help_text, [("", {"endpoint": label}, getattr(stats, field)) for label, stats in endpoints])
+            metric("api_responses_total", "counter", "HTTP responses by status", [
+                ("", {"endpoint": label, "status": str(status)}, count)
+                for label, stats in endpoints for status, count in sorted(stats.statuses.items())
+            ])
+            histogram("api_latency_seconds", "Time on the wire per HTTP request", "endpoint", [(label, stats.latency) for label, stats in endpoints])
+            histogram("stage_seconds", "Time spent in local processing stages", "stage", sorted(self.stages.items()))
+        return "\n".join(lines) + "\n"
+
+def _bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+_instrumentation = Instrumentation()
+
+def get_instrumentation():
+    return _instrumentation
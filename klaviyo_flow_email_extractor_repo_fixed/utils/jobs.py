@@ -0,0 +1,191 @@
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from api_cache import account_hash
+from archive import DEFAULT_COMPRESSION, export_templates_zip
+from bulk import DEFAULT_ANALYSIS_WORKERS, DEFAULT_WORKERS, build_report, write_report
+from checkpoint import get_jobs_dir, new_job_id, open_journal
+from profiling import ProfileSession
+from search_index import sync_search_index
+
+# Jobs that run at the same time; further jobs wait in the queue. Each job
+# still fans out over its own fetch workers.
+DEFAULT_JOB_WORKERS = 4
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    # Progress counters are written by the job's own thread and only read
+    # elsewhere, so plain attributes are enough. `total` grows as each flow's
+    # action list arrives; report jobs append to `rows` as each row is ready.
+    def __init__(self, job_id, kind, label, owner, directory):
+        self.id = job_id
+        self.kind = kind
+        self.label = label
+        self.owner = owner
+        self.directory = directory
+        self.status = "queued"
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.rows = []
+        self.artifact = None
+        self.error = None
+        self.profile = None
+        self.cancel_event = threading.Event()
+
+    def add_total(self, count):
+        self.total += count
+
+    def advance(self, failed=False):
+        self.done += 1
+        if failed:
+            self.failed += 1
+
+    def check(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def throughput(self):
+        elapsed = self.elapsed()
+        return self.done / elapsed if elapsed else 0.0
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def eta(self):
+        if self.status != "running" or not self.done or self.total <= self.done:
+            return None
+        return (self.total - self.done) * self.elapsed() / self.done
+
+class JobManager:
+    # Process-wide, so jobs outlive Streamlit reruns and are shared between
+    # sessions; each session only lists the jobs of its own account. Every job
+    # checkpoints into a journal under its ID, so an interrupted job can be
+    # resubmitted with the same ID and continue. Jobs are keyed and stored
+    # per owner (account hash): two accounts may use the same job ID without
+    # replacing each other's job or sharing its journal and files.
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS, jobs_dir=None):
+        self.jobs_dir = jobs_dir or get_jobs_dir()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="flow-job")
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def account_dir(self, owner):
+        return os.path.join(self.jobs_dir, owner) if owner else self.jobs_dir
+
+    def submit(self, kind, label, fn, owner=None, job_id=None, profile=False):
+        # fn(job, journal) does the work and returns the job's result; it may
+        # set job.artifact to a file inside job.directory. With profile=True
+        # the run is profiled into job.profile.
+        job_id = job_id or new_job_id(kind)
+        with self.lock:
+            existing = self.jobs.get((owner, job_id))
+            if existing is not None and existing.active:
+                raise ValueError(f"Job {job_id!r} is already {existing.status}")
+            job = Job(job_id, kind, label, owner, os.path.join(self.account_dir(owner), job_id))
+            if profile:
+                job.profile = ProfileSession(f"{kind} {job_id}")
+            self.jobs[(owner, job_id)] = job
+        self.pool.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job, fn):
+        if job.cancel_event.is_set():
+            job.status, job.finished = "cancelled", time.time()
+            return
+        job.status, job.started = "running", time.time()
+        try:
+            if job.profile is not None:
+                job.profile.start()
+            with open_journal(job.id, job.kind, self.account_dir(job.owner)) as journal:
+                job.result = fn(job, journal)
+            job.status = "succeeded"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status, job.error = "failed", str(e)
+        finally:
+            if job.profile is not None:
+                job.profile.stop()
+        job.finished = time.time()
+
+    def get(self, job_id, owner=None):
+        return self.jobs.get((owner, job_id))
+
+    def list(self, owner=None):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [job for job in reversed(jobs) if owner is None or job.owner == owner]
+
+    def cancel(self, job_id, owner=None):
+        job = self.get(job_id, owner)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def remove(self, job_id, owner=None):
+        # Forgets a finished job and deletes its journal, staging and artifact.
+        with self.lock:
+            job = self.jobs.get((owner, job_id))
+            if job is None or job.active:
+                return False
+            del self.jobs[(owner, job_id)]
+        shutil.rmtree(job.directory, ignore_errors=True)
+        return True
+
+def submit_export(client, flows, file_name, label, workers=DEFAULT_WORKERS, compression=DEFAULT_COMPRESSION, include_flow_dir=True, dedup=False, job_id=None, profile=False):
+    def run(job, journal):
+        path = os.path.join(job.directory, file_name)
+        _, counts = export_templates_zip(
+            client, flows, path=path, workers=workers, compression=compression,
+            include_flow_dir=include_flow_dir, dedup=dedup, journal=journal, progress=job,
+        )
+        job.artifact = path
+        return counts
+    return get_job_manager().submit("export", label, run, owner=account_hash(client.api_key), job_id=job_id, profile=profile)
+
+def submit_report(client, flows, label, workers=DEFAULT_WORKERS, analysis_workers=DEFAULT_ANALYSIS_WORKERS, manifest=None, job_id=None, profile=False):
+    # Only counts and rows are kept on the job; template bodies are dropped.
+    def run(job, journal):
+        result = build_report(client, flows, workers, analysis_workers, manifest, journal, progress=job, on_row=job.rows.append)
+        path = os.path.join(job.directory, "template_analysis_report.csv")
+        write_report(path, result["rows"])
+        job.artifact = path
+        return {key: result[key] for key in ("succeeded", "failed", "skipped", "reused", "rows")}
+    return get_job_manager().submit("report", label, run, owner=account_hash(client.api_key), job_id=job_id, profile=profile)
+
+def submit_sync(client, label, workers=DEFAULT_WORKERS, full=False, job_id=None, profile=False):
+    # The search index is its own checkpoint: a rerun skips emails already
+    # mirrored, so the journal is not used.
+    def run(job, journal):
+        return sync_search_index(client, workers=workers, full=full, progress=job)
+    return get_job_manager().submit("sync", label, run, owner=account_hash(client.api_key), job_id=job_id, profile=profile)
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
@@ -1,13 +1,298 @@
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import get_instrumentation
+from profiling import bind, span
 
 BASE_URL = "https://a.klaviyo.com/api"
+DEFAULT_TIMEOUT = (5, 30)
+DEFAULT_POOL_SIZE = 16
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 60.0
+RETRY_STATUSES = (429, 502, 503, 504)
+AUTH_STATUSES = (401, 403)
+AUTH_TTL = 15 * 60
+
+# Klaviyo rate limit tiers: (burst requests per second, steady requests per minute)
+RATE_LIMIT_TIERS = {
+    "XS": (1, 15),
+    "S": (3, 60),
+    "M": (10, 150),
+    "L": (75, 700),
+    "XL": (350, 3500),
+}
+
+ENDPOINT_TIERS = [
+    (re.compile(r"^v1/content_actions/[^/]+/render"), "S"),
+    (re.compile(r"^v1/flows/[^/]+/metrics"), "S"),
+    (re.compile(r"^v1/metrics"), "M"),
+    (re.compile(r"^v1/flows"), "M"),
+]
+
+# Instrumentation labels; ids are folded so every flow shares one series
+ENDPOINT_LABELS = [
+    (re.compile(r"^v1/content_actions/[^/]+/render"), "v1/content_actions/{id}/render"),
+    (re.compile(r"^v1/flows/[^/]+/actions"), "v1/flows/{id}/actions"),
+    (re.compile(r"^v1/flows/[^/]+/metrics"), "v1/flows/{id}/metrics"),
+    (re.compile(r"^v1/flows/[^/]+"), "v1/flows/{id}"),
+    (re.compile(r"^v1/metrics/[^/]+"), "v1/metrics/{id}"),
+]
+
+def endpoint_path(endpoint, base_url=BASE_URL):
+    path = endpoint.split("?", 1)[0]
+    if path.startswith(base_url):
+        path = path[len(base_url):]
+    return path.lstrip("/")
+
+def endpoint_tier(endpoint, base_url=BASE_URL):
+    path = endpoint_path(endpoint, base_url)
+    for pattern, tier in ENDPOINT_TIERS:
+        if pattern.match(path):
+            return tier
+    return "M"
+
+def endpoint_label(endpoint, base_url=BASE_URL):
+    path = endpoint_path(endpoint, base_url).rstrip("/")
+    for pattern, label in ENDPOINT_LABELS:
+        if pattern.match(path):
+            return label
+    return path
+
+def _header_int(headers, name):
+    match = re.match(r"\s*(\d+)", headers.get(name) or "")
+    return int(match.group(1)) if match else None
+
+def retry_after_seconds(headers):
+    value = (headers.get("Retry-After") or "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, headers=None):
+    retry_after = retry_after_seconds(headers or {})
+    if retry_after is not None:
+        return retry_after + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        # Takes a token (possibly going into debt) and returns how long the
+        # caller has to wait before its request may go out.
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class AdaptiveConcurrency:
+    # Additive-increase / multiplicative-decrease cap on in-flight requests.
+    def __init__(self, maximum, minimum=1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def on_success(self):
+        with self.condition:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.condition.notify()
+
+    def on_throttle(self):
+        with self.condition:
+            self.limit = max(self.minimum, self.limit / 2)
+
+class RateLimitScheduler:
+    def __init__(self, max_concurrency=DEFAULT_POOL_SIZE, tiers=RATE_LIMIT_TIERS):
+        self.tiers = tiers
+        self.buckets = {}
+        self.concurrency = {}
+        self.max_concurrency = max_concurrency
+        self.lock = threading.Lock()
+
+    def _state(self, tier):
+        with self.lock:
+            if tier not in self.buckets:
+                burst, steady = self.tiers[tier]
+                self.buckets[tier] = (TokenBucket(burst, burst), TokenBucket(steady / 60.0, steady))
+                self.concurrency[tier] = AdaptiveConcurrency(min(self.max_concurrency, burst * 2))
+            return self.buckets[tier], self.concurrency[tier]
+
+    def delay(self, tier):
+        buckets, _ = self._state(tier)
+        return max(bucket.reserve() for bucket in buckets)
+
+    def gate(self, tier):
+        return self._state(tier)[1]
+
+    def observe(self, tier, status, headers):
+        buckets, concurrency = self._state(tier)
+        if status == 429:
+            concurrency.on_throttle()
+            wait = retry_after_seconds(headers)
+            if wait is None:
+                wait = _header_int(headers, "RateLimit-Reset")
+            if wait:
+                for bucket in buckets:
+                    bucket.pause(wait)
+            return
+        if status < 400:
+            concurrency.on_success()
+        remaining = _header_int(headers, "RateLimit-Remaining")
+        reset = _header_int(headers, "RateLimit-Reset")
+        if remaining == 0 and reset:
+            for bucket in buckets:
+                bucket.pause(reset)
+
+    def wait(self, tier):
+        delay = self.delay(tier)
+        if delay > 0:
+            time.sleep(delay)
+
+class KlaviyoClient:
+    def __init__(self, api_key, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, base_url=BASE_URL,
+                 max_retries=MAX_RETRIES, scheduler=None, cache=None, instrumentation=None):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.cache = cache
+        self.instrumentation = instrumentation or get_instrumentation()
+        self.auth_verified_at = None
+        self.scheduler = scheduler or RateLimitScheduler(max_concurrency=pool_size)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        })
+
+    def request(self, endpoint, params=None, timeout=None, use_cache=True):
+        label = endpoint_label(endpoint, self.base_url)
+        if use_cache and self.cache is not None:
+            cached = self.cache.get(self.api_key, endpoint, params)
+            if cached is not None:
+                self.instrumentation.record_cache_hit(label)
+                return cached
+        failed = True
+        try:
+            with span(f"api {label}"):
+                data = self._fetch(endpoint, params, timeout, label)
+            failed = False
+        finally:
+            self.instrumentation.record_call(label, failed)
+        # use_cache=False neither reads nor writes: key checks and forced
+        # refetches must not leave their responses behind
+        if use_cache and self.cache is not None:
+            self.cache.set(self.api_key, endpoint, params, data)
+        return data
+
+    def _fetch(self, endpoint, params, timeout, label):
+        url = endpoint if endpoint.startswith(("http://", "https://")) else f"{self.base_url}/{endpoint}"
+        tier = endpoint_tier(url, self.base_url)
+        gate = self.scheduler.gate(tier)
+        for attempt in range(self.max_retries + 1):
+            queued = time.perf_counter()
+            self.scheduler.wait(tier)
+            gate.acquire()
+            sent = time.perf_counter()
+            self.instrumentation.record_wait(label, sent - queued)
+            try:
+                response = self.session.get(url, params=params or {}, timeout=timeout or self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                # A dropped connection or a timeout is as transient as a 503
+                if attempt == self.max_retries:
+                    raise
+                response = None
+            finally:
+                gate.release()
+            if response is None:
+                delay = backoff_delay(attempt)
+            else:
+                self.instrumentation.record_response(label, response.status_code, time.perf_counter() - sent, len(response.content))
+                self.scheduler.observe(tier, response.status_code, response.headers)
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    break
+                delay = backoff_delay(attempt, response.headers)
+            self.instrumentation.record_wait(label, delay, retry=True)
+            time.sleep(delay)
+        if response.status_code in AUTH_STATUSES:
+            self.auth_verified_at = None
+        response.raise_for_status()
+        with self.instrumentation.timer("json_decode"):
+            return response.json()
+
+    def verify(self, ttl=AUTH_TTL):
+        # Memoized key check: only goes to the network when the last success
+        # is older than ttl or a request since then came back 401/403.
+        if self.auth_verified_at is not None and time.monotonic() - self.auth_verified_at < ttl:
+            return True
+        response = self.request("v1/flows", {"page[size]": 1}, use_cache=False)
+        if response and "data" in response:
+            self.auth_verified_at = time.monotonic()
+            return True
+        return False
+
+    def close(self):
+        self.session.close()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(api_key, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, cache=None):
+    if isinstance(api_key, KlaviyoClient):
+        return api_key
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = KlaviyoClient(api_key, pool_size=pool_size, timeout=timeout, cache=cache)
+        elif cache is not None:
+            client.cache = cache
+        return client
 
 def klaviyo_api_request(endpoint, api_key, params=None):
-    headers = {"Authorization": f"Bearer {api_key}"}
-    url = f"{BASE_URL}/{endpoint}"
-    response = requests.get(url, headers=headers, params=params or {})
-    response.raise_for_status()
-    return response.json()
+    return get_client(api_key).request(endpoint, params)
 
 def get_flows(api_key, params={"page[size]": 50}):
     return klaviyo_api_request("v1/flows", api_key, params)
@@ -15,8 +300,32 @@ def get_flows(api_key, params={"page[size]": 50}):
 def get_flow_actions(flow_id, api_key, params={"page[size]": 50}):
     return klaviyo_api_request(f"v1/flows/{flow_id}/actions", api_key, params)
 
-def get_email_content(action_id, api_key):
-    return klaviyo_api_request(f"v1/content_actions/{action_id}/render", api_key)
+def iter_pages(endpoint, api_key, params=None, prefetch=True):
+    # Follows links.next cursors; with prefetch the next page is requested
+    # while the caller is still consuming the current one.
+    client = get_client(api_key)
+    page = client.request(endpoint, params)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        while True:
+            next_url = (page.get("links") or {}).get("next")
+            pending = pool.submit(bind(client.request), next_url) if next_url and prefetch else None
+            yield page
+            if not next_url:
+                break
+            page = pending.result() if pending else client.request(next_url)
+
+def iter_flows(api_key, page_size=50, params=None, prefetch=True):
+    params = {"page[size]": page_size, **(params or {})}
+    for page in iter_pages("v1/flows", api_key, params, prefetch):
+        yield from page.get("data") or []
+
+def iter_flow_actions(flow_id, api_key, page_size=50, params=None, prefetch=True):
+    params = {"page[size]": page_size, **(params or {})}
+    for page in iter_pages(f"v1/flows/{flow_id}/actions", api_key, params, prefetch):
+        yield from page.get("data") or []
+
+def get_email_content(action_id, api_key, use_cache=True):
+    return get_client(api_key).request(f"v1/content_actions/{action_id}/render", use_cache=use_cache)
 
 def get_flow_metrics(flow_id, api_key, params=None):
     return klaviyo_api_request(f"v1/flows/{flow_id}/metrics", api_key, params)
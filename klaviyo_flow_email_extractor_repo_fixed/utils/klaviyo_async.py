@@ -0,0 +1,215 @@
+import asyncio
+import json
+import threading
+import time
+
+import aiohttp
+
+from instrumentation import get_instrumentation
+from profiling import span
+from klaviyo_api import (
+    BASE_URL, DEFAULT_TIMEOUT, MAX_RETRIES, RETRY_STATUSES,
+    RateLimitScheduler, backoff_delay, endpoint_label, endpoint_tier,
+)
+
+DEFAULT_CONCURRENCY = 100
+
+class AsyncKlaviyoClient:
+    def __init__(self, api_key, pool_size=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, base_url=BASE_URL,
+                 max_retries=MAX_RETRIES, scheduler=None, cache=None, instrumentation=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.cache = cache
+        self.scheduler = scheduler or RateLimitScheduler(max_concurrency=pool_size)
+        self.instrumentation = instrumentation or get_instrumentation()
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=pool_size),
+            timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read),
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Accept": "application/json",
+                "Accept-Encoding": "gzip, deflate",
+            },
+        )
+        self._in_flight = {}
+        self._conditions = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _acquire(self, tier):
+        # Shares the AIMD limit computed by the sync scheduler, but waits on
+        # an asyncio condition so the event loop is never blocked.
+        condition = self._conditions.setdefault(tier, asyncio.Condition())
+        gate = self.scheduler.gate(tier)
+        async with condition:
+            await condition.wait_for(lambda: self._in_flight.get(tier, 0) < int(gate.limit))
+            self._in_flight[tier] = self._in_flight.get(tier, 0) + 1
+
+    async def _release(self, tier):
+        condition = self._conditions[tier]
+        async with condition:
+            self._in_flight[tier] -= 1
+            condition.notify_all()
+
+    async def request(self, endpoint, params=None, use_cache=True):
+        # Same ResponseCache as the sync client; its SQLite calls run in a
+        # thread so they never block the event loop.
+        label = endpoint_label(endpoint, self.base_url)
+        if use_cache and self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, self.api_key, endpoint, params)
+            if cached is not None:
+                self.instrumentation.record_cache_hit(label)
+                return cached
+        failed = True
+        try:
+            with span(f"api {label}"):
+                data = await self._fetch(endpoint, params, label)
+            failed = False
+        finally:
+            self.instrumentation.record_call(label, failed)
+        if use_cache and self.cache is not None:
+            await asyncio.to_thread(self.cache.set, self.api_key, endpoint, params, data)
+        return data
+
+    async def _fetch(self, endpoint, params, label):
+        url = endpoint if endpoint.startswith(("http://", "https://")) else f"{self.base_url}/{endpoint}"
+        tier = endpoint_tier(url, self.base_url)
+        for attempt in range(self.max_retries + 1):
+            queued = time.perf_counter()
+            delay = self.scheduler.delay(tier)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._acquire(tier)
+            sent = time.perf_counter()
+            self.instrumentation.record_wait(label, sent - queued)
+            try:
+                async with self.session.get(url, params=params or {}) as response:
+                    body = await response.read()
+                    self.instrumentation.record_response(label, response.status, time.perf_counter() - sent, len(body))
+                    self.scheduler.observe(tier, response.status, response.headers)
+                    if response.status not in RETRY_STATUSES or attempt == self.max_retries:
+                        response.raise_for_status()
+                        with self.instrumentation.timer("json_decode"):
+                            return json.loads(body)
+                    retry_in = backoff_delay(attempt, response.headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                # A dropped connection or a timeout is as transient as a 503
+                if attempt == self.max_retries:
+                    raise
+                retry_in = backoff_delay(attempt)
+            finally:
+                await self._release(tier)
+            self.instrumentation.record_wait(label, retry_in, retry=True)
+            await asyncio.sleep(retry_in)
+
+    async def close(self):
+        await self.session.close()
+
+# Shared clients, one per key and event loop: an aiohttp session is bound to
+# the loop that created it. Entries are keyed by id(loop) (a session holds its
+# loop, so weak keys would never be collected) and dropped once their loop is
+# closed. Every client for a key uses the same scheduler, so all loops draw
+# on one set of rate limits.
+_clients = {}
+_schedulers = {}
+_clients_lock = threading.Lock()
+
+def _drop_closed_loops():
+    for key, (loop, _) in list(_clients.items()):
+        if loop.is_closed():
+            del _clients[key]
+
+def get_client(api_key, pool_size=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT, cache=None):
+    if isinstance(api_key, AsyncKlaviyoClient):
+        return api_key
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        _drop_closed_loops()
+        _, clients = _clients.setdefault(id(loop), (loop, {}))
+        client = clients.get(api_key)
+        if client is None or client.session.closed:
+            scheduler = _schedulers.get(api_key)
+            if scheduler is None:
+                scheduler = _schedulers[api_key] = RateLimitScheduler(max_concurrency=pool_size)
+            client = clients[api_key] = AsyncKlaviyoClient(api_key, pool_size, timeout, scheduler=scheduler, cache=cache)
+        elif cache is not None:
+            client.cache = cache
+        return client
+
+async def close_clients():
+    # Closes the running loop's shared clients; await it before the loop
+    # ends. Without it the sessions are only released (unclosed) the next
+    # time a client is requested from any loop.
+    with _clients_lock:
+        _drop_closed_loops()
+        _, clients = _clients.pop(id(asyncio.get_running_loop()), (None, {}))
+    for client in clients.values():
+        await client.close()
+
+async def _with_client(api_key, call):
+    return await call(get_client(api_key))
+
+async def klaviyo_api_request(endpoint, api_key, params=None):
+    return await _with_client(api_key, lambda client: client.request(endpoint, params))
+
+async def get_flows(api_key, params={"page[size]": 50}):
+    return await klaviyo_api_request("v1/flows", api_key, params)
+
+async def get_flow_actions(flow_id, api_key, params={"page[size]": 50}):
+    return await klaviyo_api_request(f"v1/flows/{flow_id}/actions", api_key, params)
+
+async def iter_pages(endpoint, api_key, params=None):
+    page = await klaviyo_api_request(endpoint, api_key, params)
+    while True:
+        next_url = (page.get("links") or {}).get("next")
+        pending = asyncio.ensure_future(klaviyo_api_request(next_url, api_key)) if next_url else None
+        try:
+            yield page
+        except GeneratorExit:
+            if pending:
+                pending.cancel()
+            raise
+        if not pending:
+            break
+        page = await pending
+
+async def iter_flows(api_key, page_size=50, params=None):
+    params = {"page[size]": page_size, **(params or {})}
+    async for page in iter_pages("v1/flows", api_key, params):
+        for record in page.get("data") or []:
+            yield record
+
+async def iter_flow_actions(flow_id, api_key, page_size=50, params=None):
+    params = {"page[size]": page_size, **(params or {})}
+    async for page in iter_pages(f"v1/flows/{flow_id}/actions", api_key, params):
+        for record in page.get("data") or []:
+            yield record
+
+async def get_email_content(action_id, api_key):
+    return await klaviyo_api_request(f"v1/content_actions/{action_id}/render", api_key)
+
+async def get_flow_metrics(flow_id, api_key, params=None):
+    return await klaviyo_api_request(f"v1/flows/{flow_id}/metrics", api_key, params)
+
+async def get_message_metrics(message_id, api_key, params=None):
+    return await klaviyo_api_request(f"v1/metrics/{message_id}", api_key, params)
+
+async def gather_bounded(awaitables, limit=DEFAULT_CONCURRENCY, return_exceptions=True):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(awaitable):
+        async with semaphore:
+            return await awaitable
+
+    return await asyncio.gather(*(run(aw) for aw in awaitables), return_exceptions=return_exceptions)
+
+async def get_email_contents(action_ids, api_key, limit=DEFAULT_CONCURRENCY):
+    async def fetch(client):
+        return await gather_bounded((get_email_content(action_id, client) for action_id in action_ids), limit)
+    return await _with_client(api_key, fetch)
@@ -0,0 +1,155 @@
+import contextvars
+import cProfile
+import marshal
+import os
+import pstats
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+HOT_FUNCTIONS = 30
+
+_session = contextvars.ContextVar("profile_session", default=None)
+_spans = contextvars.ContextVar("profile_spans", default=())
+
+class _Frame:
+    __slots__ = ("name", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.children = 0.0
+
+class ProfileSession:
+    # One profiled page run or bulk job. cProfile sees the thread that starts
+    # the session; spans are wall-clock sections recorded from that thread and
+    # from any worker thread the run hands work to through bind(). Work done
+    # in the analysis worker processes shows up only as time spent waiting.
+    # Python 3.12+ allows one active profiler per interpreter; a session
+    # started while another one (or a debugger) holds it records spans only.
+    def __init__(self, label):
+        self.label = label
+        self.profiler = cProfile.Profile()
+        self.profiler_error = None
+        self.spans = {}
+        self.folded = Counter()
+        self.root = _Frame(label)
+        self.lock = threading.Lock()
+        self.started = None
+        self.finished = None
+        self._start = None
+
+    def start(self):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        _session.set(self)
+        _spans.set((self.root,))
+        try:
+            self.profiler.enable()
+        except ValueError as e:
+            self.profiler, self.profiler_error = None, str(e)
+        return self
+
+    def stop(self):
+        # Safe to call twice; a page run cut short by a rerun is stopped at
+        # the start of the next one.
+        if self.finished is not None:
+            return self
+        if self._start is None:
+            self.finished = time.time()
+            return self
+        if self.profiler is not None:
+            self.profiler.disable()
+        _session.set(None)
+        _spans.set(())
+        self.finished = time.time()
+        self.record((self.label,), time.perf_counter() - self._start, self.root)
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def active(self):
+        return self.started is not None and self.finished is None
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started if self.started else 0.0
+
+    def record(self, path, elapsed, frame):
+        # Folded stacks carry self time; parallel children can add up to more
+        # than their parent's wall time, so it is clamped at zero.
+        with self.lock:
+            stats = self.spans.setdefault(path[-1], [0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            self.folded[";".join(path)] += max(0.0, elapsed - frame.children)
+
+    def span_table(self):
+        with self.lock:
+            spans = sorted(self.spans.items(), key=lambda entry: entry[1][1], reverse=True)
+        return [{"Span": name, "Calls": calls, "Seconds": round(seconds, 4)} for name, (calls, seconds) in spans]
+
+    def stats(self):
+        # Empty when the CPU profiler could not be enabled
+        return pstats.Stats(self.profiler) if self.profiler is not None else pstats.Stats()
+
+    def hot_functions(self, limit=HOT_FUNCTIONS, sort="own"):
+        rows = []
+        for (filename, line, name), (_, calls, own, total, _) in self.stats().stats.items():
+            rows.append({
+                "Function": name,
+                "Location": f"{os.path.basename(filename)}:{line}" if line else filename,
+                "Calls": calls,
+                "Own (s)": round(own, 4),
+                "Total (s)": round(total, 4),
+            })
+        rows.sort(key=lambda row: row["Own (s)" if sort == "own" else "Total (s)"], reverse=True)
+        return rows[:limit]
+
+    def pstats_bytes(self):
+        # Same format as Stats.dump_stats; open with pstats or snakeviz
+        return marshal.dumps(self.stats().stats)
+
+    def folded_stacks(self):
+        # flamegraph.pl / speedscope input, in microseconds of self time
+        with self.lock:
+            stacks = sorted(self.folded.items())
+        return "".join(f"{stack.replace(' ', '_')} {round(seconds * 1e6)}\n" for stack, seconds in stacks if seconds > 0)
+
+def current_session():
+    return _session.get()
+
+@contextmanager
+def span(name):
+    session = _session.get()
+    if session is None:
+        yield
+        return
+    parents = _spans.get()
+    frame = _Frame(name)
+    token = _spans.set(parents + (frame,))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _spans.reset(token)
+        if parents:
+            with session.lock:
+                parents[-1].children += elapsed
+        session.record(tuple(parent.name for parent in parents) + (name,), elapsed, frame)
+
+def bind(fn):
+    # Wraps fn for a pool so spans it opens land under the caller's session
+    # and current span; a no-op when nothing is being profiled.
+    if _session.get() is None:
+        return fn
+    context = contextvars.copy_context()
+
+    def bound(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return bound
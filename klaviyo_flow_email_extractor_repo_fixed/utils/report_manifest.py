@@ -0,0 +1,81 @@
+import json
+import os
+import sqlite3
+import threading
+
+from api_cache import account_hash
+
+DEFAULT_MANIFEST_PATH = os.path.join(os.path.expanduser("~"), ".cache", "flow-extractor", "report_manifest.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_rows (
+    account TEXT NOT NULL,
+    flow_id TEXT NOT NULL,
+    action_id TEXT NOT NULL,
+    updated TEXT,
+    content_hash TEXT,
+    row TEXT NOT NULL,
+    PRIMARY KEY (account, flow_id, action_id)
+);
+"""
+
+class ReportManifest:
+    # One stored report row per (flow, action). A row is reused as long as
+    # the action's `updated` timestamp is unchanged.
+    def __init__(self, path=DEFAULT_MANIFEST_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.executescript(SCHEMA)
+
+    def lookup(self, api_key, flow_id, action_id, updated):
+        if not updated:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT row FROM report_rows WHERE account = ? AND flow_id = ? AND action_id = ? AND updated = ?",
+                (account_hash(api_key), flow_id, action_id, updated),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def store(self, api_key, items):
+        account = account_hash(api_key)
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO report_rows (account, flow_id, action_id, updated, content_hash, row) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (account, item["flow_id"], item["action_id"], item.get("updated"), item.get("content_hash"), json.dumps(item["row"]))
+                    for item in items
+                ],
+            )
+            self.conn.execute("COMMIT")
+
+    def prune(self, api_key, flow_id, action_ids):
+        # Drops rows for actions that no longer exist in the flow.
+        account = account_hash(api_key)
+        with self.lock:
+            stored = self.conn.execute(
+                "SELECT action_id FROM report_rows WHERE account = ? AND flow_id = ?", (account, flow_id)
+            ).fetchall()
+            stale = [(account, flow_id, action_id) for (action_id,) in stored if action_id not in action_ids]
+            self.conn.executemany("DELETE FROM report_rows WHERE account = ? AND flow_id = ? AND action_id = ?", stale)
+
+    def clear(self, api_key=None):
+        with self.lock:
+            if api_key is None:
+                self.conn.execute("DELETE FROM report_rows")
+            else:
+                self.conn.execute("DELETE FROM report_rows WHERE account = ?", (account_hash(api_key),))
+
+_default_manifest = None
+_default_lock = threading.Lock()
+
+def get_default_manifest():
+    global _default_manifest
+    with _default_lock:
+        if _default_manifest is None:
+            _default_manifest = ReportManifest(os.environ.get("FLOW_EXTRACTOR_MANIFEST", DEFAULT_MANIFEST_PATH))
+        return _default_manifest
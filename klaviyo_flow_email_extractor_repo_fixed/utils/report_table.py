@@ -0,0 +1,103 @@
+import importlib.util
+import io
+
+import pandas as pd
+
+from bulk import IDENTITY_COLUMNS, ISSUE_COLUMNS, REPORT_COLUMNS
+
+# Typed report columns; names are the report row's keys. "Mobile Responsive"
+# is "Yes"/"No" in CSV and JSON reports and a boolean in columnar ones.
+TEXT_COLUMNS = IDENTITY_COLUMNS
+FLAG_COLUMNS = ("Mobile Responsive", "Viewport Meta", "Max Width", "Doctype", "HTML5 Elements", "Table Layout") + tuple(ISSUE_COLUMNS.values())
+COUNT_COLUMNS = tuple(column for column in REPORT_COLUMNS if column not in TEXT_COLUMNS + FLAG_COLUMNS)
+
+# Columnar report formats; both need pyarrow
+COLUMNAR_FORMATS = {
+    "parquet": ("template_analysis_report.parquet", "application/vnd.apache.parquet"),
+    "arrow": ("template_analysis_report.arrow", "application/vnd.apache.arrow.file"),
+}
+COLUMNAR_COMPRESSION = "zstd"
+
+def columnar_available():
+    try:
+        return importlib.util.find_spec("pyarrow") is not None
+    except ImportError:
+        return False
+
+def report_frame(rows):
+    # One typed column per metric, in report order, from report rows or a
+    # frame read back from a CSV or JSON report; missing values become nulls.
+    if isinstance(rows, pd.DataFrame):
+        frame = rows.reindex(columns=list(REPORT_COLUMNS))
+    else:
+        frame = pd.DataFrame.from_records(rows, columns=list(REPORT_COLUMNS))
+    # Rows stored before flow IDs were recorded fall back to the name
+    frame["Flow ID"] = frame["Flow ID"].fillna(frame["Flow"])
+    frame["Mobile Responsive"] = frame["Mobile Responsive"].map({"Yes": True, "No": False, True: True, False: False})
+    types = {column: "category" for column in TEXT_COLUMNS}
+    types.update({column: "Int64" for column in COUNT_COLUMNS})
+    types.update({column: "boolean" for column in FLAG_COLUMNS})
+    return frame.astype(types)
+
+def report_totals(frame):
+    return {
+        "templates": len(frame),
+        "responsive": int(frame["Mobile Responsive"].sum()),
+        "avg_elements": float(frame["Elements"].mean()) if len(frame) else 0.0,
+        "avg_images": float(frame["Images"].mean()) if len(frame) else 0.0,
+        "with_issues": int((frame["Issues"] > 0).sum()),
+    }
+
+def report_csv(frame):
+    # Same text as the CSV reports jobs and the CLI write
+    return frame.assign(**{"Mobile Responsive": frame["Mobile Responsive"].map({True: "Yes", False: "No"})}).to_csv(index=False)
+
+def flow_labels(frame):
+    # Flow name by flow ID; names shared by several flows carry the ID
+    names = frame.groupby("Flow ID", observed=True, sort=False)["Flow"].first().astype(str)
+    shared = names.duplicated(keep=False)
+    return names.where(~shared, names + " (" + names.index.astype(str) + ")")
+
+def flow_summary(frame):
+    summary = frame.groupby("Flow ID", observed=True, sort=False).agg(
+        Templates=("Email", "size"),
+        Responsive=("Mobile Responsive", "sum"),
+        Issues=("Issues", "sum"),
+        **{"Avg. Elements": ("Elements", "mean"), "Avg. Images": ("Images", "mean"), "Images Without Alt": ("Images Without Alt", "sum")},
+    )
+    summary.insert(0, "Flow", flow_labels(frame))
+    return summary.round(1).sort_values("Issues", ascending=False)
+
+def issue_summary(frame):
+    # Templates with each problematic element type, and their share
+    counts = frame[list(ISSUE_COLUMNS.values())].sum().astype("int64")
+    summary = counts.rename("Templates").to_frame()
+    summary.index.name = "Issue"
+    summary["Share (%)"] = (summary["Templates"] / len(frame) * 100).round(1) if len(frame) else 0.0
+    return summary.sort_values("Templates", ascending=False)
+
+def issues_by_flow(frame):
+    # Templates per flow with each problematic element type, for charting
+    counts = frame.groupby("Flow ID", observed=True, sort=False)[list(ISSUE_COLUMNS.values())].sum()
+    return counts.set_index(flow_labels(frame).reindex(counts.index).rename("Flow"))
+
+def write_columnar(frame, target, fmt="parquet"):
+    # target is a path or a binary file object
+    if not columnar_available():
+        raise ValueError(f"{fmt} reports need pyarrow (pip install pyarrow)")
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, target, compression=COLUMNAR_COMPRESSION)
+    elif fmt == "arrow":
+        import pyarrow.feather as feather
+        feather.write_feather(table, target, compression=COLUMNAR_COMPRESSION)
+    else:
+        raise ValueError(f"Unknown columnar format {fmt!r}; choose from {list(COLUMNAR_FORMATS)}")
+
+def columnar_bytes(frame, fmt="parquet"):
+    buffer = io.BytesIO()
+    write_columnar(frame, buffer, fmt)
+    return buffer.getvalue()
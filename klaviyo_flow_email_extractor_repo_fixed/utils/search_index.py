@@ -0,0 +1,264 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from api_cache import account_hash
+from bulk import DEFAULT_WORKERS, iter_templates
+from klaviyo_api import get_client, iter_flows
+
+DEFAULT_SEARCH_PATH = os.path.join(os.path.expanduser("~"), ".cache", "flow-extractor", "search.sqlite3")
+DEFAULT_LIMIT = 50
+STORE_BATCH = 100
+
+# The trigram tokenizer (SQLite 3.34+) matches any substring of 3+ characters,
+# which is what finding a link, coupon code or tracking parameter needs.
+TOKENIZER = "trigram" if sqlite3.sqlite_version_info >= (3, 34, 0) else "unicode61"
+MIN_TERM_LENGTH = 3 if TOKENIZER == "trigram" else 1
+
+SEARCH_FIELDS = {
+    "Flow name": "flow_name",
+    "Email name": "action_name",
+    "Subject": "subject",
+    "Preview text": "preview_text",
+    "HTML": "html",
+}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS flows (
+    account TEXT NOT NULL,
+    flow_id TEXT NOT NULL,
+    name TEXT,
+    status TEXT,
+    updated TEXT,
+    synced REAL NOT NULL,
+    PRIMARY KEY (account, flow_id)
+);
+CREATE TABLE IF NOT EXISTS emails (
+    id INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    flow_id TEXT NOT NULL,
+    action_id TEXT NOT NULL,
+    flow_name TEXT,
+    action_name TEXT,
+    subject TEXT,
+    preview_text TEXT,
+    html TEXT,
+    updated TEXT,
+    synced REAL NOT NULL,
+    UNIQUE (account, action_id)
+);
+CREATE INDEX IF NOT EXISTS emails_flow ON emails (account, flow_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+    flow_name, action_name, subject, preview_text, html,
+    content='emails', content_rowid='id', tokenize='{TOKENIZER}'
+);
+CREATE TRIGGER IF NOT EXISTS emails_insert AFTER INSERT ON emails BEGIN
+    INSERT INTO emails_fts (rowid, flow_name, action_name, subject, preview_text, html)
+    VALUES (new.id, new.flow_name, new.action_name, new.subject, new.preview_text, new.html);
+END;
+CREATE TRIGGER IF NOT EXISTS emails_delete AFTER DELETE ON emails BEGIN
+    INSERT INTO emails_fts (emails_fts, rowid, flow_name, action_name, subject, preview_text, html)
+    VALUES ('delete', old.id, old.flow_name, old.action_name, old.subject, old.preview_text, old.html);
+END;
+CREATE TRIGGER IF NOT EXISTS emails_update AFTER UPDATE ON emails BEGIN
+    INSERT INTO emails_fts (emails_fts, rowid, flow_name, action_name, subject, preview_text, html)
+    VALUES ('delete', old.id, old.flow_name, old.action_name, old.subject, old.preview_text, old.html);
+    INSERT INTO emails_fts (rowid, flow_name, action_name, subject, preview_text, html)
+    VALUES (new.id, new.flow_name, new.action_name, new.subject, new.preview_text, new.html);
+END;
+"""
+
+QUERY_TERMS = re.compile(r'"([^"]*)"|(\S+)')
+
+def match_query(query, fields=None):
+    # Turns free text into an FTS5 query: every word or "quoted phrase" must
+    # appear, matched literally (operators and punctuation carry no syntax).
+    terms = [phrase or word for phrase, word in QUERY_TERMS.findall(query)]
+    terms = [term for term in terms if len(term) >= MIN_TERM_LENGTH]
+    if not terms:
+        raise ValueError(f"Enter at least one search term of {MIN_TERM_LENGTH} or more characters")
+    expression = " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+    if fields:
+        expression = "{" + " ".join(fields) + "}: (" + expression + ")"
+    return expression
+
+class SearchIndex:
+    # Local mirror of every flow email (names, subject, preview text and
+    # rendered HTML) with an FTS5 index over them, one set per account.
+    def __init__(self, path=DEFAULT_SEARCH_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def lookup(self, api_key, action_id, updated):
+        # True when the stored copy of the action is current
+        if not updated:
+            return None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM emails WHERE account = ? AND action_id = ? AND updated = ?",
+                (account_hash(api_key), action_id, updated),
+            ).fetchone()
+        return True if row else None
+
+    def store_flows(self, api_key, flows):
+        # flows: (flow_id, name, status, updated). A renamed flow's emails are
+        # reindexed under the new name.
+        account = account_hash(api_key)
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT INTO flows (account, flow_id, name, status, updated, synced) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (account, flow_id) DO UPDATE SET name = excluded.name, status = excluded.status, updated = excluded.updated, synced = excluded.synced",
+                [(account, flow_id, name, status, updated, now) for flow_id, name, status, updated in flows],
+            )
+            self.conn.executemany(
+                "UPDATE emails SET flow_name = ? WHERE account = ? AND flow_id = ? AND flow_name IS NOT ?",
+                [(name, account, flow_id, name) for flow_id, name, _, _ in flows],
+            )
+            self.conn.execute("COMMIT")
+
+    def store_emails(self, api_key, items):
+        account = account_hash(api_key)
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT INTO emails (account, flow_id, action_id, flow_name, action_name, subject, preview_text, html, updated, synced) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (account, action_id) DO UPDATE SET flow_id = excluded.flow_id, flow_name = excluded.flow_name, "
+                "action_name = excluded.action_name, subject = excluded.subject, preview_text = excluded.preview_text, "
+                "html = excluded.html, updated = excluded.updated, synced = excluded.synced",
+                [
+                    (
+                        account, item["flow_id"], item["action_id"], item["flow_name"], item["action_name"],
+                        item.get("subject"), item.get("preview_text"), item["html"], item.get("updated"), now,
+                    )
+                    for item in items
+                ],
+            )
+            self.conn.execute("COMMIT")
+
+    def prune(self, api_key, flow_id, action_ids):
+        # Drops emails that no longer exist in the flow.
+        account = account_hash(api_key)
+        with self.lock:
+            stored = self.conn.execute("SELECT action_id FROM emails WHERE account = ? AND flow_id = ?", (account, flow_id)).fetchall()
+            stale = [(account, action_id) for (action_id,) in stored if action_id not in action_ids]
+            self.conn.executemany("DELETE FROM emails WHERE account = ? AND action_id = ?", stale)
+
+    def prune_flows(self, api_key, flow_ids):
+        # Drops flows (and their emails) that no longer exist in the account.
+        account = account_hash(api_key)
+        with self.lock:
+            stored = self.conn.execute("SELECT flow_id FROM flows WHERE account = ?", (account,)).fetchall()
+            stale = [(account, flow_id) for (flow_id,) in stored if flow_id not in flow_ids]
+            self.conn.executemany("DELETE FROM emails WHERE account = ? AND flow_id = ?", stale)
+            self.conn.executemany("DELETE FROM flows WHERE account = ? AND flow_id = ?", stale)
+
+    def search(self, api_key, query, fields=None, flow_id=None, limit=DEFAULT_LIMIT):
+        # Best matches first (bm25); the snippet comes from the best-matching column.
+        sql = (
+            "SELECT emails.flow_id, emails.flow_name, emails.action_id, emails.action_name, emails.subject, emails.preview_text, "
+            "snippet(emails_fts, -1, '[', ']', '...', 12), emails_fts.rank "
+            "FROM emails_fts JOIN emails ON emails.id = emails_fts.rowid "
+            "WHERE emails_fts MATCH ? AND emails.account = ?"
+        )
+        params = [match_query(query, fields), account_hash(api_key)]
+        if flow_id:
+            sql += " AND emails.flow_id = ?"
+            params.append(flow_id)
+        sql += " ORDER BY emails_fts.rank LIMIT ?"
+        params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        keys = ("flow_id", "flow_name", "action_id", "action_name", "subject", "preview_text", "snippet", "rank")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def get_email(self, api_key, action_id):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT flow_id, flow_name, action_id, action_name, subject, preview_text, html, updated, synced FROM emails WHERE account = ? AND action_id = ?",
+                (account_hash(api_key), action_id),
+            ).fetchone()
+        keys = ("flow_id", "flow_name", "action_id", "action_name", "subject", "preview_text", "html", "updated", "synced")
+        return dict(zip(keys, row)) if row else None
+
+    def flows(self, api_key):
+        with self.lock:
+            return self.conn.execute("SELECT flow_id, name FROM flows WHERE account = ? ORDER BY name", (account_hash(api_key),)).fetchall()
+
+    def stats(self, api_key):
+        account = account_hash(api_key)
+        with self.lock:
+            flows = self.conn.execute("SELECT COUNT(*) FROM flows WHERE account = ?", (account,)).fetchone()[0]
+            emails, synced = self.conn.execute("SELECT COUNT(*), MAX(synced) FROM emails WHERE account = ?", (account,)).fetchone()
+        return {"flows": flows, "emails": emails, "synced": synced}
+
+    def clear(self, api_key=None):
+        with self.lock:
+            if api_key is None:
+                self.conn.execute("DELETE FROM emails")
+                self.conn.execute("DELETE FROM flows")
+            else:
+                self.conn.execute("DELETE FROM emails WHERE account = ?", (account_hash(api_key),))
+                self.conn.execute("DELETE FROM flows WHERE account = ?", (account_hash(api_key),))
+
+def sync_search_index(api_key, index=None, flow_ids=None, workers=DEFAULT_WORKERS, full=False, progress=None):
+    # Mirrors the account's flows (or only flow_ids) into the index. Emails
+    # whose `updated` timestamp is unchanged are not fetched again unless
+    # full=True, which also bypasses the client's response cache so every
+    # render comes from the API; emails and flows deleted in Klaviyo are dropped.
+    client = get_client(api_key)
+    index = index or get_default_search_index()
+    flows = [
+        (flow["id"], (flow.get("attributes") or {}).get("name") or "Unnamed Flow", (flow.get("attributes") or {}).get("status"), (flow.get("attributes") or {}).get("updated"))
+        for flow in iter_flows(client)
+        if flow.get("type") == "flow" and flow.get("id") and (flow_ids is None or flow["id"] in flow_ids)
+    ]
+    index.store_flows(client.api_key, flows)
+    reuse = None if full else (lambda item: index.lookup(client.api_key, item["action_id"], item.get("updated")))
+    counts = {"succeeded": 0, "failed": 0, "skipped": 0, "reused": 0, "errors": []}
+    seen = {flow_id: set() for flow_id, _, _, _ in flows}
+    failed_flows = set()
+    batch = []
+    items = iter_templates(client, [(flow_id, name) for flow_id, name, _, _ in flows], workers, reuse=reuse, progress=progress, attributes=("subject", "preview_text"), use_cache=not full)
+    for item in items:
+        counts[item["status"]] += 1
+        if item["status"] == "failed":
+            counts["errors"].append({"flow_id": item["flow_id"], "action_id": item["action_id"], "error": item["error"]})
+        if item["action_id"] is None:
+            failed_flows.add(item["flow_id"])
+            continue
+        seen[item["flow_id"]].add(item["action_id"])
+        if item["status"] in ("succeeded", "skipped"):
+            batch.append(item)
+            if len(batch) >= STORE_BATCH:
+                index.store_emails(client.api_key, batch)
+                batch = []
+    if batch:
+        index.store_emails(client.api_key, batch)
+    for flow_id, action_ids in seen.items():
+        if flow_id not in failed_flows:
+            index.prune(client.api_key, flow_id, action_ids)
+    if flow_ids is None:
+        index.prune_flows(client.api_key, set(seen))
+    counts["flows"] = len(flows)
+    return counts
+
+_default_index = None
+_default_lock = threading.Lock()
+
+def get_default_search_index():
+    global _default_index
+    with _default_lock:
+        if _default_index is None:
+            _default_index = SearchIndex(os.environ.get("FLOW_EXTRACTOR_SEARCH", DEFAULT_SEARCH_PATH))
+        return _default_index